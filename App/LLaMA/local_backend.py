@@ -0,0 +1,469 @@
+"""Modelo de linguagem local na CPU, com a mesma interface de chat do cliente do OpenRouter
+
+O modelo (Hugging Face Transformers) é carregado uma vez por processo e
+quantizado para int8 nas camadas lineares. Um único thread de inferência
+atende a fila de pedidos: pedidos que chegam juntos são decodificados em lote
+e o estado de atenção (KV) dos prompts já processados fica em cache, então
+um prompt que começa com o mesmo contexto de dados de um anterior só processa
+os próprios tokens.
+
+torch e transformers só são importados quando o primeiro pedido chega.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_LOCAL_MODEL = os.getenv("LOCAL_LLM_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+# Quantização dinâmica int8 das camadas lineares (bitsandbytes exige GPU; esta roda na CPU)
+DEFAULT_QUANTIZE = os.getenv("LOCAL_LLM_QUANTIZE", "True").lower() in ("1", "true", "yes", "sim")
+DEFAULT_THREADS = int(os.getenv("LOCAL_LLM_THREADS", "0"))  # 0 = padrão do torch
+DEFAULT_MAX_BATCH = int(os.getenv("LOCAL_LLM_MAX_BATCH", "4"))
+DEFAULT_BATCH_WAIT = float(os.getenv("LOCAL_LLM_BATCH_WAIT", "0.05"))  # segundos esperando mais pedidos
+# Prompts com estado KV guardado e o mínimo de tokens em comum para reaproveitar um deles
+DEFAULT_PREFIX_ENTRIES = int(os.getenv("LOCAL_LLM_PREFIX_ENTRIES", "2"))
+DEFAULT_MIN_PREFIX = int(os.getenv("LOCAL_LLM_MIN_PREFIX", "32"))
+DEFAULT_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "300"))
+# Janela de contexto em tokens (prompt + resposta); 0 = max_position_embeddings da configuração do modelo
+DEFAULT_CONTEXT = int(os.getenv("LOCAL_LLM_CONTEXT", "0"))
+
+
+class LocalModelError(Exception):
+    """Falha ao carregar o modelo local ou ao gerar a resposta"""
+
+
+def _common_prefix(a: np.ndarray, b: np.ndarray) -> int:
+    size = min(len(a), len(b))
+    different = np.flatnonzero(a[:size] != b[:size])
+    return int(different[0]) if len(different) else size
+
+
+def fit_context(ids: np.ndarray, max_tokens: int, window: Optional[int]) -> Tuple[np.ndarray, int]:
+    """Corta o prompt e o limite de tokens novos para caberem na janela de contexto do modelo.
+
+    A resposta fica com ao menos um quarto da janela (ou `max_tokens`, se
+    menor); um prompt maior que o resto perde o meio, preservando o início
+    (instruções e contexto de dados) e o fim (a pergunta e o marcador do
+    assistente).
+    """
+    if not window or window <= 1:
+        return ids, max_tokens
+    reserve = max(1, min(max_tokens, window // 4))
+    budget = window - reserve
+    if len(ids) > budget:
+        head = budget // 2
+        ids = np.concatenate([ids[:head], ids[len(ids) - (budget - head):]])
+    return ids, min(max_tokens, window - len(ids))
+
+
+def _legacy(past) -> Tuple:
+    """Estado KV como tupla (chave, valor) por camada, qualquer que seja a versão do transformers"""
+    return past.to_legacy_cache() if hasattr(past, 'to_legacy_cache') else tuple(past)
+
+
+@dataclass
+class PrefixStats:
+    hits: int = 0
+    misses: int = 0
+    reused_tokens: int = 0
+    computed_tokens: int = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        total = self.reused_tokens + self.computed_tokens
+        return self.reused_tokens / total if total else 0.0
+
+
+class PrefixCache:
+    """Estado KV dos últimos prompts, reaproveitado pelo maior prefixo de tokens em comum.
+
+    Cada entrada guarda os tokens de um prompt e o KV de todas as posições;
+    um prompt novo usa o KV da entrada com o maior prefixo em comum (cortado
+    nesse ponto) e só processa o restante. `max_length` (a janela de
+    contexto do modelo) limita o tamanho de cada entrada. Usado apenas pelo
+    thread de inferência, então não tem trava.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_PREFIX_ENTRIES,
+        min_prefix: int = DEFAULT_MIN_PREFIX,
+        max_length: Optional[int] = None,
+    ):
+        self.max_entries = max_entries
+        self.min_prefix = min_prefix
+        self.max_length = max_length
+        self._entries: "OrderedDict[bytes, Tuple[np.ndarray, Tuple]]" = OrderedDict()
+        self.stats = PrefixStats()
+
+    def lookup(self, ids: np.ndarray) -> Tuple[int, Optional[Tuple]]:
+        """Tokens reaproveitáveis e o KV cortado nesse tamanho (sempre sobra ao menos um token a processar)"""
+        best, best_key = 0, None
+        for key, (cached_ids, _) in self._entries.items():
+            common = _common_prefix(cached_ids, ids)
+            if common > best:
+                best, best_key = common, key
+        best = min(best, len(ids) - 1)
+        if best_key is None or best < self.min_prefix:
+            self.stats.misses += 1
+            self.stats.computed_tokens += len(ids)
+            return 0, None
+        self._entries.move_to_end(best_key)
+        past = self._entries[best_key][1]
+        self.stats.hits += 1
+        self.stats.reused_tokens += best
+        self.stats.computed_tokens += len(ids) - best
+        return best, tuple((k[:, :, :best], v[:, :, :best]) for k, v in past)
+
+    def store(self, ids: np.ndarray, past: Tuple) -> None:
+        if self.max_entries <= 0:
+            return
+        if self.max_length and len(ids) > self.max_length:
+            ids = ids[:self.max_length]
+            past = tuple((k[:, :, :self.max_length], v[:, :, :self.max_length]) for k, v in past)
+        key = ids.tobytes()
+        self._entries[key] = (ids, past)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@dataclass
+class _Request:
+    """Pedido na fila do thread de inferência; o texto gerado sai por `chunks`"""
+    ids: np.ndarray
+    max_tokens: int
+    cancel_event: Optional[threading.Event] = None
+    chunks: "queue.Queue" = field(default_factory=queue.Queue)
+    generated: List[int] = field(default_factory=list)
+    text: str = ''
+    cached_tokens: int = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+
+_DONE = object()
+
+
+class LocalModelClient:
+    """Cliente de chat para um modelo local, com a interface do `OpenRouterClient`.
+
+    `chat` e `stream_chat` recebem o mesmo payload (mensagens, `max_tokens`)
+    e devolvem respostas e eventos no formato da API de chat completions, de
+    modo que o agente usa o modelo local sem outro caminho de código. A
+    decodificação é gulosa (determinística), adequada às respostas com
+    temperatura baixa que o agente pede. Com a quantização int8 dinâmica, a
+    escala das ativações depende do bloco processado, então reaproveitar um
+    prefixo ou decodificar em lote pode mudar o desempate entre tokens quase
+    empatados; sem quantização, a saída é a mesma da geração sem cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_LOCAL_MODEL,
+        quantize: bool = DEFAULT_QUANTIZE,
+        threads: int = DEFAULT_THREADS,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        batch_wait: float = DEFAULT_BATCH_WAIT,
+        prefix_cache: Optional[PrefixCache] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_workers: int = DEFAULT_MAX_BATCH,
+        context_window: int = DEFAULT_CONTEXT,
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.threads = threads
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.prefix_cache = prefix_cache or PrefixCache()
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.context_window: Optional[int] = context_window or None
+        self.trimmed_prompts = 0
+        self.batches = 0
+        self.load_seconds: Optional[float] = None
+
+        self._model = None
+        self._tokenizer = None
+        self._torch = None
+        self._cache_class = None
+        self._loaded = threading.Event()
+        self._load_error: Optional[LocalModelError] = None
+        self._requests: "queue.Queue[_Request]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # Carga do modelo
+
+    def _load(self) -> None:
+        try:
+            import torch
+            import transformers
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise LocalModelError(f"modelo local requer torch e transformers ({e})") from None
+
+        start = time.perf_counter()
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._torch, self._tokenizer, self._model = torch, tokenizer, model
+        # Posições além de max_position_embeddings não existem no modelo: prompt, resposta e KV ficam dentro dela
+        model_window = getattr(model.config, 'max_position_embeddings', None)
+        if model_window:
+            self.context_window = min(self.context_window or model_window, model_window)
+        if self.context_window:
+            self.prefix_cache.max_length = self.context_window
+        # Versões novas do transformers não aceitam mais o KV como tupla
+        self._cache_class = getattr(transformers, 'DynamicCache', None)
+        self.load_seconds = time.perf_counter() - start
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="modelo-local", daemon=True)
+                self._worker.start()
+
+    def _prompt_ids(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        tokenizer = self._tokenizer
+        if getattr(tokenizer, 'chat_template', None) or getattr(tokenizer, 'default_chat_template', None):
+            ids = tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+        else:
+            text = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages) + "\n\nassistant:"
+            ids = tokenizer(text)['input_ids']
+        return np.asarray(ids, dtype=np.int64)
+
+    # Thread de inferência
+
+    def _run(self) -> None:
+        try:
+            self._load()
+        except Exception as e:
+            self._load_error = e if isinstance(e, LocalModelError) else LocalModelError(str(e))
+            return
+        finally:
+            self._loaded.set()
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._requests.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                with self._torch.inference_mode():
+                    self._generate(batch)
+            except Exception as e:
+                for request in batch:
+                    request.chunks.put(LocalModelError(str(e)))
+            self.batches += 1
+
+    def _as_cache(self, past):
+        if past is None or self._cache_class is None:
+            return past
+        return self._cache_class.from_legacy_cache(past)
+
+    def _prefill(self, request: _Request):
+        """Processa o prompt (só o que não está no cache de prefixos) e devolve os logits do último token e o KV"""
+        torch = self._torch
+        reused, past = self.prefix_cache.lookup(request.ids)
+        request.cached_tokens = reused
+        output = self._model(
+            input_ids=torch.from_numpy(request.ids[reused:]).unsqueeze(0),
+            past_key_values=self._as_cache(past),
+            use_cache=True,
+        )
+        past = _legacy(output.past_key_values)
+        self.prefix_cache.store(request.ids, past)
+        return output.logits[0, -1], past
+
+    def _emit(self, request: _Request, token: int) -> bool:
+        """Acrescenta o token e envia o trecho novo de texto; retorna se o pedido terminou"""
+        if token == self._tokenizer.eos_token_id:
+            return True
+        request.generated.append(token)
+        text = self._tokenizer.decode(request.generated, skip_special_tokens=True)
+        # Um caractere incompleto (bytes de UTF-8 ainda pela metade) espera o próximo token
+        if not text.endswith('�') and len(text) > len(request.text):
+            request.chunks.put(text[len(request.text):])
+            request.text = text
+        return len(request.generated) >= request.max_tokens
+
+    def _generate(self, batch: List[_Request]) -> None:
+        """Decodificação gulosa em lote: prompts processados um a um, tokens novos de todos juntos"""
+        torch = self._torch
+        active, logits, pasts = [], [], []
+        for request in batch:
+            if request.cancelled:
+                request.chunks.put(_DONE)
+                continue
+            last, past = self._prefill(request)
+            if self._emit(request, int(last.argmax())) or request.cancelled:
+                request.chunks.put(_DONE)
+                continue
+            active.append(request)
+            pasts.append(past)
+        if not active:
+            return
+
+        # KV de todos os pedidos alinhado à direita; posições de preenchimento ficam fora da máscara
+        lengths = torch.tensor([past[0][0].shape[2] for past in pasts])
+        width = int(lengths.max())
+        past = tuple(
+            tuple(
+                torch.cat([torch.nn.functional.pad(layer[part], (0, 0, width - layer[part].shape[2], 0)) for layer in layers])
+                for part in (0, 1)
+            )
+            for layers in zip(*pasts)
+        )
+        mask = (torch.arange(width).unsqueeze(0) >= (width - lengths).unsqueeze(1)).long()
+        tokens = torch.tensor([request.generated[-1] for request in active]).unsqueeze(1)
+
+        while active:
+            mask = torch.cat([mask, torch.ones(len(active), 1, dtype=mask.dtype)], dim=1)
+            output = self._model(
+                input_ids=tokens,
+                attention_mask=mask,
+                position_ids=lengths.unsqueeze(1),
+                past_key_values=self._as_cache(past),
+                use_cache=True,
+            )
+            past = _legacy(output.past_key_values)
+            lengths = lengths + 1
+            next_tokens = output.logits[:, -1].argmax(dim=-1)
+
+            keep = []
+            for row, request in enumerate(active):
+                if self._emit(request, int(next_tokens[row])) or request.cancelled:
+                    request.chunks.put(_DONE)
+                else:
+                    keep.append(row)
+            if len(keep) < len(active):
+                rows = torch.tensor(keep, dtype=torch.long)
+                active = [active[row] for row in keep]
+                past = tuple((k.index_select(0, rows), v.index_select(0, rows)) for k, v in past)
+                mask, lengths, next_tokens = mask[rows], lengths[rows], next_tokens[rows]
+            tokens = next_tokens.unsqueeze(1)
+
+    # Interface de chat (a mesma do OpenRouterClient)
+
+    def _submit(self, payload: Dict[str, Any], cancel_event: Optional[threading.Event]) -> _Request:
+        self._ensure_worker()
+        # O tokenizador é carregado pelo thread de inferência: espera a carga antes de montar o prompt
+        if not self._loaded.wait(self.timeout):
+            raise LocalModelError(f"modelo local não carregou em {self.timeout:.0f}s")
+        if self._load_error is not None:
+            raise self._load_error
+        prompt = self._prompt_ids(payload['messages'])
+        ids, max_tokens = fit_context(prompt, int(payload.get('max_tokens') or 512), self.context_window)
+        if len(ids) < len(prompt):
+            self.trimmed_prompts += 1
+        request = _Request(ids, max_tokens, cancel_event)
+        self._requests.put(request)
+        return request
+
+    def _chunks(self, request: _Request, timeout: Optional[float]) -> Iterator[str]:
+        while True:
+            try:
+                item = request.chunks.get(timeout=timeout or self.timeout)
+            except queue.Empty:
+                raise LocalModelError(f"modelo local sem resposta em {timeout or self.timeout:.0f}s") from None
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    @staticmethod
+    def _usage(request: _Request) -> Dict[str, int]:
+        return {
+            'prompt_tokens': len(request.ids),
+            'completion_tokens': len(request.generated),
+            'total_tokens': len(request.ids) + len(request.generated),
+            'cached_tokens': request.cached_tokens,
+        }
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Gera a resposta completa; retorna no formato da API de chat completions"""
+        request = self._submit(payload, None)
+        text = ''.join(self._chunks(request, None))
+        return {
+            'model': self.model_name,
+            'choices': [{'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': self._usage(request),
+        }
+
+    def stream_chat(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        chunk_timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Produz eventos com os trechos gerados (como o SSE do OpenRouter) e, no fim, o uso de tokens"""
+        # A primeira resposta inclui o processamento do prompt: o timeout por trecho não pode ser menor que o do cliente
+        request = self._submit(payload, cancel_event)
+        for text in self._chunks(request, max(chunk_timeout or 0, self.timeout)):
+            yield {'choices': [{'delta': {'content': text}}]}
+        yield {'choices': [{'delta': {}, 'finish_reason': 'stop'}], 'usage': self._usage(request)}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="modelo-local")
+            return self._executor
+
+    def submit(self, payload: Dict[str, Any]) -> "Future[Dict[str, Any]]":
+        return self.executor.submit(self.chat, payload)
+
+    async def achat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.chat, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        prefix = self.prefix_cache.stats
+        return {
+            'modelo': self.model_name,
+            'carregado': self._model is not None,
+            'carga_s': self.load_seconds,
+            'janela_contexto': self.context_window,
+            'prompts_cortados': self.trimmed_prompts,
+            'lotes': self.batches,
+            'prefixo_acertos': prefix.hits,
+            'prefixo_falhas': prefix.misses,
+            'tokens_reaproveitados': prefix.reused_tokens,
+            'tokens_processados': prefix.computed_tokens,
+        }
+
+    def close(self) -> None:
+        # O modelo é compartilhado pelo processo: só o pool de threads é encerrado
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_shared_clients: Dict[str, LocalModelClient] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_local_client(model_name: str = DEFAULT_LOCAL_MODEL) -> LocalModelClient:
+    """Um cliente (e uma cópia dos pesos) por modelo no processo, compartilhado por todas as sessões"""
+    with _shared_lock:
+        if model_name not in _shared_clients:
+            _shared_clients[model_name] = LocalModelClient(model_name)
+        return _shared_clients[model_name]
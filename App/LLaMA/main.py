@@ -0,0 +1,59 @@
+"""Linha de comando do modelo local: responde perguntas sobre um mesmo contexto de dados
+
+Uso:
+    python main.py --contexto resumo.txt "Qual fornecedor faturou mais?" "Quantas notas estão pendentes?"
+
+As perguntas são enviadas juntas (e decodificadas em lote); o contexto vem
+antes da pergunta no prompt, então a partir da segunda pergunta o estado KV
+do contexto é reaproveitado. No app do OpenRouter, o mesmo modelo aparece no
+seletor como "local/<modelo>".
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_backend import DEFAULT_LOCAL_MODEL, LocalModelClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde perguntas com um modelo local na CPU")
+    parser.add_argument("perguntas", nargs='+')
+    parser.add_argument("--contexto", help="arquivo de texto com o contexto dos dados (estrutura, estatísticas, amostra)")
+    parser.add_argument("--model", default=DEFAULT_LOCAL_MODEL)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--sem-quantizacao", action='store_true', help="mantém os pesos em float32")
+    args = parser.parse_args()
+
+    context = ''
+    if args.contexto:
+        with open(args.contexto, encoding='utf-8') as f:
+            context = f.read()
+    client = LocalModelClient(args.model, quantize=not args.sem_quantizacao, max_workers=len(args.perguntas))
+
+    def ask(question: str):
+        start = time.perf_counter()
+        content = f"{context}\n\nPERGUNTA DO USUÁRIO: {question}" if context else question
+        result = client.chat({"messages": [{"role": "user", "content": content}], "max_tokens": args.max_tokens})
+        return question, result, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(args.perguntas)) as pool:
+        for question, result, seconds in pool.map(ask, args.perguntas):
+            usage = result['usage']
+            print(f"\n❓ {question}\n{result['choices'][0]['message']['content']}")
+            print(
+                f"   {seconds:.1f}s · {usage['prompt_tokens']} tokens no prompt "
+                f"({usage['cached_tokens']} reaproveitados) · {usage['completion_tokens']} gerados"
+            )
+
+    stats = client.stats()
+    print(
+        f"\nCarga do modelo: {stats['carga_s']:.1f}s · lotes: {stats['lotes']} · "
+        f"prefixo: {stats['prefixo_acertos']} acertos / {stats['prefixo_falhas']} falhas, "
+        f"{stats['tokens_reaproveitados']} tokens reaproveitados de "
+        f"{stats['tokens_reaproveitados'] + stats['tokens_processados']}"
+    )
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
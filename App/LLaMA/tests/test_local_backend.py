@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from local_backend import LocalModelClient, PrefixCache, fit_context
+
+
+def _past(ids, layers=2):
+    # KV no formato (lote, cabeças, posições, dimensão), com a posição gravada nos valores
+    kv = np.broadcast_to(np.arange(len(ids), dtype=np.float32)[None, None, :, None], (1, 2, len(ids), 4))
+    return tuple((kv, kv) for _ in range(layers))
+
+
+def test_fit_context_without_window_keeps_everything():
+    ids = np.arange(100)
+    fitted, max_tokens = fit_context(ids, 512, None)
+    assert fitted is ids and max_tokens == 512
+
+
+def test_fit_context_caps_new_tokens_to_remaining_window():
+    fitted, max_tokens = fit_context(np.arange(40), 512, 64)
+    assert len(fitted) == 40
+    assert max_tokens == 24
+
+
+def test_fit_context_trims_middle_of_long_prompt():
+    ids = np.arange(200)
+    fitted, max_tokens = fit_context(ids, 512, 64)
+    # Um quarto da janela fica para a resposta; o prompt mantém início e fim
+    assert len(fitted) == 48 and max_tokens == 16
+    assert list(fitted[:24]) == list(range(24))
+    assert list(fitted[24:]) == list(range(176, 200))
+
+
+def test_fit_context_small_max_tokens_leaves_room_for_prompt():
+    fitted, max_tokens = fit_context(np.arange(200), 4, 64)
+    assert len(fitted) == 60 and max_tokens == 4
+
+
+def test_prefix_cache_reuses_longest_common_prefix():
+    cache = PrefixCache(max_entries=2, min_prefix=4)
+    cache.store(np.arange(10), _past(np.arange(10)))
+    reused, past = cache.lookup(np.concatenate([np.arange(8), [99, 98]]))
+    assert reused == 8
+    assert past[0][0].shape[2] == 8
+    assert cache.stats.hits == 1 and cache.stats.reused_tokens == 8 and cache.stats.computed_tokens == 2
+
+
+def test_prefix_cache_always_leaves_a_token_to_process():
+    cache = PrefixCache(max_entries=2, min_prefix=4)
+    cache.store(np.arange(10), _past(np.arange(10)))
+    reused, past = cache.lookup(np.arange(10))
+    assert reused == 9 and past[0][1].shape[2] == 9
+
+
+def test_prefix_cache_ignores_short_prefixes():
+    cache = PrefixCache(max_entries=2, min_prefix=4)
+    cache.store(np.arange(10), _past(np.arange(10)))
+    assert cache.lookup(np.array([0, 1, 2, 50, 51])) == (0, None)
+    assert cache.stats.misses == 1 and cache.stats.computed_tokens == 5
+
+
+def test_prefix_cache_evicts_least_recently_used():
+    cache = PrefixCache(max_entries=2, min_prefix=2)
+    first, second, third = np.arange(10), np.arange(10) + 100, np.arange(10) + 200
+    cache.store(first, _past(first))
+    cache.store(second, _past(second))
+    assert cache.lookup(first)[0] == 9  # o primeiro passa a ser o mais recente
+    cache.store(third, _past(third))
+    assert cache.lookup(second) == (0, None)
+    assert cache.lookup(first)[0] == 9 and cache.lookup(third)[0] == 9
+
+
+def test_prefix_cache_clips_entries_to_max_length():
+    cache = PrefixCache(max_entries=2, min_prefix=2, max_length=6)
+    ids = np.arange(10)
+    cache.store(ids, _past(ids))
+    (cached_ids, past), = cache._entries.values()
+    assert len(cached_ids) == 6
+    assert all(k.shape[2] == 6 and v.shape[2] == 6 for k, v in past)
+    reused, past = cache.lookup(np.arange(12))
+    assert reused == 6 and past[0][0].shape[2] == 6
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """Checkpoint Llama aleatório minúsculo, com janela de 64 posições"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    corpus = ["qual fornecedor faturou mais no mês", "valor total das notas fiscais por estado"] * 20
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=300, special_tokens=["<unk>", "<s>", "</s>"], initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    ))
+    fast = transformers.PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>")
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=len(fast), hidden_size=32, intermediate_size=64, num_hidden_layers=1,
+        num_attention_heads=2, num_key_value_heads=1, max_position_embeddings=64, bos_token_id=1, eos_token_id=2,
+    )
+    path = tmp_path_factory.mktemp("modelo")
+    transformers.LlamaForCausalLM(config).save_pretrained(path)
+    fast.save_pretrained(path)
+    return str(path)
+
+
+def test_client_caps_prompt_and_generation_at_model_window(tiny_model):
+    client = LocalModelClient(tiny_model, quantize=False, batch_wait=0.0)
+    prompt = " ".join(["valor total das notas fiscais por estado"] * 30)
+    response = client.chat({'messages': [{'role': 'user', 'content': prompt}], 'max_tokens': 200})
+    usage = response['usage']
+    assert client.context_window == 64
+    assert usage['prompt_tokens'] <= 48
+    assert usage['total_tokens'] <= 64
+    assert client.stats()['prompts_cortados'] == 1
+    assert all(len(ids) <= 64 for ids, _ in client.prefix_cache._entries.values())
+
+
+def test_client_context_override_cannot_exceed_model_window(tiny_model):
+    assert LocalModelClient(tiny_model, quantize=False, context_window=32).chat(
+        {'messages': [{'role': 'user', 'content': "valor total " * 40}], 'max_tokens': 100}
+    )['usage']['total_tokens'] <= 32
+    client = LocalModelClient(tiny_model, quantize=False, context_window=1000)
+    client.chat({'messages': [{'role': 'user', 'content': "valor"}], 'max_tokens': 2})
+    assert client.context_window == 64
@@ -0,0 +1,225 @@
+"""Execução em lote (sem a interface do Streamlit) e benchmark de conjuntos de perguntas
+
+Uso:
+    python bench.py perguntas.jsonl --sample --mock --workers 8 --output resultados.jsonl
+    python bench.py perguntas.jsonl --csv cabecalho.csv itens.csv --model openai/gpt-4o-mini
+    python bench.py perguntas.jsonl --sample --mock --hedge --mock-slow-every 10 --mock-slow-delay 2
+
+Cada linha do arquivo de perguntas é um objeto JSON com `question` (ou
+`pergunta`/`title`) e, opcionalmente, `id` (ou `request_id`). Cada linha do
+arquivo de saída traz a resposta, o status, o tempo de cada etapa e o uso de
+tokens; o resumo (vazão e percentis de latência) é impresso no final.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from main import OpenRouterAgent, QueryResult
+from mock_openrouter import parse_model_delays, start_mock_server
+from openrouter_client import DEFAULT_BASE_URL, OpenRouterClient
+from response_cache import ResponseCache
+from synthetic_data import SyntheticSpec
+
+
+class LocalUpload(io.BufferedReader):
+    """Arquivo local com a mesma interface usada do UploadedFile do Streamlit (`name` e `size`)"""
+
+    def __init__(self, path: str):
+        super().__init__(io.FileIO(path, 'rb'))
+        self.size = os.path.getsize(path)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.raw.name)
+
+
+def read_questions(path: str) -> List[Dict[str, str]]:
+    """Lê as perguntas de um arquivo JSONL, ignorando linhas vazias"""
+    questions = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            text = entry.get('question') or entry.get('pergunta') or entry.get('title')
+            if not text:
+                raise ValueError(f"{path}:{number}: linha sem pergunta")
+            # id 0 é um id válido: só cai para o número da linha quando nenhum campo de id foi informado
+            ident = next((entry[field] for field in ('id', 'request_id') if entry.get(field) is not None), number)
+            questions.append({'id': str(ident), 'question': text})
+    return questions
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def result_record(entry: Dict[str, str], query: QueryResult, elapsed: float) -> Dict[str, Any]:
+    """Linha do arquivo de resultados para uma pergunta"""
+    record = {
+        'id': entry['id'],
+        'question': entry['question'],
+        'status': 'ok' if query.ok else 'erro',
+        'latency': elapsed,
+        'stages': query.stages,
+        'prompt_tokens': query.prompt_tokens,
+        'usage': query.usage,
+        'from_cache': query.from_cache,
+        'answer': query.answer,
+    }
+    if query.route is not None:
+        record['route'] = query.route.attrs()
+    if query.plan is not None:
+        record['plan'] = query.plan
+    if query.plan_error:
+        record['plan_error'] = query.plan_error
+    return record
+
+
+def run_batch(
+    agent: OpenRouterAgent,
+    questions: List[Dict[str, str]],
+    workers: int = 4,
+    local_execution: bool = False,
+) -> Dict[str, Any]:
+    """Responde as perguntas com um pool de threads; retorna os registros e o resumo"""
+    def answer(entry: Dict[str, str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        query = agent.answer_question(entry['question'], local_execution)
+        return result_record(entry, query, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        records = list(pool.map(answer, questions))
+    wall = time.perf_counter() - start
+
+    latencies = [record['latency'] for record in records if record['status'] == 'ok']
+    stages: Dict[str, Dict[str, float]] = {}
+    for name in sorted({name for record in records for name in record['stages']}):
+        stages[name] = percentiles([record['stages'][name] for record in records if name in record['stages']])
+    summary = {
+        'perguntas': len(records),
+        'erros': sum(record['status'] != 'ok' for record in records),
+        'workers': workers,
+        'tempo_total': wall,
+        'vazao': len(records) / wall if wall else 0.0,
+        'latencia': percentiles(latencies),
+        'etapas': stages,
+        'tokens': sum(record['usage'].get('total_tokens', 0) for record in records),
+        'prompt_tokens_contados': sum(record['prompt_tokens'] for record in records),
+    }
+    return {'records': records, 'summary': summary}
+
+
+def build_agent(args: argparse.Namespace, base_url: str) -> OpenRouterAgent:
+    """Agente com cliente próprio (sem limite de taxa por padrão) e cache de respostas opcional"""
+    api_key = args.api_key or os.getenv('OPENROUTER_API_KEY', 'chave-local')
+    agent = OpenRouterAgent(api_key, args.model, base_url=base_url)
+    # O cliente criado pelo agente é substituído: fecha a sessão e o pool de threads dele antes
+    agent.client.close()
+    agent.client = OpenRouterClient(
+        api_key,
+        base_url=base_url,
+        rate_limit=args.rate_limit,
+        burst=args.workers,
+        pool_size=max(10, args.workers),
+        max_workers=args.workers,
+        extra_headers={"X-Title": "Analisador de Notas Fiscais (benchmark)"},
+    )
+    if not args.cache:
+        # Sem cache, cada pergunta vai ao modelo e os números são reproduzíveis
+        agent.response_cache = ResponseCache(enabled=False)
+    agent.routing = args.routing
+    agent.hedging = args.hedge
+    return agent
+
+
+def load_data(agent: OpenRouterAgent, args: argparse.Namespace) -> bool:
+    if args.csv:
+        uploads = [LocalUpload(path) for path in args.csv]
+        try:
+            return agent.load_csv_files(uploads)
+        finally:
+            for upload in uploads:
+                upload.close()
+    return agent.create_sample_data(SyntheticSpec(num_nfs=args.sample_nfs))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Executa um conjunto de perguntas no agente e mede a latência")
+    parser.add_argument("questions", help="arquivo JSONL com as perguntas")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", nargs="+", help="arquivos CSV (cabeçalho e itens)")
+    source.add_argument("--sample", action="store_true", help="usa os dados de exemplo")
+    parser.add_argument("--sample-nfs", type=int, default=100, help="quantidade de NFs dos dados de exemplo")
+    parser.add_argument("--model", default="anthropic/claude-3.5-sonnet")
+    parser.add_argument("--api-key", help="chave do OpenRouter (padrão: $OPENROUTER_API_KEY)")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="quantas vezes repetir o conjunto de perguntas")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requisições por segundo (padrão: sem limite)")
+    parser.add_argument("--local", action="store_true", help="execução local de planos de consulta")
+    parser.add_argument("--cache", action="store_true", help="mantém o cache de respostas ligado")
+    parser.add_argument("--mock", action="store_true", help="sobe o servidor simulado do OpenRouter")
+    parser.add_argument("--mock-delay", type=float, default=0.05, help="atraso por resposta do servidor simulado")
+    parser.add_argument("--mock-model-delay", action="append", default=[], metavar="MODELO=SEGUNDOS",
+                        help="atraso extra do servidor simulado para um modelo (pode repetir)")
+    parser.add_argument("--mock-slow-every", type=int, default=0, help="no servidor simulado, uma a cada N requisições é lenta")
+    parser.add_argument("--mock-slow-delay", type=float, default=0.0, help="atraso extra das requisições lentas")
+    parser.add_argument("--routing", action="store_true", help="perguntas simples vão para um modelo rápido")
+    parser.add_argument("--hedge", action="store_true", help="duplica requisições que passam do p95 do modelo")
+    parser.add_argument("--output", help="arquivo JSONL de resultados (padrão: saída padrão)")
+    args = parser.parse_args(argv)
+
+    base_url = args.base_url
+    server = None
+    if args.mock:
+        server, base_url = start_mock_server(
+            delay=args.mock_delay,
+            model_delays=parse_model_delays(args.mock_model_delay),
+            slow_every=args.mock_slow_every,
+            slow_delay=args.mock_slow_delay,
+        )
+
+    agent = None
+    try:
+        agent = build_agent(args, base_url)
+        if not load_data(agent, args):
+            print("Não foi possível carregar os dados.", file=sys.stderr)
+            return 1
+
+        questions = read_questions(args.questions) * max(1, args.repeat)
+        batch = run_batch(agent, questions, args.workers, args.local)
+        if args.routing or args.hedge:
+            batch['summary']['roteamento'] = agent.router.stats()
+    finally:
+        if agent is not None:
+            agent.client.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for record in batch['records']:
+            output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    print(json.dumps(batch['summary'], ensure_ascii=False, indent=2), file=sys.stderr)
+    return 0 if batch['summary']['erros'] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
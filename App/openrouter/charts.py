@@ -0,0 +1,181 @@
+"""Pré-agregações vetorizadas para os gráficos, com tamanho limitado independente do número de linhas"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ingest import parse_dates, sniff_date_format
+
+# Pontos por série temporal enviados ao navegador (reduzidos com LTTB acima disso)
+DEFAULT_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+# Barras por gráfico de ranking/distribuição; o restante é somado em "Outros"
+DEFAULT_TOP_N = int(os.getenv("CHART_TOP_N", "10"))
+OTHERS_LABEL = 'Outros'
+
+DATE_COLUMN = 'data_emissao'
+VALUE_COLUMNS = ('valor_total', 'valor_total_item')
+SUPPLIER_COLUMN = 'fornecedor'
+DISTRIBUTION_COLUMNS = ('status', 'categoria')
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Índices dos pontos mantidos pelo Largest-Triangle-Three-Buckets.
+
+    Mantém o primeiro e o último ponto e, em cada um dos `threshold - 2`
+    baldes intermediários, o ponto que forma o maior triângulo com o ponto
+    escolhido no balde anterior e a média do balde seguinte. Picos e vales
+    sobrevivem à redução, ao contrário de uma média ou amostragem fixa.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # threshold - 2 baldes em [1, n - 1); o último ponto faz o papel do balde seguinte ao final
+    edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    chosen = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+        next_x, next_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[chosen] - next_x) * (y[start:stop] - y[chosen])
+            - (x[chosen] - x[start:stop]) * (next_y - y[chosen])
+        )
+        chosen = start + int(np.argmax(area))
+        selected[bucket + 1] = chosen
+    return selected
+
+
+@dataclass
+class ChartData:
+    """Séries e rankings prontos para desenhar (cada tabela com no máximo `max_points`/`top_n` linhas)"""
+    daily: Optional[pd.DataFrame] = None    # data, faturamento (reduzida com LTTB)
+    monthly: Optional[pd.DataFrame] = None  # mes, faturamento, notas
+    suppliers: Optional[pd.DataFrame] = None  # fornecedor, faturamento, notas
+    distributions: Dict[str, pd.DataFrame] = field(default_factory=dict)  # coluna -> valor, notas[, faturamento]
+    daily_points: int = 0  # dias com faturamento antes da redução
+    rows: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return self.daily is None and self.suppliers is None and not self.distributions
+
+
+def _find(frames: List[pd.DataFrame], *columns: str) -> Optional[pd.DataFrame]:
+    """Primeira tabela que tem todas as colunas"""
+    for df in frames:
+        if df is not None and all(col in df.columns for col in columns):
+            return df
+    return None
+
+
+def _value_column(df: pd.DataFrame) -> Optional[str]:
+    for col in VALUE_COLUMNS:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            return col
+    return None
+
+
+def _dates(series: pd.Series) -> pd.Series:
+    """Datas em texto convertidas como na carga dos CSVs (formato detectado, dia antes do mês)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.astype(object)
+    date_format = sniff_date_format(values)
+    if date_format:
+        return parse_dates(values, date_format)
+    return pd.to_datetime(values, errors='coerce', dayfirst=True)
+
+
+def _revenue_by(periods: np.ndarray, amounts: np.ndarray, counts: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Faturamento e notas por período, em ordem cronológica (`counts` quando cada linha já soma várias notas)"""
+    keys, inverse = np.unique(periods, return_inverse=True)
+    return pd.DataFrame({
+        'periodo': keys.astype('datetime64[ns]'),
+        'faturamento': np.bincount(inverse, weights=amounts, minlength=len(keys)),
+        'notas': np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64),
+    })
+
+
+def _downsample(frame: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    if len(frame) <= max_points:
+        return frame
+    x = frame['periodo'].to_numpy().astype(np.int64)
+    keep = lttb(x, frame['faturamento'].to_numpy(), max_points)
+    return frame.iloc[keep].reset_index(drop=True)
+
+
+def _top(grouped: pd.DataFrame, by: str, top_n: int) -> pd.DataFrame:
+    """As `top_n` maiores linhas por `by`, com as demais somadas em uma linha "Outros" """
+    grouped = grouped.sort_values(by, ascending=False, kind='stable')
+    if len(grouped) > top_n:
+        rest = grouped.iloc[top_n:].sum(numeric_only=True)
+        grouped = pd.concat([grouped.iloc[:top_n], rest.to_frame(OTHERS_LABEL).T.astype(grouped.dtypes)])
+    grouped.index = grouped.index.astype(object).astype(str)
+    return grouped
+
+
+def _group_totals(keys: pd.Series, values: Optional[pd.Series]) -> pd.DataFrame:
+    """Notas (e faturamento) por valor da coluna, sem materializar os grupos"""
+    counts = keys.value_counts(sort=False)
+    counts = counts[counts > 0]  # categorias sem nenhuma nota
+    if values is None:
+        return counts.rename('notas').to_frame()
+    return pd.DataFrame({
+        'faturamento': values.groupby(keys, observed=True, sort=False).sum().reindex(counts.index),
+        'notas': counts,
+    })
+
+
+def build_chart_data(
+    header: pd.DataFrame,
+    items: Optional[pd.DataFrame] = None,
+    max_points: int = DEFAULT_MAX_POINTS,
+    top_n: int = DEFAULT_TOP_N,
+) -> ChartData:
+    """Agrega cabeçalho/itens para os gráficos: faturamento diário e mensal, fornecedores e distribuições.
+
+    Cada agregação é uma única passada vetorizada sobre a coluna; o que vai
+    para o navegador depende só de `max_points` e `top_n`, não do número de
+    linhas.
+    """
+    frames = [header, items] if items is not None and items is not header else [header]
+    charts = ChartData(rows=len(header))
+
+    dated = _find(frames, DATE_COLUMN)
+    if dated is not None and _value_column(dated):
+        dates, values = _dates(dated[DATE_COLUMN]), dated[_value_column(dated)]
+        valid = dates.notna().to_numpy() & values.notna().to_numpy()
+        daily = _revenue_by(
+            dates.to_numpy()[valid].astype('datetime64[D]'), values.to_numpy(dtype=np.float64)[valid]
+        )
+        if len(daily):
+            # O mensal sai do diário já agregado, sem outra passada pelas linhas
+            monthly = _revenue_by(
+                daily['periodo'].to_numpy().astype('datetime64[M]'),
+                daily['faturamento'].to_numpy(),
+                daily['notas'].to_numpy(),
+            )
+            charts.daily_points = len(daily)
+            charts.daily = _downsample(daily, max_points).rename(columns={'periodo': 'data'})[['data', 'faturamento']]
+            charts.monthly = _downsample(monthly, max_points).rename(columns={'periodo': 'mes'})
+
+    suppliers = _find(frames, SUPPLIER_COLUMN)
+    if suppliers is not None and _value_column(suppliers):
+        totals = _group_totals(suppliers[SUPPLIER_COLUMN], suppliers[_value_column(suppliers)])
+        charts.suppliers = _top(totals, 'faturamento', top_n).rename_axis(SUPPLIER_COLUMN).reset_index()
+
+    for col in DISTRIBUTION_COLUMNS:
+        df = _find(frames, col)
+        if df is None:
+            continue
+        value_column = _value_column(df)
+        totals = _group_totals(df[col], df[value_column] if value_column else None)
+        charts.distributions[col] = _top(totals, 'notas', top_n).rename_axis(col).reset_index()
+    return charts
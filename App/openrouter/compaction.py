@@ -0,0 +1,215 @@
+"""Compactação dos tipos das tabelas: textos repetidos viram categorias e inteiros de 64 bits passam a 32 bits"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Textos com até esta fração de valores distintos (em relação às linhas) viram categoria
+DEFAULT_MAX_CATEGORY_RATIO = float(os.getenv("MAX_CATEGORY_RATIO", "0.5"))
+
+
+def memory_mb(df: Optional[pd.DataFrame]) -> float:
+    if df is None:
+        return 0.0
+    return float(df.memory_usage(deep=True).sum()) / (1024 * 1024)
+
+
+def _is_text(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return False
+    return series.dtype == object or pd.api.types.is_string_dtype(series)
+
+
+def _downcast_numeric(series: pd.Series) -> pd.Series:
+    """Inteiros de 64 bits que cabem em int32 passam a int32; decimais ficam como estão.
+
+    Tipos mais estreitos (int8, uint16...) transbordariam em silêncio nas
+    contas dos planos de consulta (quantidade × preço, somas acumuladas), e
+    float32 ou decimais convertidos em inteiros mudariam os resultados.
+    """
+    if pd.api.types.is_bool_dtype(series) or not isinstance(series.dtype, np.dtype):
+        return series
+    if not pd.api.types.is_integer_dtype(series) or series.dtype.itemsize <= 4 or not len(series):
+        return series
+    limits = np.iinfo(np.int32)
+    if series.min() >= limits.min and series.max() <= limits.max:
+        return series.astype(np.int32)
+    return series
+
+
+@dataclass
+class CompactionReport:
+    """Memória antes/depois por tabela e colunas convertidas"""
+    before_mb: Dict[str, float] = field(default_factory=dict)
+    after_mb: Dict[str, float] = field(default_factory=dict)
+    categorical: Dict[str, List[str]] = field(default_factory=dict)
+    downcast: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def total_before_mb(self) -> float:
+        return sum(self.before_mb.values())
+
+    @property
+    def total_after_mb(self) -> float:
+        return sum(self.after_mb.values())
+
+
+def shared_categories(
+    frames: Dict[str, pd.DataFrame],
+    max_category_ratio: float = DEFAULT_MAX_CATEGORY_RATIO,
+) -> Dict[str, pd.Index]:
+    """Dicionário único por nome de coluna de texto, compartilhado entre as tabelas.
+
+    Uma coluna entra se, em alguma tabela, tiver poucos valores distintos em
+    relação às linhas; colunas presentes em mais de uma tabela (chaves de
+    junção) sempre entram, para que o merge preserve a categoria.
+    """
+    values: Dict[str, List[pd.Series]] = {}
+    eligible = set()
+    for df in frames.values():
+        for col in df.columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values.setdefault(col, []).append(pd.Series(series.cat.categories))
+                eligible.add(col)
+            elif _is_text(series):
+                uniques = pd.Series(series.dropna().unique())
+                values.setdefault(col, []).append(uniques)
+                if len(series) and len(uniques) <= max_category_ratio * len(series):
+                    eligible.add(col)
+
+    shared = {col for col, parts in values.items() if len(parts) > 1}
+    categories = {}
+    for col in eligible | shared:
+        union = pd.concat(values[col], ignore_index=True).drop_duplicates()
+        try:
+            union = union.sort_values(ignore_index=True)
+        except TypeError:
+            pass  # tipos misturados: mantém a ordem de aparição
+        categories[col] = pd.Index(union.astype(object))
+    return categories
+
+
+def compact_frame(
+    df: pd.DataFrame,
+    categories: Dict[str, pd.Index],
+) -> Tuple[pd.DataFrame, List[str], List[str]]:
+    """Aplica os dicionários compartilhados e reduz os tipos numéricos; retorna as colunas alteradas"""
+    columns = {}
+    categorical, downcast = [], []
+    for col in df.columns:
+        series = df[col]
+        if col in categories and (_is_text(series) or isinstance(series.dtype, pd.CategoricalDtype)):
+            dtype = pd.CategoricalDtype(categories[col])
+            if series.dtype != dtype:
+                series = series.astype(object).astype(dtype)
+                categorical.append(col)
+        else:
+            narrow = _downcast_numeric(series)
+            if narrow.dtype != series.dtype:
+                series = narrow
+                downcast.append(col)
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index), categorical, downcast
+
+
+def compact_frames(
+    frames: Dict[str, pd.DataFrame],
+    max_category_ratio: float = DEFAULT_MAX_CATEGORY_RATIO,
+) -> Tuple[Dict[str, pd.DataFrame], CompactionReport]:
+    """Compacta várias tabelas com dicionários de categorias compartilhados entre elas"""
+    report = CompactionReport()
+    categories = shared_categories(frames, max_category_ratio)
+    compacted = {}
+    for name, df in frames.items():
+        report.before_mb[name] = memory_mb(df)
+        compacted[name], report.categorical[name], report.downcast[name] = compact_frame(df, categories)
+        report.after_mb[name] = memory_mb(compacted[name])
+    return compacted, report
+
+
+def _common_dtype(current: pd.Series, new: pd.Series):
+    if pd.api.types.is_bool_dtype(current) or pd.api.types.is_bool_dtype(new):
+        return current.dtype if current.dtype == new.dtype else np.dtype(object)
+    if pd.api.types.is_numeric_dtype(current) and pd.api.types.is_numeric_dtype(new):
+        return np.promote_types(current.dtype, new.dtype)
+    if current.dtype == new.dtype:
+        return current.dtype
+    return np.dtype(object)
+
+
+def _concat_index(first: pd.Index, second: pd.Index) -> pd.Index:
+    # Index.append inferiria o tipo 'str'; os dicionários de categorias são sempre object
+    return pd.Index(np.concatenate([first.to_numpy(dtype=object), second.to_numpy(dtype=object)]), dtype=object)
+
+
+def _codes(series: pd.Series, dtype: pd.CategoricalDtype) -> np.ndarray:
+    """Códigos da coluna no dicionário ampliado (sem recodificar quando o dicionário atual é prefixo dele)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        if categories is dtype.categories or (
+            len(categories) <= len(dtype.categories) and dtype.categories[:len(categories)].equals(categories)
+        ):
+            return series.cat.codes.to_numpy()
+    return dtype.categories.get_indexer(pd.Index(series.astype(object), dtype=object))
+
+
+def append_frames(
+    frames: Dict[str, pd.DataFrame],
+    new_frames: Dict[str, pd.DataFrame],
+) -> Dict[str, pd.DataFrame]:
+    """Acrescenta linhas novas às tabelas já compactadas, preservando os dicionários compartilhados.
+
+    Valores de texto ainda desconhecidos são adicionados ao fim das categorias
+    (os códigos existentes não mudam) com o mesmo tipo em todas as tabelas;
+    números novos são reduzidos e, se não couberem no tipo atual, a coluna
+    inteira é promovida. As colunas das linhas novas devem ser as mesmas da
+    tabela existente.
+    """
+    for name, new in new_frames.items():
+        if set(new.columns) != set(frames[name].columns):
+            missing = sorted(set(frames[name].columns) - set(new.columns))
+            extra = sorted(set(new.columns) - set(frames[name].columns))
+            raise ValueError(f"colunas diferentes das já carregadas em {name} (faltam: {missing}, sobram: {extra})")
+
+    # Um dicionário por coluna, ampliado uma única vez com os valores novos de todas as tabelas
+    dtypes: Dict[str, pd.CategoricalDtype] = {}
+    for df in frames.values():
+        for col in df.columns:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype) or col in dtypes:
+                continue
+            categories = df[col].cat.categories
+            for other in frames.values():
+                if col in other and isinstance(other[col].dtype, pd.CategoricalDtype):
+                    if other[col].cat.categories is not categories:
+                        extra = other[col].cat.categories.difference(categories, sort=False)
+                        if len(extra):
+                            categories = _concat_index(categories, extra)
+            seen = [pd.Series(new_frames[name][col].dropna().unique()) for name in new_frames if col in new_frames[name]]
+            values = pd.Index(pd.concat(seen, ignore_index=True).astype(object).unique(), dtype=object) if seen else pd.Index([], dtype=object)
+            unknown = values[categories.get_indexer(values) < 0]
+            if len(unknown):
+                categories = _concat_index(categories, unknown)
+            dtypes[col] = df[col].dtype if categories is df[col].cat.categories else pd.CategoricalDtype(categories)
+
+    appended = dict(frames)
+    for name, new in new_frames.items():
+        current = frames[name]
+        columns = {}
+        for col in current.columns:
+            old, fresh = current[col], new[col]
+            if col in dtypes:
+                # Concatena os códigos direto: as categorias antigas são prefixo do dicionário ampliado
+                dtype = dtypes[col]
+                old_codes = _codes(old, dtype)
+                fresh_codes = dtype.categories.get_indexer(pd.Index(fresh.astype(object), dtype=object))
+                values = pd.Categorical.from_codes(np.concatenate([old_codes, fresh_codes]), dtype=dtype, validate=False)
+            else:
+                fresh = _downcast_numeric(fresh)
+                dtype = _common_dtype(old, fresh)
+                values = pd.concat([old.astype(dtype), fresh.astype(dtype)], ignore_index=True)
+            columns[col] = values
+        appended[name] = pd.DataFrame(columns)
+    return appended
@@ -0,0 +1,128 @@
+"""Histórico do modo conversa, com resumo das rodadas antigas e início do prompt estável"""
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from prompt_builder import count_tokens
+
+# Tokens de histórico (resumo + rodadas completas) acima dos quais as rodadas antigas são resumidas
+DEFAULT_HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Rodadas mais recentes que nunca entram no resumo
+DEFAULT_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+SUMMARY_ANSWER_CHARS = 300
+
+SUMMARY_PROMPT_TEMPLATE = """
+            Resuma a conversa abaixo sobre os dados de notas fiscais em no máximo 10 tópicos curtos.
+            Mantenha os números, nomes e conclusões que possam ser usados em perguntas seguintes.
+
+            {conversa}
+            """
+
+
+@dataclass
+class Turn:
+    """Uma pergunta e a resposta dada"""
+    question: str
+    answer: str
+    tokens: int = 0
+
+
+def turns_text(turns: List[Turn]) -> str:
+    return "\n\n".join(f"PERGUNTA: {turn.question}\nRESPOSTA: {turn.answer}" for turn in turns)
+
+
+def extractive_summary(summary: str, turns: List[Turn]) -> str:
+    """Resumo sem modelo: cada rodada vira um tópico com o começo da resposta"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        answer = " ".join(turn.answer.split())
+        if len(answer) > SUMMARY_ANSWER_CHARS:
+            answer = answer[:SUMMARY_ANSWER_CHARS].rsplit(" ", 1)[0] + "…"
+        lines.append(f"- {turn.question} → {answer}")
+    return "\n".join(lines)
+
+
+class Conversation:
+    """Rodadas anteriores de uma sessão, enviadas depois do contexto fixo dos dados.
+
+    As mensagens só crescem no fim (contexto, resumo, rodadas, pergunta nova),
+    então o início do prompt se repete entre perguntas e pode ser aproveitado
+    pelo cache de prompt do provedor ou do modelo local. Quando o histórico
+    passa de `token_budget`, as rodadas mais antigas (menos as `keep_turns`
+    últimas) viram um resumo, uma vez, e o prefixo volta a ficar estável.
+    """
+
+    def __init__(
+        self,
+        context_key: str = '',
+        model: str = '',
+        token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+        keep_turns: int = DEFAULT_KEEP_TURNS,
+    ):
+        self.context_key = context_key  # conjunto de dados a que a conversa se refere
+        self.model = model
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.turns: List[Turn] = []
+        self.summary = ''
+        self.summary_tokens = 0
+        self.summarized_turns = 0
+
+    def __len__(self) -> int:
+        return self.summarized_turns + len(self.turns)
+
+    @property
+    def history_tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Resumo e rodadas completas, na ordem em que aconteceram"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"RESUMO DA CONVERSA ATÉ AQUI:\n{self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+    def digest(self) -> str:
+        """Identifica o estado da conversa (entra na chave do cache de respostas)"""
+        digest = hashlib.sha256(self.summary.encode('utf-8'))
+        for turn in self.turns:
+            digest.update(b"\x1e" + turn.question.encode('utf-8') + b"\x1f" + turn.answer.encode('utf-8'))
+        return digest.hexdigest()
+
+    def add(
+        self,
+        question: str,
+        answer: str,
+        summarize: Optional[Callable[[str, List[Turn]], str]] = None,
+    ) -> bool:
+        """Registra a rodada; retorna se o histórico precisou ser resumido"""
+        tokens = count_tokens(question, self.model) + count_tokens(answer, self.model)
+        self.turns.append(Turn(question, answer, tokens))
+        if self.history_tokens <= self.token_budget or len(self.turns) <= self.keep_turns:
+            return False
+        self.compact(summarize or extractive_summary)
+        return True
+
+    def compact(self, summarize: Callable[[str, List[Turn]], str]) -> None:
+        """Troca as rodadas antigas (e o resumo anterior) por um resumo novo"""
+        old = self.turns[:len(self.turns) - self.keep_turns] if self.keep_turns else self.turns
+        if not old:
+            return
+        try:
+            summary = summarize(self.summary, old)
+        except Exception:
+            summary = extractive_summary(self.summary, old)
+        self.summary = summary.strip()
+        self.summary_tokens = count_tokens(self.summary, self.model)
+        self.summarized_turns += len(old)
+        self.turns = self.turns[len(old):]
+
+    def clear(self) -> None:
+        self.turns = []
+        self.summary = ''
+        self.summary_tokens = 0
+        self.summarized_turns = 0
@@ -0,0 +1,233 @@
+"""Registro de conjuntos de dados compartilhado entre as sessões do Streamlit (uma cópia por conteúdo)"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from compaction import CompactionReport, memory_mb
+from joins import CombinedView, JoinKey
+from parse_cache import CACHE_ENABLED, ParseCache
+from row_index import RowIndex
+from stats_index import FrameStats
+
+DEFAULT_STORE_DIR = os.getenv(
+    "DATASET_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "analisador_nf", "datasets"),
+)
+DEFAULT_STORE_MAX_MB = float(os.getenv("DATASET_STORE_MAX_MB", "8192"))
+# Memória mantida para conjuntos sem nenhuma sessão usando (0 = liberar assim que a última sessão sair)
+DEFAULT_IDLE_MB = float(os.getenv("DATASET_IDLE_MB", "0"))
+STORE_ON_DISK = os.getenv("DATASET_STORE_DISK", "True").lower() in ("1", "true", "yes", "sim")
+
+# Incrementar quando a forma de montar os conjuntos mudar, invalidando as chaves antigas
+STORE_FORMAT_VERSION = 1
+
+
+def dataset_key(*parts: Any) -> str:
+    """Chave de conteúdo de um conjunto (hashes dos arquivos, opções de leitura, parâmetros do gerador)"""
+    payload = json.dumps([STORE_FORMAT_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class IngestedFile:
+    """Arquivo de origem já incorporado ao conjunto (identificado pelo hash do conteúdo)"""
+    name: str
+    key: str
+    size: int
+    table: str  # 'cabecalho' ou 'itens'
+    rows: int  # linhas incorporadas
+    duplicates: int = 0  # linhas ignoradas por já existirem
+    loaded_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec='seconds'))
+
+
+@dataclass
+class Dataset:
+    """Tabelas, índices e estatísticas de um conjunto de dados.
+
+    Montado por uma sessão como rascunho e, depois de publicado no
+    `DatasetStore`, tratado como somente leitura: quem quiser alterá-lo (por
+    exemplo, anexar arquivos) trabalha sobre um `draft`.
+    """
+    key: str = ''
+    cabecalho_df: Optional[pd.DataFrame] = None
+    itens_df: Optional[pd.DataFrame] = None
+    combined_df: Any = None  # CombinedView ou o próprio cabeçalho
+    cabecalho_stats: Optional[FrameStats] = None
+    itens_stats: Optional[FrameStats] = None
+    join_key: Optional[JoinKey] = None
+    compaction_report: Optional[CompactionReport] = None
+    ingested_files: List[IngestedFile] = field(default_factory=list)
+    row_indexes: Dict[str, RowIndex] = field(default_factory=dict)
+    fingerprint: Optional[str] = None  # impressão digital dos dados (calculada sob demanda)
+    size_mb: float = 0.0
+    published: bool = False
+
+    def draft(self) -> "Dataset":
+        """Cópia editável; as tabelas continuam compartilhadas até serem substituídas.
+
+        Os índices de estatísticas são alterados no lugar (`FrameStats.update`),
+        então o rascunho recebe cópias próprias deles.
+        """
+        cabecalho_stats = self.cabecalho_stats.copy() if self.cabecalho_stats is not None else None
+        if self.itens_stats is self.cabecalho_stats:
+            itens_stats = cabecalho_stats  # arquivo único: cabeçalho e itens continuam com o mesmo índice
+        else:
+            itens_stats = self.itens_stats.copy() if self.itens_stats is not None else None
+        return replace(
+            self,
+            key='',
+            published=False,
+            cabecalho_stats=cabecalho_stats,
+            itens_stats=itens_stats,
+            ingested_files=list(self.ingested_files),
+            row_indexes={table: index.copy() for table, index in self.row_indexes.items()},
+        )
+
+    def memory_mb(self) -> float:
+        """Memória das tabelas (cada DataFrame contado uma vez) e dos índices da visão combinada"""
+        frames = {id(df): df for df in (self.cabecalho_df, self.itens_df, self.combined_df) if df is not None}
+        return sum(memory_mb(df) for df in frames.values())
+
+
+class DatasetStore:
+    """Conjuntos publicados por chave de conteúdo, com contagem de referências.
+
+    Sessões que carregam o mesmo conteúdo recebem o mesmo objeto `Dataset`, sem
+    copiar as tabelas. Quando a última sessão libera um conjunto, ele sai da
+    memória (ou fica ocioso, até `idle_mb`, para ser reaproveitado). Com o disco
+    habilitado, as tabelas também são gravadas em Arrow e outros processos do
+    servidor as abrem via memory-map em vez de reler os CSVs.
+    """
+
+    def __init__(self, idle_mb: float = DEFAULT_IDLE_MB, disk: Optional[ParseCache] = None):
+        self.idle_mb = idle_mb
+        self.disk = disk
+        self._datasets: Dict[str, Dataset] = {}
+        self._refs: Dict[str, int] = {}
+        self._idle: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> Optional[Dataset]:
+        """Conjunto já publicado com esta chave (em memória ou no disco), com uma referência a mais"""
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is not None:
+                self._refs[key] += 1
+                self._idle.pop(key, None)
+                return dataset
+        dataset = self._load(key)
+        return self.publish(dataset, persist=False) if dataset is not None else None
+
+    def publish(self, dataset: Dataset, persist: bool = True) -> Dataset:
+        """Registra o conjunto (com uma referência) ou devolve o já publicado com a mesma chave"""
+        with self._lock:
+            current = self._datasets.get(dataset.key)
+            if current is not None:
+                self._refs[dataset.key] += 1
+                self._idle.pop(dataset.key, None)
+                return current
+            dataset.published = True
+            dataset.size_mb = dataset.memory_mb()
+            self._datasets[dataset.key] = dataset
+            self._refs[dataset.key] = 1
+        if persist:
+            self._save(dataset)
+        return dataset
+
+    def release(self, key: str) -> None:
+        """Devolve uma referência; sem referências, o conjunto fica ocioso ou é descartado"""
+        with self._lock:
+            if key not in self._refs:
+                return
+            self._refs[key] -= 1
+            if self._refs[key] > 0:
+                return
+            self._idle[key] = None
+            idle_mb = sum(self._datasets[idle].size_mb for idle in self._idle)
+            while self._idle and idle_mb > self.idle_mb:
+                oldest, _ = self._idle.popitem(last=False)
+                idle_mb -= self._datasets[oldest].size_mb
+                del self._datasets[oldest]
+                del self._refs[oldest]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'conjuntos': len(self._datasets),
+                'sessoes': sum(self._refs.values()),
+                'ociosos': len(self._idle),
+                'memoria_mb': sum(dataset.size_mb for dataset in self._datasets.values()),
+            }
+
+    def references(self, key: str) -> int:
+        with self._lock:
+            return self._refs.get(key, 0)
+
+    def _save(self, dataset: Dataset) -> None:
+        """Grava as tabelas no disco; o cabeçalho (com os metadados) por último marca a entrada como completa"""
+        if self.disk is None or not self.disk.enabled or dataset.cabecalho_df is None:
+            return
+        shared = dataset.itens_df is dataset.cabecalho_df
+        if not shared and not self.disk.put(f"{dataset.key}-itens", dataset.itens_df, {}):
+            return
+        self.disk.put(f"{dataset.key}-cabecalho", dataset.cabecalho_df, {
+            'mesma_tabela': shared,
+            'cabecalho_stats': dataset.cabecalho_stats.to_dict() if dataset.cabecalho_stats else None,
+            'itens_stats': dataset.itens_stats.to_dict() if dataset.itens_stats and not shared else None,
+            'join_key': asdict(dataset.join_key) if dataset.join_key else None,
+            'compaction_report': asdict(dataset.compaction_report) if dataset.compaction_report else None,
+            'ingested_files': [asdict(entry) for entry in dataset.ingested_files],
+            'fingerprint': dataset.fingerprint,
+        })
+
+    def _load(self, key: str) -> Optional[Dataset]:
+        if self.disk is None:
+            return None
+        cached = self.disk.get(f"{key}-cabecalho")
+        if cached is None:
+            return None
+        cabecalho_df, metadata = cached
+        if metadata.get('mesma_tabela'):
+            itens_df = cabecalho_df
+        else:
+            itens = self.disk.get(f"{key}-itens")
+            if itens is None:
+                return None
+            itens_df = itens[0]
+
+        dataset = Dataset(key=key, cabecalho_df=cabecalho_df, itens_df=itens_df, fingerprint=metadata.get('fingerprint'))
+        if metadata.get('cabecalho_stats'):
+            dataset.cabecalho_stats = FrameStats.from_dict(metadata['cabecalho_stats'])
+        dataset.itens_stats = (
+            FrameStats.from_dict(metadata['itens_stats']) if metadata.get('itens_stats') else dataset.cabecalho_stats
+        )
+        if metadata.get('compaction_report'):
+            dataset.compaction_report = CompactionReport(**metadata['compaction_report'])
+        dataset.ingested_files = [IngestedFile(**entry) for entry in metadata.get('ingested_files', [])]
+        if metadata.get('join_key'):
+            dataset.join_key = JoinKey(**metadata['join_key'])
+            dataset.combined_df = CombinedView(cabecalho_df, itens_df, dataset.join_key.column)
+        else:
+            dataset.combined_df = cabecalho_df
+        return dataset
+
+
+_shared_store: Optional[DatasetStore] = None
+_shared_lock = threading.Lock()
+
+
+def shared_dataset_store() -> DatasetStore:
+    """Instância única no processo, compartilhada por todas as sessões"""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            disk = ParseCache(DEFAULT_STORE_DIR, DEFAULT_STORE_MAX_MB, CACHE_ENABLED and STORE_ON_DISK)
+            _shared_store = DatasetStore(disk=disk)
+        return _shared_store
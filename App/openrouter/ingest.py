@@ -0,0 +1,156 @@
+"""Leitura de arquivos CSV em blocos (chunks) com limite de memória"""
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from stats_index import FrameStats
+
+# Tamanho padrão do bloco (linhas) e teto de memória para os dados já convertidos
+DEFAULT_CHUNKSIZE = int(os.getenv("CSV_CHUNKSIZE", "200000"))
+DEFAULT_MAX_MEMORY_MB = int(os.getenv("MAX_MEMORY_MB", "2048"))
+
+# Formatos testados na detecção de datas (o padrão brasileiro vem antes do americano)
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+]
+
+
+class MemoryLimitExceeded(Exception):
+    """Disparada quando os dados carregados ultrapassam o teto de memória configurado"""
+
+
+def detect_date_columns(columns) -> List[str]:
+    """Retorna as colunas que parecem conter datas pelo nome"""
+    return [col for col in columns if 'data' in str(col).lower() or 'date' in str(col).lower()]
+
+
+def sniff_date_format(values: pd.Series, sample_size: int = 200) -> Optional[str]:
+    """Descobre o formato de data que converte a maior parte de uma amostra da coluna"""
+    sample = values.dropna().astype(str).head(sample_size)
+    if sample.empty:
+        return None
+
+    best_format, best_hits = None, 0
+    for fmt in DATE_FORMATS:
+        hits = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if hits > best_hits:
+            best_format, best_hits = fmt, hits
+        if hits == len(sample):
+            break
+    return best_format
+
+
+def parse_dates(values: pd.Series, date_format: Optional[str]) -> pd.Series:
+    """Converte a coluna para datetime usando o formato detectado (se houver)"""
+    if date_format:
+        return pd.to_datetime(values, format=date_format, errors='coerce')
+    return pd.to_datetime(values, errors='coerce')
+
+
+def _file_size(file) -> Optional[int]:
+    """Tamanho do arquivo enviado (UploadedFile, arquivo aberto ou caminho)"""
+    size = getattr(file, 'size', None)
+    if size:
+        return int(size)
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    try:
+        position = file.tell()
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def read_csv_chunked(
+    file,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    max_memory_mb: Optional[float] = DEFAULT_MAX_MEMORY_MB,
+    progress: Optional[Callable[[float], None]] = None,
+    encoding: str = 'utf-8',
+    sep: str = ',',
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[pd.DataFrame, FrameStats, Dict[str, Optional[str]]]:
+    """Lê um CSV em blocos, convertendo datas e acumulando estatísticas pelo caminho.
+
+    O formato das colunas de data é detectado no primeiro bloco e reaproveitado
+    nos seguintes. Retorna o DataFrame completo, o índice de estatísticas
+    construído bloco a bloco e os formatos de data detectados. O teto de memória
+    vale para o pico da carga: com mais de um bloco, a concatenação final mantém
+    os blocos e o resultado ao mesmo tempo, então conta em dobro. Se `timings` for
+    informado, acumula nele os segundos gastos em cada etapa ('parse', 'datas',
+    'estatisticas', 'concatenacao').
+    """
+    timings = timings if timings is not None else {}
+    for stage in ('parse', 'datas', 'estatisticas', 'concatenacao'):
+        timings.setdefault(stage, 0.0)
+    total_size = _file_size(file)
+    max_bytes = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+
+    stats = FrameStats()
+    date_formats: Optional[Dict[str, Optional[str]]] = None
+    chunks = []
+    used_bytes = 0
+
+    mark = time.perf_counter()
+    reader = pd.read_csv(file, encoding=encoding, sep=sep, chunksize=chunksize)
+    try:
+        for chunk in reader:
+            now = time.perf_counter()
+            timings['parse'] += now - mark
+            mark = now
+
+            if date_formats is None:
+                date_formats = {
+                    col: sniff_date_format(chunk[col]) for col in detect_date_columns(chunk.columns)
+                }
+            for col, fmt in date_formats.items():
+                chunk[col] = parse_dates(chunk[col], fmt)
+            now = time.perf_counter()
+            timings['datas'] += now - mark
+            mark = now
+
+            stats.update(chunk)
+            now = time.perf_counter()
+            timings['estatisticas'] += now - mark
+            mark = now
+            used_bytes += int(chunk.memory_usage(deep=True).sum())
+            # A partir do segundo bloco, a concatenação vai precisar de uma cópia de tudo
+            peak_bytes = 2 * used_bytes if chunks else used_bytes
+            if max_bytes and peak_bytes > max_bytes:
+                raise MemoryLimitExceeded(
+                    f"dados excedem o limite de {max_memory_mb:.0f} MB "
+                    f"após {stats.rows:,} linhas (incluindo a cópia da concatenação)"
+                )
+            chunks.append(chunk)
+
+            if progress and total_size and hasattr(file, 'tell'):
+                progress(min(file.tell() / total_size, 1.0))
+            mark = time.perf_counter()
+    finally:
+        reader.close()
+
+    if progress:
+        progress(1.0)
+
+    mark = time.perf_counter()
+    if len(chunks) == 1:
+        df = chunks[0]  # um único bloco dispensa a cópia
+    else:
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    chunks.clear()
+    stats.reconcile(df)
+    timings['concatenacao'] += time.perf_counter() - mark
+    return df, stats, date_formats or {}
@@ -0,0 +1,213 @@
+"""Detecção da chave de junção entre cabeçalho e itens e visão combinada sob demanda"""
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Nomes que costumam identificar a nota fiscal (desempate entre chaves igualmente boas)
+KEY_HINTS = ('numero_nf', 'nf', 'chave', 'numero', 'id')
+MERGE_SUFFIXES = ('_x', '_y')
+# Acima deste número de segmentos no índice da chave, o índice é refeito de uma vez
+MAX_SEGMENTS = 8
+
+
+@dataclass
+class JoinKey:
+    """Coluna candidata a chave com as medidas usadas para ranqueá-la"""
+    column: str
+    header_unique: float  # fração de valores distintos no cabeçalho (1.0 = chave única)
+    overlap: float        # fração das linhas de itens cuja chave existe no cabeçalho
+
+    @property
+    def valid(self) -> bool:
+        """Relação um-para-muitos: chave única no cabeçalho e encontrada nos itens"""
+        return self.header_unique == 1.0 and self.overlap > 0
+
+    @property
+    def hint(self) -> int:
+        name = self.column.lower()
+        for rank, hint in enumerate(KEY_HINTS):
+            if name == hint or hint in name.split('_'):
+                return len(KEY_HINTS) - rank
+        return 0
+
+
+def rank_join_keys(header: pd.DataFrame, items: pd.DataFrame) -> List[JoinKey]:
+    """Colunas em comum ordenadas da melhor para a pior chave (ordem determinística)"""
+    candidates = []
+    for col in sorted(set(header.columns) & set(items.columns)):
+        keys = header[col]
+        header_unique = keys.nunique(dropna=True) / len(keys) if len(keys) and keys.notna().all() else 0.0
+        overlap = float(items[col].isin(keys).mean()) if len(items) else 0.0
+        candidates.append(JoinKey(col, header_unique, overlap))
+    return sorted(candidates, key=lambda key: (-key.valid, -key.overlap, -key.header_unique, -key.hint, key.column))
+
+
+def detect_join_key(header: pd.DataFrame, items: pd.DataFrame) -> Optional[JoinKey]:
+    """Melhor chave válida entre as colunas em comum, ou None se nenhuma tiver cardinalidade um-para-muitos"""
+    ranked = rank_join_keys(header, items)
+    return ranked[0] if ranked and ranked[0].valid else None
+
+
+def _take(series: pd.Series, positions: np.ndarray, missing: bool) -> pd.Series:
+    if isinstance(series.dtype, np.dtype):
+        # Posições -1 viram NaN/NaT, promovendo inteiros a float como o merge faria
+        values = pd.api.extensions.take(series.to_numpy(), positions, allow_fill=missing)
+    else:
+        values = series.array.take(positions, allow_fill=missing)
+    return pd.Series(values, name=series.name)
+
+
+class CombinedView:
+    """Junção à esquerda (cabeçalho → itens) sem materializar a tabela larga.
+
+    Guarda apenas, para cada linha da junção, a posição no cabeçalho e a
+    posição no item (-1 quando a NF não tem itens), na mesma ordem que
+    `pd.merge(header, items, on=key, how='left')` produziria. As colunas são
+    montadas sob demanda com `select`/`[]`; `lookup` usa o índice por chave e
+    `extend` incorpora linhas acrescentadas sem refazer a junção inteira.
+    """
+
+    def __init__(self, header: pd.DataFrame, items: pd.DataFrame, key: str):
+        self.header = header
+        self.items = items
+        self.key = key
+
+        # Índice da chave em segmentos (posição inicial, índice): cargas incrementais acrescentam um segmento
+        self.header_segments = [(0, pd.Index(header[key]))]
+        item_header = self._locate(items[key])
+        matched = np.flatnonzero(item_header >= 0)
+        # Itens ordenados pela posição da NF no cabeçalho (estável: mantém a ordem original entre itens)
+        order = matched[np.argsort(item_header[matched], kind='stable')]
+        self._layout(order, item_header[order])
+        self._sources = self._column_sources()
+        self.columns = pd.Index(list(self._sources))
+
+    def _locate(self, keys: pd.Series) -> np.ndarray:
+        """Posição no cabeçalho de cada chave (-1 se a NF não existir)"""
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        for start, index in self.header_segments:
+            pending = np.flatnonzero(positions < 0)
+            if len(pending) == 0:
+                break
+            found = index.get_indexer(keys if len(pending) == len(keys) else keys.iloc[pending])
+            hits = found >= 0
+            positions[pending[hits]] = found[hits] + start
+        return positions
+
+    def _layout(self, items_sorted: np.ndarray, headers_sorted: np.ndarray) -> None:
+        """Monta as posições da junção a partir dos itens já ordenados pela posição da NF"""
+        counts = np.bincount(headers_sorted, minlength=len(self.header))
+        rows = np.maximum(counts, 1)
+
+        self.header_pos = np.repeat(np.arange(len(self.header), dtype=np.int64), rows)
+        self.item_pos = np.full(len(self.header_pos), -1, dtype=np.int64)
+        self.item_pos[np.repeat(counts > 0, rows)] = items_sorted
+        self.header_start = np.cumsum(rows) - rows
+        self.header_rows = rows
+        self._has_missing = bool((counts == 0).any())
+
+    def extend(self, header: pd.DataFrame, items: pd.DataFrame) -> "CombinedView":
+        """Nova visão sobre tabelas que começam com as linhas já indexadas.
+
+        Só as linhas acrescentadas são procuradas no índice; os itens novos
+        entram depois dos já existentes da mesma NF, como no `pd.merge` sobre
+        as tabelas concatenadas.
+        """
+        view = CombinedView.__new__(CombinedView)
+        view.header, view.items, view.key = header, items, self.key
+        view.header_segments = list(self.header_segments)
+        if len(header) > len(self.header):
+            new_keys = header[self.key].iloc[len(self.header):].astype(object)
+            view.header_segments.append((len(self.header), pd.Index(new_keys, dtype=object)))
+        if len(view.header_segments) > MAX_SEGMENTS:
+            view.header_segments = [(0, pd.Index(header[self.key]))]
+
+        # Chaves como texto: índices categóricos com dicionários diferentes custariam O(categorias) para comparar
+        item_header = view._locate(items[self.key].iloc[len(self.items):].astype(object))
+        matched = np.flatnonzero(item_header >= 0)
+        order = matched[np.argsort(item_header[matched], kind='stable')]
+        new_headers = item_header[order]
+
+        present = self.item_pos >= 0
+        old_items, old_headers = self.item_pos[present], self.header_pos[present]
+        at = np.searchsorted(old_headers, new_headers, side='right')
+        view._layout(np.insert(old_items, at, order + len(self.items)), np.insert(old_headers, at, new_headers))
+        view._sources = view._column_sources()
+        view.columns = pd.Index(list(view._sources))
+        return view
+
+    def _column_sources(self):
+        header, items, key = self.header, self.items, self.key
+        common = (set(header.columns) & set(items.columns)) - {key}
+        sources = {}
+        for col in header.columns:
+            sources[col + MERGE_SUFFIXES[0] if col in common else col] = ('header', col)
+        for col in items.columns:
+            if col != key:
+                sources[col + MERGE_SUFFIXES[1] if col in common else col] = ('items', col)
+        return sources
+
+    def __len__(self) -> int:
+        return len(self.header_pos)
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def dtypes(self) -> pd.Series:
+        """Tipos das colunas como ficariam na junção (inteiros dos itens viram float se houver NF sem itens)"""
+        dtypes = {}
+        for name, (side, col) in self._sources.items():
+            dtype = (self.header if side == 'header' else self.items)[col].dtype
+            if side == 'items' and self._has_missing and pd.api.types.is_integer_dtype(dtype):
+                dtype = np.dtype('float64')
+            dtypes[name] = dtype
+        return pd.Series(dtypes, dtype=object)
+
+    def memory_usage(self, deep: bool = False) -> pd.Series:
+        """Memória própria da visão (só os índices de posição; os dados são os do cabeçalho e dos itens)"""
+        return pd.Series({'header_pos': self.header_pos.nbytes, 'item_pos': self.item_pos.nbytes})
+
+    def _column(self, name: str, header_pos: np.ndarray, item_pos: np.ndarray) -> pd.Series:
+        side, col = self._sources[name]
+        if side == 'header':
+            series = _take(self.header[col], header_pos, missing=False)
+        else:
+            series = _take(self.items[col], item_pos, missing=bool((item_pos < 0).any()))
+        return series.rename(name)
+
+    def __getitem__(self, name):
+        if isinstance(name, (list, pd.Index)):
+            return self.select(name)
+        if name not in self._sources:
+            raise KeyError(name)
+        return self._column(name, self.header_pos, self.item_pos)
+
+    def select(self, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Materializa apenas as colunas pedidas (todas, se `columns` for None)"""
+        names = list(self.columns) if columns is None else [col for col in columns if col in self._sources]
+        return pd.DataFrame({name: self._column(name, self.header_pos, self.item_pos) for name in names})
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.take(np.arange(min(n, len(self))))
+
+    def take(self, rows: np.ndarray, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Linhas específicas da junção, montadas a partir das posições"""
+        names = list(self.columns) if columns is None else list(columns)
+        header_pos, item_pos = self.header_pos[rows], self.item_pos[rows]
+        return pd.DataFrame({name: self._column(name, header_pos, item_pos) for name in names})
+
+    def lookup(self, value) -> pd.DataFrame:
+        """Linhas da junção de uma NF (cabeçalho e seus itens) pelo índice da chave"""
+        position = self._locate(pd.Series([value]))[0]
+        if position < 0:
+            return self.take(np.arange(0))
+        start = self.header_start[position]
+        return self.take(np.arange(start, start + self.header_rows[position]))
@@ -2,149 +2,673 @@ import streamlit as st
 import pandas as pd
 import os
 import io
-from typing import Dict, List, Any, Optional
-import requests
+import sys
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 import json
+import hashlib
+import threading
+import time
+import weakref
 from datetime import datetime
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from charts import ChartData, build_chart_data
+from compaction import append_frames, compact_frames, memory_mb
+from conversation import SUMMARY_PROMPT_TEMPLATE, Conversation, Turn, turns_text
+from dataset_store import Dataset, IngestedFile, dataset_key, shared_dataset_store
+from ingest import (
+    DEFAULT_CHUNKSIZE,
+    DEFAULT_MAX_MEMORY_MB,
+    MemoryLimitExceeded,
+    read_csv_chunked,
+)
+from openrouter_client import DEFAULT_BASE_URL, OpenRouterAPIError, OpenRouterClient
+from joins import CombinedView, detect_join_key
+from metrics import Tracer, shared_tracer, traced
+from parse_cache import CacheEvent, ParseCache, hash_upload
+from prompt_builder import (
+    DEFAULT_PROMPT_TOKEN_BUDGET,
+    BuiltPrompt,
+    PromptBuilder,
+    context_sections,
+    count_tokens,
+    stratified_sample,
+)
+from response_cache import shared_response_cache
+from routing import SIMPLE, RouteDecision, shared_model_router
+from row_index import RowIndex, key_columns, row_hashes
+from stats_index import FrameStats
+from synthetic_data import SyntheticSpec, generate_frames
+from query_plan import (
+    PLAN_INSTRUCTIONS,
+    QueryPlanError,
+    describe_tables,
+    execute_plan,
+    parse_plan,
+    validate_plan,
+)
+
+# Seções isoladas em fragmentos: interagir com um widget de dentro reexecuta só a seção, não o script todo
+# (st.fragment existe a partir do Streamlit 1.37; em versões antigas as seções rodam normalmente)
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda function: function)
+
+# Modelos locais (App/LLaMA, executados na CPU) aparecem no mesmo seletor com este prefixo
+LOCAL_MODEL_PREFIX = "local/"
+DEFAULT_LOCAL_MODEL = os.getenv("LOCAL_LLM_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+LLAMA_DIR = os.getenv("LLAMA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "LLaMA"))
+
+# Perguntas simples vão para um modelo rápido; com hedging, respostas que demoram além do p95 são duplicadas
+DEFAULT_ROUTING = os.getenv("ROUTER_ENABLED", "True").lower() in ("1", "true", "yes", "sim")
+DEFAULT_HEDGING = os.getenv("HEDGE_ENABLED", "False").lower() in ("1", "true", "yes", "sim")
+
+CONTEXT_PROMPT_TEMPLATE = """
+            Você é um analista de dados especializado em notas fiscais. Você tem acesso aos seguintes dados:
+
+            ESTRUTURA (tabela.coluna e tipo):
+{estrutura}
+
+            ESTATÍSTICAS BÁSICAS:
+{estatisticas}
+
+            AMOSTRA REPRESENTATIVA DOS DADOS:
+{amostra}
+
+            PERGUNTA DO USUÁRIO: {question}
+
+            Por favor, analise os dados e responda à pergunta de forma clara e detalhada. 
+            Se necessário, forneça cálculos, percentuais e insights relevantes.
+            Se a pergunta envolver análises específicas que requerem cálculos, explique o raciocínio.
+            Algumas colunas podem ter sido omitidas por limite de tamanho; elas continuam existindo nos dados.
+            
+            Formato da resposta:
+            - Responda de forma direta e clara
+            - Use dados específicos quando possível
+            - Forneça insights adicionais se relevante
+            - Use formatação em markdown para melhor legibilidade
+            """
+
+# Modo conversa: o contexto dos dados não depende da pergunta, então é o mesmo em todas as rodadas
+SYSTEM_CONTEXT_TEMPLATE = """
+            Você é um analista de dados especializado em notas fiscais e está conversando com o usuário.
+            Você tem acesso aos seguintes dados:
+
+            ESTRUTURA (tabela.coluna e tipo):
+{estrutura}
+
+            ESTATÍSTICAS BÁSICAS:
+{estatisticas}
+
+            AMOSTRA REPRESENTATIVA DOS DADOS:
+{amostra}
+
+            Responda às perguntas de forma clara e detalhada, levando em conta as perguntas e respostas anteriores.
+            Se necessário, forneça cálculos, percentuais e insights relevantes.
+            Algumas colunas podem ter sido omitidas por limite de tamanho; elas continuam existindo nos dados.
+            Use formatação em markdown para melhor legibilidade.
+            """
+
+# Provedores que só reaproveitam o início do prompt quando ele é marcado com cache_control
+PROMPT_CACHE_CONTROL_PREFIXES = ('anthropic/',)
+
+
+@dataclass
+class QueryResult:
+    """Resultado completo de uma consulta (resposta, uso de tokens e detalhes da execução)"""
+    question: str
+    answer: str
+    usage: Dict[str, int] = field(default_factory=dict)
+    latency: float = 0.0
+    from_cache: bool = False
+    plan: Optional[Dict[str, Any]] = None
+    result: Optional[pd.DataFrame] = None
+    plan_error: Optional[str] = None
+    prompt_tokens: int = 0
+    prefix_tokens: int = 0  # tokens do contexto fixo (modo conversa)
+    stages: Dict[str, float] = field(default_factory=dict)  # etapa -> segundos
+    ok: bool = True
+    route: Optional[RouteDecision] = None
+
+
+class AnswerStream:
+    """Resposta em streaming; os campos de tempo e uso são preenchidos durante a iteração"""
+    
+    def __init__(self, question: str):
+        self.question = question
+        self.chunks: Iterator[str] = iter(())
+        self.text = ''
+        self.usage: Dict[str, int] = {}
+        self.first_token_latency: Optional[float] = None
+        self.latency = 0.0
+        self.from_cache = False
+        self.cancelled = False
+        self.plan: Optional[Dict[str, Any]] = None
+        self.result: Optional[pd.DataFrame] = None
+        self.plan_error: Optional[str] = None
+        self.prompt_tokens = 0
+        self.prefix_tokens = 0
+        self.stages: Dict[str, float] = {}
+        self.ok = True
+        self.route: Optional[RouteDecision] = None
+    
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.chunks:
+            self.text += chunk
+            yield chunk
+
+
+def _sum_usage(*usages: Dict[str, int]) -> Dict[str, int]:
+    """Soma os contadores de tokens de várias chamadas"""
+    total: Dict[str, int] = {}
+    for usage in usages:
+        for key, value in usage.items():
+            # Detalhes aninhados (por exemplo, prompt_tokens_details.cached_tokens) são somados pelo nome interno
+            counters = value.items() if isinstance(value, dict) else [(key, value)]
+            for name, count in counters:
+                if isinstance(count, (int, float)):
+                    total[name] = total.get(name, 0) + count
+    return total
+
+
+def _dataset_field(name: str, doc: str) -> property:
+    """Atributo do agente guardado no conjunto de dados da sessão (compartilhado depois de publicado)"""
+    def get(self):
+        return getattr(self.dataset, name)
+    
+    def set(self, value):
+        if self.dataset.published:
+            raise RuntimeError(f"o conjunto publicado é somente leitura ({name})")
+        setattr(self.dataset, name, value)
+    return property(get, set, doc=doc)
+
+
+def is_local_model(model: str) -> bool:
+    return model.startswith(LOCAL_MODEL_PREFIX)
+
+
+def local_model_client(model: str):
+    """Cliente do modelo local (mesma interface do OpenRouterClient), importado só quando é usado"""
+    if LLAMA_DIR not in sys.path:
+        sys.path.append(LLAMA_DIR)
+    from local_backend import shared_local_client
+    return shared_local_client(model[len(LOCAL_MODEL_PREFIX):])
+
+
+def file_table(file_name: str) -> Optional[str]:
+    """Tabela de destino de um CSV pelo nome do arquivo ('cabecalho', 'itens' ou None)"""
+    name = file_name.lower()
+    if 'cabecalho' in name or 'header' in name or 'nf' in name:
+        return 'cabecalho'
+    if 'itens' in name or 'items' in name or 'produtos' in name:
+        return 'itens'
+    return None
+
 
 class OpenRouterAgent:
-    """Agente para análise de dados usando OpenRouter"""
+    """Agente para análise de dados usando OpenRouter.
     
-    def __init__(self, api_key: str, model: str = "anthropic/claude-3.5-sonnet"):
+    As tabelas ficam em um `Dataset` publicado no registro do processo: sessões
+    que carregam o mesmo conteúdo apontam para a mesma cópia, e o agente guarda
+    só a referência (liberada quando o agente é descartado).
+    """
+    
+    cabecalho_df = _dataset_field('cabecalho_df', "Tabela de cabeçalho das notas")
+    itens_df = _dataset_field('itens_df', "Tabela de itens das notas")
+    combined_df = _dataset_field('combined_df', "Visão combinada (cabeçalho → itens) montada sob demanda sobre a chave de junção")
+    join_key = _dataset_field('join_key', "Chave de junção detectada")
+    compaction_report = _dataset_field('compaction_report', "Resultado da última compactação de tipos (memória antes/depois)")
+    cabecalho_stats = _dataset_field('cabecalho_stats', "Índice de estatísticas do cabeçalho")
+    itens_stats = _dataset_field('itens_stats', "Índice de estatísticas dos itens")
+    ingested_files = _dataset_field('ingested_files', "Arquivos já incorporados")
+    row_indexes = _dataset_field('row_indexes', "Índices de hashes das chaves (criados no primeiro anexo)")
+    
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "anthropic/claude-3.5-sonnet",
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        max_memory_mb: Optional[float] = DEFAULT_MAX_MEMORY_MB,
+        base_url: str = DEFAULT_BASE_URL,
+        prompt_token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET,
+    ):
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:8501",  # Para Streamlit
-            "X-Title": "Analisador de Notas Fiscais"
-        }
-        self.cabecalho_df = None
-        self.itens_df = None
-        self.combined_df = None
+        self.chunksize = chunksize
+        self.max_memory_mb = max_memory_mb
+        self.prompt_token_budget = prompt_token_budget
+        self.parse_options = {'encoding': 'utf-8', 'sep': ','}
+        self.parse_cache = ParseCache()
+        self.cache_events: List[CacheEvent] = []
+        self.response_cache = shared_response_cache()
+        self.tracer: Tracer = shared_tracer()
+        # Conjunto de dados em uso (rascunho até ser publicado no registro compartilhado)
+        self.store = shared_dataset_store()
+        self.dataset = Dataset()
+        self._release: Optional[weakref.finalize] = None
+        self.last_from_cache = False
+        self.base_url = base_url
+        # Cliente HTTP com pool de conexões, novas tentativas e limite de taxa
+        self.client = OpenRouterClient(
+            api_key,
+            base_url=base_url,
+            extra_headers={
+                "HTTP-Referer": "http://localhost:8501",  # Para Streamlit
+                "X-Title": "Analisador de Notas Fiscais"
+            },
+        )
+        # Último plano de consulta executado localmente (modo de execução local)
+        self.last_plan = None
+        self.last_result = None
+        self.last_plan_error = None
+        # Contexto fixo do modo conversa: ((conjunto, modelo, orçamento), prompt)
+        self._system_prompt: Optional[Tuple[Tuple, BuiltPrompt]] = None
+        # Escolha do modelo por pergunta (histórico de latência compartilhado entre as sessões)
+        self.router = shared_model_router()
+        self.routing = DEFAULT_ROUTING
+        self.hedging = DEFAULT_HEDGING
         
+    @property
+    def model_client(self):
+        """Cliente do modelo selecionado: o OpenRouter ou, para modelos "local/...", o modelo local na CPU"""
+        return self._client_for(self.model)
+    
+    def _client_for(self, model: str):
+        if is_local_model(model):
+            return local_model_client(model)
+        return self.client
+    
+    def route(self, question: str) -> RouteDecision:
+        """Modelo que vai responder a pergunta (o modelo local não é roteado nem duplicado)"""
+        local = is_local_model(self.model)
+        return self.router.route(question, self.model, routing=self.routing and not local, hedge=self.hedging and not local)
+    
+    def _attach(self, dataset: Dataset) -> None:
+        """Passa a usar um conjunto publicado (já com a referência desta sessão) e devolve o anterior"""
+        if self._release is not None:
+            self._release()
+        self.dataset = dataset
+        self._release = weakref.finalize(self, self.store.release, dataset.key)
+    
+    def _publish(self, key: str) -> None:
+        """Publica o rascunho atual no registro; se outra sessão já publicou o mesmo conteúdo, usa o dela"""
+        self.dataset.key = key
+        self._attach(self.store.publish(self.dataset))
+    
+    def _attach_existing(self, key: str) -> bool:
+        """Reaproveita um conjunto já carregado (nesta ou em outra sessão/processo) com a mesma chave"""
+        dataset = self.store.acquire(key)
+        if dataset is None:
+            return False
+        self._attach(dataset)
+        sessions = self.store.references(key)
+        st.success(f"♻️ Dados já carregados reaproveitados ({sessions} sessão(ões) usando a mesma cópia)")
+        return True
+    
+    @traced('carga_csv')
     def load_csv_files(self, uploaded_files: List) -> bool:
         """Carrega arquivos CSV enviados pelo usuário"""
         try:
             dataframes = {}
+            uploads = [uploaded_file for uploaded_file in uploaded_files if uploaded_file.name.endswith('.csv')]
+            hashes = {id(upload): hash_upload(upload, self.parse_options) for upload in uploads}
+            key = dataset_key('csv', [(upload.name, hashes[id(upload)]) for upload in uploads], self.parse_options)
+            if self._attach_existing(key):
+                return True
+            self.dataset = Dataset()
             
-            for uploaded_file in uploaded_files:
+            for uploaded_file in uploads:
                 if uploaded_file.name.endswith('.csv'):
-                    # Lê o arquivo CSV
-                    df = pd.read_csv(uploaded_file, encoding='utf-8', sep=',')
-                    
-                    # Converte colunas de data se existirem
-                    date_columns = [col for col in df.columns if 'data' in col.lower() or 'date' in col.lower()]
-                    for col in date_columns:
-                        try:
-                            df[col] = pd.to_datetime(df[col], errors='coerce')
-                        except:
-                            pass
+                    # Lê o arquivo CSV (do cache em disco, se já conhecido)
+                    df, file_stats, _ = self._read_upload(uploaded_file, hashes[id(uploaded_file)])
                     
                     dataframes[uploaded_file.name] = df
                     
                     # Identifica o tipo de arquivo baseado no nome
-                    file_name_lower = uploaded_file.name.lower()
-                    if 'cabecalho' in file_name_lower or 'header' in file_name_lower or 'nf' in file_name_lower:
+                    table = file_table(uploaded_file.name)
+                    if table == 'cabecalho':
                         self.cabecalho_df = df
+                        self.cabecalho_stats = file_stats
                         st.success(f"✅ Arquivo de cabeçalho carregado: {uploaded_file.name}")
-                    elif 'itens' in file_name_lower or 'items' in file_name_lower or 'produtos' in file_name_lower:
+                    elif table == 'itens':
                         self.itens_df = df
+                        self.itens_stats = file_stats
                         st.success(f"✅ Arquivo de itens carregado: {uploaded_file.name}")
                     else:
                         # Se não conseguir identificar, assume como primeiro arquivo = cabeçalho
                         if self.cabecalho_df is None:
+                            table = 'cabecalho'
                             self.cabecalho_df = df
+                            self.cabecalho_stats = file_stats
                             st.info(f"📋 Assumindo como arquivo de cabeçalho: {uploaded_file.name}")
                         elif self.itens_df is None:
+                            table = 'itens'
                             self.itens_df = df
+                            self.itens_stats = file_stats
                             st.info(f"📦 Assumindo como arquivo de itens: {uploaded_file.name}")
+                    if table:
+                        self.ingested_files.append(
+                            IngestedFile(
+                                uploaded_file.name, hashes[id(uploaded_file)], getattr(uploaded_file, 'size', 0) or 0, table, len(df)
+                            )
+                        )
             
             # Se temos apenas um arquivo, vamos assumir que contém tudo
             if len(dataframes) == 1 and self.cabecalho_df is not None and self.itens_df is None:
                 self.itens_df = self.cabecalho_df.copy()
+                self.itens_stats = self.cabecalho_stats
                 st.info("ℹ️ Usando o mesmo arquivo para cabeçalho e itens")
             
             # Cria DataFrame combinado se temos ambos
             if self.cabecalho_df is not None and self.itens_df is not None:
-                # Tenta encontrar coluna de junção
-                common_columns = set(self.cabecalho_df.columns) & set(self.itens_df.columns)
-                if common_columns:
-                    join_column = list(common_columns)[0]
-                    st.info(f"🔗 Juntando tabelas pela coluna: {join_column}")
-                    try:
-                        self.combined_df = pd.merge(
-                            self.cabecalho_df, 
-                            self.itens_df, 
-                            on=join_column, 
-                            how='left'
-                        )
-                    except:
-                        self.combined_df = self.cabecalho_df.copy()
+                self._compact_frames()
+                
+                # Escolhe a chave de junção pela unicidade no cabeçalho e cobertura nos itens
+                self.join_key = None
+                if self.itens_df is self.cabecalho_df:
+                    self.combined_df = self.cabecalho_df
                 else:
-                    self.combined_df = self.cabecalho_df.copy()
+                    with self.tracer.span('juncao'):
+                        self.join_key = detect_join_key(self.cabecalho_df, self.itens_df)
+                        if self.join_key is not None:
+                            self.combined_df = CombinedView(self.cabecalho_df, self.itens_df, self.join_key.column)
+                    if self.join_key is not None:
+                        st.info(
+                            f"🔗 Juntando tabelas pela coluna: {self.join_key.column} "
+                            f"({self.join_key.overlap:.0%} dos itens com cabeçalho correspondente)"
+                        )
+                    else:
+                        st.warning("⚠️ Nenhuma coluna em comum identifica as notas de forma única; usando só o cabeçalho")
+                        self.combined_df = self.cabecalho_df
                 
+                self._check_memory_budget()
+                self._publish(key)
                 return True
             else:
                 st.error("❌ Não foi possível carregar os dados. Verifique os arquivos CSV.")
                 return False
                 
+        except MemoryLimitExceeded as e:
+            st.error(f"❌ Limite de memória atingido ao carregar arquivos CSV: {str(e)}")
+            return False
         except Exception as e:
             st.error(f"❌ Erro ao carregar arquivos CSV: {str(e)}")
             return False
     
-    def create_sample_data(self) -> bool:
-        """Cria dados de exemplo para demonstração"""
+    def pending_uploads(self, uploaded_files: List) -> List:
+        """Arquivos enviados que ainda não foram incorporados (pelo nome e tamanho; o conteúdo é conferido no anexo)"""
+        known = {(entry.name, entry.size) for entry in self.ingested_files}
+        return [
+            uploaded_file for uploaded_file in uploaded_files
+            if uploaded_file.name.endswith('.csv') and (uploaded_file.name, uploaded_file.size) not in known
+        ]
+    
+    @traced('anexacao')
+    def append_csv_files(self, uploaded_files: List) -> bool:
+        """Incorpora arquivos novos aos dados já carregados, sem reler os anteriores.
+
+        Arquivos com conteúdo já incorporado são ignorados e linhas cujas chaves
+        (NF no cabeçalho, NF + número do item nos itens) já existem são
+        descartadas pelo índice de hashes. Tabelas, visão combinada e
+        estatísticas são atualizadas somente com as linhas novas.
+        """
+        if self.cabecalho_df is None or self.itens_df is None:
+            return self.load_csv_files(uploaded_files)
+        
+        previous = self.dataset
         try:
-            # Dados de exemplo para cabeçalho das NFs
-            np.random.seed(42)  # Para reprodutibilidade
-            
-            cabecalho_data = {
-                'numero_nf': [f'NF{str(i).zfill(6)}' for i in range(1, 101)],
-                'fornecedor': np.random.choice(['Empresa Alpha Ltda', 'Beta Soluções SA', 'Gamma Tech Corp', 'Delta Serviços', 'Epsilon Materiais'], 100),
-                'data_emissao': pd.date_range('2024-01-01', periods=100, freq='D')[:100],
-                'valor_total': np.random.uniform(1000, 50000, 100).round(2),
-                'status': np.random.choice(['Pago', 'Pendente', 'Cancelado'], 100, p=[0.7, 0.2, 0.1]),
-                'categoria': np.random.choice(['Material de Escritório', 'Equipamentos de TI', 'Serviços de Consultoria', 'Material de Limpeza', 'Manutenção'], 100)
-            }
+            known = {entry.key for entry in self.ingested_files}
+            uploads = []
+            for uploaded_file in uploaded_files:
+                if not uploaded_file.name.endswith('.csv'):
+                    continue
+                key = hash_upload(uploaded_file, self.parse_options)
+                if key in known:
+                    st.caption(f"↩️ {uploaded_file.name}: conteúdo já incorporado, ignorado")
+                    continue
+                known.add(key)
+                uploads.append((uploaded_file, key))
+            if not uploads:
+                return True
             
-            # Dados de exemplo para itens das NFs
-            itens_data = []
-            for nf_num in range(1, 101):
-                num_itens = np.random.randint(1, 6)  # 1 a 5 itens por NF
-                for item_num in range(1, num_itens + 1):
-                    produto = np.random.choice(['Notebook Dell', 'Impressora HP', 'Mouse Óptico', 'Teclado Mecânico', 'Monitor 24"', 'Papel A4', 'Caneta Esferográfica'])
-                    quantidade = np.random.randint(1, 50)
-                    valor_unitario = np.random.uniform(10, 2000).round(2)
-                    
-                    itens_data.append({
-                        'numero_nf': f'NF{str(nf_num).zfill(6)}',
-                        'item_numero': item_num,
-                        'descricao': produto,
-                        'quantidade': quantidade,
-                        'valor_unitario': valor_unitario,
-                        'valor_total_item': (quantidade * valor_unitario).round(2),
-                        'unidade': np.random.choice(['UN', 'PC', 'KG', 'CX', 'LT'])
-                    })
-            
-            self.cabecalho_df = pd.DataFrame(cabecalho_data)
-            self.itens_df = pd.DataFrame(itens_data)
-            
-            # Cria DataFrame combinado
-            self.combined_df = pd.merge(
-                self.cabecalho_df, 
-                self.itens_df, 
-                on='numero_nf', 
-                how='left'
+            # O conjunto publicado não muda: o anexo gera um novo conjunto (que outra sessão pode já ter montado)
+            dataset_id = dataset_key('anexo', previous.key, [(upload.name, key) for upload, key in uploads])
+            if self._attach_existing(dataset_id):
+                return True
+            self.dataset = previous.draft()
+            
+            shared = self.itens_df is self.cabecalho_df
+            parts: Dict[str, List[pd.DataFrame]] = {}
+            staged: Dict[str, RowIndex] = {}
+            added: List[IngestedFile] = []
+            
+            for uploaded_file, key in uploads:
+                df, _, key = self._read_upload(uploaded_file, key)
+                
+                table = 'cabecalho' if shared else self._append_table(uploaded_file.name, df)
+                if table is None:
+                    st.warning(f"⚠️ {uploaded_file.name}: colunas diferentes das do cabeçalho e dos itens; arquivo ignorado")
+                    continue
+                
+                # Descarta linhas já carregadas (ou repetidas entre os arquivos deste anexo)
+                index, columns = self._row_index(table)
+                batch = staged.setdefault(table, RowIndex())
+                hashes = row_hashes(df, columns)
+                new = index.new_rows(hashes) & ~batch.contains(hashes)
+                batch.add(hashes[new])
+                parts.setdefault(table, []).append(df[new])
+                added.append(IngestedFile(
+                    uploaded_file.name, key, getattr(uploaded_file, 'size', 0) or 0, table,
+                    int(new.sum()), int(len(df) - new.sum()),
+                ))
+            
+            rows = {table: pd.concat(frames, ignore_index=True) for table, frames in parts.items()}
+            if not any(len(df) for df in rows.values()):
+                self.ingested_files.extend(added)
+                self._publish(dataset_id)
+                st.info("ℹ️ Nenhuma linha nova para incorporar")
+                return True
+            
+            # Estatísticas atualizadas em cópias: só passam a valer se as tabelas e a junção derem certo
+            with self.tracer.span('estatisticas'):
+                stats = {table: self._stats_for(table).copy() for table in rows}
+                for table, df in rows.items():
+                    stats[table].update(df)
+            
+            previous_fingerprint = self.dataset.fingerprint
+            current = {'cabecalho': self.cabecalho_df} if shared else {'cabecalho': self.cabecalho_df, 'itens': self.itens_df}
+            frames = append_frames(current, rows)
+            self.cabecalho_df = frames['cabecalho']
+            self.itens_df = frames['cabecalho'] if shared else frames['itens']
+            
+            if shared or self.join_key is None:
+                self.combined_df = self.cabecalho_df
+            else:
+                with self.tracer.span('juncao'):
+                    if isinstance(self.combined_df, CombinedView):
+                        self.combined_df = self.combined_df.extend(self.cabecalho_df, self.itens_df)
+                    else:
+                        self.combined_df = CombinedView(self.cabecalho_df, self.itens_df, self.join_key.column)
+            
+            for table, index in stats.items():
+                setattr(self, f"{table}_stats", index)
+            if shared:
+                self.itens_stats = self.cabecalho_stats
+            for table, index in staged.items():
+                for segment in index.segments:
+                    self.row_indexes[table].add(segment)
+            self.ingested_files.extend(added)
+            
+            # Impressão digital encadeada: só as linhas novas são lidas
+            if previous_fingerprint is not None:
+                digest = hashlib.sha256(previous_fingerprint.encode('utf-8'))
+                for table, df in sorted(rows.items()):
+                    digest.update(table.encode('utf-8'))
+                    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+                self.dataset.fingerprint = digest.hexdigest()
+            
+            for entry in added:
+                st.success(
+                    f"➕ {entry.name}: {entry.rows:,} linhas novas em {entry.table}"
+                    f" ({entry.duplicates:,} já existentes ignoradas)"
+                )
+            self._check_memory_budget()
+            self._publish(dataset_id)
+            return True
+            
+        except MemoryLimitExceeded as e:
+            self.dataset = previous
+            st.error(f"❌ Limite de memória atingido ao anexar arquivos CSV: {str(e)}")
+            return False
+        except Exception as e:
+            self.dataset = previous
+            st.error(f"❌ Erro ao anexar arquivos CSV: {str(e)}")
+            return False
+    
+    def _append_table(self, file_name: str, df: pd.DataFrame) -> Optional[str]:
+        """Tabela que recebe um arquivo anexado: a de mesmas colunas (o nome desempata)"""
+        matches = [
+            table for table, current in (('cabecalho', self.cabecalho_df), ('itens', self.itens_df))
+            if set(current.columns) == set(df.columns)
+        ]
+        if len(matches) > 1:
+            return file_table(file_name) or matches[0]
+        return matches[0] if matches else None
+    
+    def _row_index(self, table: str) -> Tuple[RowIndex, List[str]]:
+        """Índice de hashes das chaves da tabela, construído na primeira vez que é necessário"""
+        df = self.cabecalho_df if table == 'cabecalho' else self.itens_df
+        key = self.join_key.column if self.join_key is not None else None
+        columns = key_columns(df, key, items=table == 'itens')
+        if table not in self.row_indexes:
+            with self.tracer.span('indice_linhas', tabela=table):
+                self.row_indexes[table] = RowIndex.from_frame(df, columns)
+        return self.row_indexes[table], columns
+    
+    @traced('leitura_csv')
+    def _read_upload(self, uploaded_file, key: Optional[str] = None) -> Tuple[pd.DataFrame, FrameStats, str]:
+        """Lê um CSV enviado, reaproveitando o cache colunar quando o conteúdo já é conhecido.
+
+        Retorna também o hash do conteúdo, que identifica o arquivo entre as cargas.
+        """
+        start = time.perf_counter()
+        key = key or hash_upload(uploaded_file, self.parse_options)
+        cached = self.parse_cache.get(key)
+        
+        if cached is not None:
+            df, metadata = cached
+            file_stats = FrameStats.from_dict(metadata.get('stats', {}))
+            remaining_mb = self._remaining_memory_mb()
+            if remaining_mb and df.memory_usage(deep=True).sum() > remaining_mb * 1024 * 1024:
+                raise MemoryLimitExceeded(f"{uploaded_file.name} excede o limite de {self.max_memory_mb:.0f} MB")
+        else:
+            # Lê o arquivo CSV em blocos, convertendo as colunas de data pelo caminho
+            progress_bar = st.progress(0.0, text=f"📥 Lendo {uploaded_file.name}...")
+            timings: Dict[str, float] = {}
+            try:
+                df, file_stats, date_formats = read_csv_chunked(
+                    uploaded_file,
+                    chunksize=self.chunksize,
+                    max_memory_mb=self._remaining_memory_mb(),
+                    progress=lambda fraction, name=uploaded_file.name: progress_bar.progress(
+                        fraction, text=f"📥 Lendo {name}... {fraction:.0%}"
+                    ),
+                    timings=timings,
+                    **self.parse_options,
+                )
+            finally:
+                progress_bar.empty()
+            for stage, seconds in timings.items():
+                self.tracer.record(f"csv_{stage}", seconds, arquivo=uploaded_file.name)
+            
+            if self.parse_cache.enabled:
+                self.parse_cache.put(key, df, {
+                    'arquivo': uploaded_file.name,
+                    'stats': file_stats.to_dict(),
+                    'date_formats': date_formats,
+                })
+        
+        elapsed = time.perf_counter() - start
+        self.cache_events.append(CacheEvent(uploaded_file.name, key, cached is not None, elapsed))
+        if not self.parse_cache.enabled:
+            st.caption(f"📄 {uploaded_file.name}: lido em {elapsed:.2f}s (cache desativado)")
+        elif cached is not None:
+            st.caption(f"⚡ {uploaded_file.name}: carregado do cache em {elapsed:.3f}s")
+        else:
+            st.caption(f"🐢 {uploaded_file.name}: fora do cache, lido em {elapsed:.2f}s")
+        return df, file_stats, key
+    
+    def _remaining_memory_mb(self) -> Optional[float]:
+        """Memória ainda disponível para novos arquivos dentro do teto configurado"""
+        if not self.max_memory_mb:
+            return None
+        used = sum(memory_mb(df) for df in (self.cabecalho_df, self.itens_df))
+        return max(self.max_memory_mb - used, 1)
+    
+    def session_memory_mb(self) -> float:
+        """Memória ocupada pelas tabelas da sessão (cabeçalho, itens e índices da visão combinada)"""
+        return self.dataset.memory_mb()
+    
+    @traced('compactacao')
+    def _compact_frames(self) -> None:
+        """Converte textos repetidos em categorias (dicionários compartilhados) e reduz os tipos numéricos"""
+        if self.itens_stats is self.cabecalho_stats:
+            # Mesmo arquivo nos dois papéis: uma única cópia compactada basta
+            frames, self.compaction_report = compact_frames({'cabecalho': self.cabecalho_df})
+            self.cabecalho_df = self.itens_df = frames['cabecalho']
+        else:
+            frames, self.compaction_report = compact_frames({'cabecalho': self.cabecalho_df, 'itens': self.itens_df})
+            self.cabecalho_df, self.itens_df = frames['cabecalho'], frames['itens']
+        
+        report = self.compaction_report
+        st.caption(
+            f"🗜️ Tipos compactados: {report.total_before_mb:.1f} MB → {report.total_after_mb:.1f} MB "
+            f"({sum(map(len, report.categorical.values()))} colunas categóricas, "
+            f"{sum(map(len, report.downcast.values()))} numéricas reduzidas)"
+        )
+    
+    def _check_memory_budget(self) -> None:
+        """Garante que as tabelas da sessão, incluindo a combinada, cabem no teto de memória"""
+        if not self.max_memory_mb:
+            return
+        used = self.session_memory_mb()
+        if used > self.max_memory_mb:
+            self.combined_df = None
+            raise MemoryLimitExceeded(
+                f"as tabelas da sessão ocupam {used:.0f} MB, acima do limite de {self.max_memory_mb:.0f} MB"
             )
+    
+    @traced('dados_exemplo')
+    def create_sample_data(self, spec: Optional[SyntheticSpec] = None) -> bool:
+        """Cria dados de exemplo para demonstração (100 NFs por padrão; veja `SyntheticSpec`)"""
+        try:
+            spec = spec or SyntheticSpec()
+            key = dataset_key('exemplo', asdict(spec))
+            if self._attach_existing(key):
+                return True
+            self.dataset = Dataset()
+            
+            # Cabeçalho e itens gerados de forma vetorizada, com semente fixa para reprodutibilidade
+            with self.tracer.span('geracao'):
+                self.cabecalho_df, self.itens_df = generate_frames(spec)
+            with self.tracer.span('estatisticas'):
+                self.cabecalho_stats = FrameStats.from_frame(self.cabecalho_df)
+                self.itens_stats = FrameStats.from_frame(self.itens_df)
+            self._compact_frames()
+            
+            # Cria a visão combinada
+            with self.tracer.span('juncao'):
+                self.join_key = detect_join_key(self.cabecalho_df, self.itens_df)
+                self.combined_df = CombinedView(self.cabecalho_df, self.itens_df, self.join_key.column)
+            self._check_memory_budget()
+            self._publish(key)
             
             st.success("✅ Dados de exemplo criados com sucesso!")
             return True
             
+        except MemoryLimitExceeded as e:
+            st.error(f"❌ Limite de memória atingido ao criar dados de exemplo: {str(e)}")
+            return False
         except Exception as e:
             st.error(f"❌ Erro ao criar dados de exemplo: {str(e)}")
             return False
@@ -154,13 +678,13 @@ class OpenRouterAgent:
         info = []
         
         if self.cabecalho_df is not None:
-            info.append(f"DADOS DE CABEÇALHO ({self.cabecalho_df.shape[0]} registros):")
+            info.append(f"DADOS DE CABEÇALHO ({self._stats_for('cabecalho').rows} registros):")
             info.append(f"Colunas: {', '.join(self.cabecalho_df.columns.tolist())}")
             info.append(f"Tipos de dados: {dict(self.cabecalho_df.dtypes)}")
             info.append("")
             
         if self.itens_df is not None:
-            info.append(f"DADOS DE ITENS ({self.itens_df.shape[0]} registros):")
+            info.append(f"DADOS DE ITENS ({self._stats_for('itens').rows} registros):")
             info.append(f"Colunas: {', '.join(self.itens_df.columns.tolist())}")
             info.append(f"Tipos de dados: {dict(self.itens_df.dtypes)}")
             info.append("")
@@ -176,114 +700,466 @@ class OpenRouterAgent:
         samples = []
         
         if self.cabecalho_df is not None:
-            samples.append("AMOSTRA DO CABEÇALHO (primeiras 3 linhas):")
-            samples.append(self.cabecalho_df.head(3).to_string())
+            samples.append("AMOSTRA DO CABEÇALHO (3 linhas representativas):")
+            samples.append(stratified_sample(self.cabecalho_df, 3, self._stats_for('cabecalho')).to_string())
             samples.append("")
             
         if self.itens_df is not None:
-            samples.append("AMOSTRA DOS ITENS (primeiras 3 linhas):")
-            samples.append(self.itens_df.head(3).to_string())
+            samples.append("AMOSTRA DOS ITENS (3 linhas representativas):")
+            samples.append(stratified_sample(self.itens_df, 3, self._stats_for('itens')).to_string())
             samples.append("")
             
         return "\n".join(samples)
     
-    def query_data(self, question: str) -> str:
-        """Consulta os dados usando OpenRouter"""
-        if self.cabecalho_df is None:
-            return "❌ Nenhum dado carregado. Carregue os arquivos CSV primeiro."
+    def _chat_payload(
+        self, messages: List[Dict[str, str]], max_tokens: int = 2000, model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": 0.1,
+            "max_tokens": max_tokens
+        }
+    
+    def _post_chat(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 2000,
+        route: Optional[RouteDecision] = None,
+    ) -> Tuple[str, Dict[str, int]]:
+        """Envia mensagens ao OpenRouter e retorna o texto da resposta e o uso de tokens
         
-        try:
-            # Prepara o contexto com informações dos dados
-            data_info = self.get_data_info()
-            data_sample = self.get_data_sample()
-            
-            # Calcula estatísticas básicas
-            stats = self.get_basic_stats()
-            
-            # Prompt para o modelo
-            prompt = f"""
-            Você é um analista de dados especializado em notas fiscais. Você tem acesso aos seguintes dados:
+        Com `route`, usa o modelo da rota (com duplicata, se pedida) e, se o
+        modelo rápido falhar ou responder vazio, repete com o modelo escolhido.
+        """
+        if route is None:
+            result = self.model_client.chat(self._chat_payload(messages, max_tokens))
+            return result['choices'][0]['message']['content'], result.get('usage') or {}
+        
+        while True:
+            payload = self._chat_payload(messages, max_tokens, route.model)
+            client = self._client_for(route.model)
+            try:
+                result = self.router.chat(client, payload, route) if route.hedge else client.chat(payload)
+            except OpenRouterAPIError as e:
+                if not route.routed:
+                    raise
+                self._escalate(route, f"erro {e.status_code}")
+                continue
+            text = result['choices'][0]['message']['content']
+            if not text.strip() and route.routed:
+                self._escalate(route, "resposta vazia")
+                continue
+            return text, result.get('usage') or {}
+    
+    def _stream_events(
+        self,
+        messages: List[Dict[str, Any]],
+        route: RouteDecision,
+        cancel_event: Optional[threading.Event],
+    ) -> Iterator[Dict[str, Any]]:
+        """Eventos de streaming do modelo da rota; se o modelo rápido falhar antes do primeiro trecho, escalona"""
+        while True:
+            client = self._client_for(route.model)
+            payload = self._chat_payload(messages, model=route.model)
+            if route.hedge:
+                events = self.router.stream(client, payload, route, cancel_event, client.timeout)
+            else:
+                events = client.stream_chat(payload, cancel_event=cancel_event, chunk_timeout=client.timeout)
+            started = False
+            try:
+                for event in events:
+                    started = True
+                    yield event
+                return
+            except OpenRouterAPIError as e:
+                if started or not route.routed:
+                    raise
+                self._escalate(route, f"erro {e.status_code}")
+    
+    def _escalate(self, route: RouteDecision, reason: str) -> None:
+        route.escalate(reason)
+        self.router.record_escalation()
+    
+    def _context_tables(self) -> Dict[str, Tuple[pd.DataFrame, FrameStats]]:
+        tables = {}
+        if self.cabecalho_df is not None:
+            tables['cabecalho'] = (self.cabecalho_df, self._stats_for('cabecalho'))
+        # Com um único arquivo, cabeçalho e itens compartilham o mesmo índice: descreve uma vez só
+        if self.itens_df is not None and self.itens_stats is not self.cabecalho_stats:
+            tables['itens'] = (self.itens_df, self._stats_for('itens'))
+        return tables
+    
+    def _build_context_prompt(self, question: str) -> BuiltPrompt:
+        """Monta o prompt com estrutura, estatísticas e amostra dos dados dentro do orçamento de tokens
+        
+        As colunas mais relevantes para a pergunta vêm primeiro em cada seção; as
+        menos relevantes são omitidas quando o orçamento não comporta todas.
+        """
+        builder = PromptBuilder(self.model, self.prompt_token_budget)
+        return builder.build(CONTEXT_PROMPT_TEMPLATE, context_sections(question, self._context_tables()), question=question)
+    
+    def _build_system_prompt(self) -> BuiltPrompt:
+        """Contexto dos dados sem a pergunta (colunas na ordem original), igual em todas as rodadas da conversa"""
+        key = (self.dataset.key or self.data_fingerprint(), self.model, self.prompt_token_budget)
+        if self._system_prompt is None or self._system_prompt[0] != key:
+            builder = PromptBuilder(self.model, self.prompt_token_budget)
+            self._system_prompt = (key, builder.build(SYSTEM_CONTEXT_TEMPLATE, context_sections('', self._context_tables())))
+        return self._system_prompt[1]
+    
+    def _system_message(self, text: str) -> Dict[str, Any]:
+        """Mensagem de sistema com o contexto, marcada para o cache de prompt nos provedores que exigem"""
+        if self.model.startswith(PROMPT_CACHE_CONTROL_PREFIXES):
+            return {"role": "system", "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]}
+        return {"role": "system", "content": text}
+    
+    def _summarize_turns(self, summary: str, turns: List[Turn]) -> str:
+        """Resumo das rodadas antigas feito pelo modelo (o resumo anterior entra junto)"""
+        conversa = (f"RESUMO ANTERIOR:\n{summary}\n\n" if summary else "") + turns_text(turns)
+        # Resumir é tarefa simples: com roteamento, vai para o modelo rápido
+        local = is_local_model(self.model)
+        model = self.router.fast_model_for(self.model) if self.routing and not local else self.model
+        route = RouteDecision('', self.model, model, SIMPLE, ['resumo da conversa'], hedge=self.hedging and not local)
+        with self.tracer.span('resumo_conversa', rodadas=len(turns), modelo=model):
+            text, _ = self._post_chat(
+                [{"role": "user", "content": SUMMARY_PROMPT_TEMPLATE.format(conversa=conversa)}], max_tokens=400, route=route
+            )
+        return text
+    
+    def _remember(self, conversation: Optional[Conversation], question: str, answer: str) -> None:
+        if conversation is not None:
+            conversation.add(question, answer, self._summarize_turns)
+    
+    @staticmethod
+    def _cache_mode(local_execution: bool, conversation: Optional[Conversation]) -> str:
+        """Modo da consulta na chave do cache; no modo conversa, a resposta depende também do histórico"""
+        mode = 'local' if local_execution else 'contexto'
+        return f"{mode}:conversa:{conversation.digest()}" if conversation is not None else mode
+    
+    def _cache_key(self, model: str, question: str, mode: str) -> str:
+        return self.response_cache.make_key(model, self.data_fingerprint(), question, mode)
+    
+    def _cached_answer(self, route: RouteDecision, question: str, mode: str):
+        """Resposta em cache do modelo da rota ou, se a pergunta foi roteada, do modelo escolhido
 
-            {data_info}
+        As respostas ficam guardadas com o modelo que respondeu de fato; uma
+        pergunta que já escalonou do modelo rápido está na chave do escolhido.
+        As duas chaves contam como uma única busca nas estatísticas do cache.
+        """
+        models = [route.model, route.requested_model] if route.routed else [route.model]
+        return self.response_cache.get(*(self._cache_key(model, question, mode) for model in models))
+    
+    def get_query_tables(self) -> Dict[str, pd.DataFrame]:
+        """Tabelas disponíveis para os planos de consulta locais"""
+        tables = {'cabecalho': self.cabecalho_df, 'itens': self.itens_df, 'combinado': self.combined_df}
+        return {name: df for name, df in tables.items() if df is not None}
+    
+    def _plan_and_execute(
+        self, question: str, route: Optional[RouteDecision] = None
+    ) -> Tuple[Dict[str, Any], pd.DataFrame, Dict[str, int]]:
+        """Pede ao modelo um plano de consulta e o executa localmente sobre os dados completos"""
+        tables = self.get_query_tables()
+        
+        plan_prompt = f"""
+            Você é um analista de dados especializado em notas fiscais e traduz perguntas em planos de consulta.
+            Tabelas disponíveis:
 
-            ESTATÍSTICAS BÁSICAS:
-            {stats}
+            {describe_tables(tables, self.get_column_stats())}
 
-            AMOSTRA DOS DADOS:
-            {data_sample}
+            PERGUNTA DO USUÁRIO: {question}
+            {PLAN_INSTRUCTIONS}
+            """
+        plan_messages = [{"role": "user", "content": plan_prompt}]
+        plan_text, plan_usage = self._post_chat(plan_messages, max_tokens=500, route=route)
+        try:
+            plan = validate_plan(parse_plan(plan_text), tables)
+        except QueryPlanError as e:
+            if route is None or not route.routed:
+                raise
+            # O modelo rápido não montou um plano válido: o modelo escolhido tenta de novo
+            self._escalate(route, f"plano inválido ({e})")
+            plan_text, retry_usage = self._post_chat(plan_messages, max_tokens=500, route=route)
+            plan_usage = _sum_usage(plan_usage, retry_usage)
+            plan = validate_plan(parse_plan(plan_text), tables)
+        return plan, execute_plan(plan, tables), plan_usage
+    
+    def _build_narration_prompt(self, question: str, plan: Dict[str, Any], result: pd.DataFrame) -> str:
+        """Monta o prompt que pede ao modelo para narrar o resultado exato da consulta"""
+        tables = self.get_query_tables()
+        return f"""
+            Você é um analista de dados especializado em notas fiscais.
+            A pergunta do usuário foi respondida executando a consulta abaixo sobre a base completa
+            ({len(tables[plan['tabela']])} registros na tabela {plan['tabela']}).
 
             PERGUNTA DO USUÁRIO: {question}
 
-            Por favor, analise os dados e responda à pergunta de forma clara e detalhada. 
-            Se necessário, forneça cálculos, percentuais e insights relevantes.
-            Se a pergunta envolver análises específicas que requerem cálculos, explique o raciocínio.
-            
-            Formato da resposta:
-            - Responda de forma direta e clara
-            - Use dados específicos quando possível
-            - Forneça insights adicionais se relevante
-            - Use formatação em markdown para melhor legibilidade
+            CONSULTA EXECUTADA:
+            {json.dumps(plan, ensure_ascii=False, default=str)}
+
+            RESULTADO EXATO:
+            {result.to_string(index=False) if not result.empty else "(nenhum registro encontrado)"}
+
+            Responda à pergunta usando apenas os números do resultado, de forma clara e direta.
+            Use formatação em markdown para melhor legibilidade.
             """
+    
+    def _prepare_answer(
+        self,
+        question: str,
+        local_execution: bool,
+        conversation: Optional[Conversation] = None,
+        route: Optional[RouteDecision] = None,
+    ) -> Tuple[List[Dict[str, Any]], QueryResult]:
+        """Monta as mensagens da resposta final; no modo local, gera e executa o plano antes
+        
+        No modo conversa, o contexto dos dados vai em uma mensagem de sistema fixa,
+        seguida do histórico e da pergunta nova: entre rodadas só o fim do prompt muda.
+        """
+        query = QueryResult(question, '', route=route)
+        stage_start = time.perf_counter()
+        content = None
+        if local_execution:
+            try:
+                query.plan, query.result, query.usage = self._plan_and_execute(question, route)
+                query.stages['plano'] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+                content = self._build_narration_prompt(question, query.plan, query.result)
+            except QueryPlanError as e:
+                query.plan_error = str(e)
+                query.stages['plano'] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+        
+        if conversation is not None:
+            system = self._build_system_prompt()
+            content = content or question
+            messages = [self._system_message(system.text), *conversation.messages(), {"role": "user", "content": content}]
+            query.prefix_tokens = system.tokens
+            query.prompt_tokens = system.tokens + conversation.history_tokens + count_tokens(content, self.model)
+        elif content is not None:
+            messages = [{"role": "user", "content": content}]
+            query.prompt_tokens = count_tokens(content, self.model)
+        else:
+            # Prompt para o modelo
+            prompt = self._build_context_prompt(question)
+            messages = [{"role": "user", "content": prompt.text}]
+            query.prompt_tokens = prompt.tokens
+        query.stages['prompt'] = time.perf_counter() - stage_start
+        return messages, query
+    
+    def query_data(self, question: str, local_execution: bool = False) -> str:
+        """Consulta os dados usando OpenRouter
+        
+        Com `local_execution`, o modelo gera um plano de consulta que é executado
+        localmente sobre os dados completos; se o plano for inválido, volta ao
+        modo de contexto (estrutura + estatísticas + amostra).
+        """
+        query = self.answer_question(question, local_execution)
+        self.last_plan = query.plan
+        self.last_result = query.result
+        self.last_plan_error = query.plan_error
+        self.last_from_cache = query.from_cache
+        return query.answer
+    
+    def answer_question(
+        self,
+        question: str,
+        local_execution: bool = False,
+        conversation: Optional[Conversation] = None,
+    ) -> QueryResult:
+        """Responde uma pergunta sem alterar o estado do agente (seguro para uso concorrente)
+        
+        Com `conversation`, as rodadas anteriores vão junto no prompt e a nova
+        rodada é acrescentada a ela.
+        """
+        with self.tracer.span(
+            'consulta', modo='local' if local_execution else 'contexto', conversa=conversation is not None
+        ) as span:
+            query = self._answer_question(question, local_execution, conversation)
+            for stage, seconds in query.stages.items():
+                self.tracer.record(stage, seconds)
+            span.attrs.update(self._trace_attrs(query))
+        return query
+    
+    @staticmethod
+    def _trace_attrs(query) -> Dict[str, Any]:
+        """Atributos de uma consulta (QueryResult ou AnswerStream) gravados nas métricas"""
+        if query.from_cache:
+            status = 'cache'
+        elif not query.ok:
+            status = 'erro'
+        elif getattr(query, 'cancelled', False):
+            status = 'cancelada'
+        else:
+            status = 'ok'
+        attrs = {'status': status, 'usage': query.usage, 'prompt_tokens_contados': query.prompt_tokens}
+        if query.route is not None:
+            attrs.update(query.route.attrs())
+        return attrs
+    
+    def _answer_question(
+        self, question: str, local_execution: bool, conversation: Optional[Conversation] = None
+    ) -> QueryResult:
+        if self.cabecalho_df is None:
+            return QueryResult(question, "❌ Nenhum dado carregado. Carregue os arquivos CSV primeiro.", ok=False)
+        
+        route = self.route(question)
+        try:
+            mode = self._cache_mode(local_execution, conversation)
+            cached = self._cached_answer(route, question, mode)
+            if cached is not None:
+                self._remember(conversation, question, cached.answer)
+                return QueryResult(question, cached.answer, from_cache=True, route=route)
             
-            # Faz a requisição para o OpenRouter
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 2000
-            }
+            start = time.perf_counter()
+            messages, query = self._prepare_answer(question, local_execution, conversation, route)
+            model_start = time.perf_counter()
+            query.answer, usage = self._post_chat(messages, route=route)
+            query.stages['modelo'] = time.perf_counter() - model_start
+            query.usage = _sum_usage(query.usage, usage)
             
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
+            query.latency = time.perf_counter() - start
+            # Chave do modelo que respondeu: a rota pode ter escalonado do modelo rápido para o escolhido
+            self.response_cache.put(
+                self._cache_key(route.model, question, mode), query.answer, query.latency, query.usage.get('total_tokens', 0)
             )
+            self._remember(conversation, question, query.answer)
+            return query
             
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                return f"❌ Erro na API do OpenRouter: {response.status_code} - {response.text}"
+        except OpenRouterAPIError as e:
+            return QueryResult(question, f"❌ Erro na API do OpenRouter: {e.status_code} - {e.text}", ok=False, route=route)
+        except Exception as e:
+            return QueryResult(question, f"❌ Erro ao processar consulta: {str(e)}", ok=False, route=route)
+    
+    def query_many(self, questions: List[str], local_execution: bool = False) -> List[QueryResult]:
+        """Responde várias perguntas em paralelo, mantendo a ordem de entrada"""
+        with ThreadPoolExecutor(max_workers=self.model_client.max_workers) as pool:
+            return list(pool.map(lambda question: self.answer_question(question, local_execution), questions))
+    
+    def stream_answer(
+        self,
+        question: str,
+        local_execution: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        conversation: Optional[Conversation] = None,
+    ) -> "AnswerStream":
+        """Responde em streaming: iterar o resultado produz o texto conforme o modelo gera"""
+        stream = AnswerStream(question)
+        stream.chunks = self._stream_chunks(stream, local_execution, cancel_event, conversation)
+        return stream
+    
+    def _stream_chunks(
+        self,
+        stream: "AnswerStream",
+        local_execution: bool,
+        cancel_event: Optional[threading.Event],
+        conversation: Optional[Conversation] = None,
+    ) -> Iterator[str]:
+        if self.cabecalho_df is None:
+            stream.ok = False
+            yield "❌ Nenhum dado carregado. Carregue os arquivos CSV primeiro."
+            return
+        
+        start = time.perf_counter()
+        stream.route = route = self.route(stream.question)
+        try:
+            mode = self._cache_mode(local_execution, conversation)
+            cached = self._cached_answer(route, stream.question, mode)
+            if cached is not None:
+                stream.from_cache = True
+                stream.first_token_latency = time.perf_counter() - start
+                self._remember(conversation, stream.question, cached.answer)
+                yield cached.answer
+                return
+            
+            messages, query = self._prepare_answer(stream.question, local_execution, conversation, route)
+            stream.plan, stream.result, stream.plan_error = query.plan, query.result, query.plan_error
+            stream.prompt_tokens, stream.prefix_tokens = query.prompt_tokens, query.prefix_tokens
+            stream.stages = query.stages
+            model_start = time.perf_counter()
+            usage = query.usage
+            parts = []
+            for event in self._stream_events(messages, route, cancel_event):
+                if event.get('usage'):
+                    usage = _sum_usage(usage, event['usage'])
+                choices = event.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    if stream.first_token_latency is None:
+                        stream.first_token_latency = time.perf_counter() - start
+                    parts.append(delta)
+                    yield delta
+            
+            stream.usage = usage
+            stream.stages['modelo'] = time.perf_counter() - model_start
+            stream.latency = time.perf_counter() - start
+            stream.cancelled = cancel_event is not None and cancel_event.is_set()
+            if not stream.cancelled:
+                self.response_cache.put(
+                    self._cache_key(route.model, stream.question, mode), ''.join(parts), stream.latency, usage.get('total_tokens', 0)
+                )
+                self._remember(conversation, stream.question, ''.join(parts))
                 
+        except OpenRouterAPIError as e:
+            stream.ok = False
+            yield f"❌ Erro na API do OpenRouter: {e.status_code} - {e.text}"
         except Exception as e:
-            return f"❌ Erro ao processar consulta: {str(e)}"
+            stream.ok = False
+            yield f"❌ Erro ao processar consulta: {str(e)}"
+        finally:
+            # Também registra respostas interrompidas (o gerador é fechado sem chegar ao fim)
+            self.tracer.record_trace(
+                'consulta', time.perf_counter() - start, stream.stages,
+                modo='local' if local_execution else 'contexto', streaming=True, conversa=conversation is not None,
+                **self._trace_attrs(stream),
+            )
+    
+    async def aquery_data(self, question: str, local_execution: bool = False) -> QueryResult:
+        """Versão assíncrona de `answer_question`, executada no pool do cliente HTTP"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.model_client.executor, self.answer_question, question, local_execution)
+    
+    def data_fingerprint(self) -> str:
+        """Impressão digital dos dados carregados (muda sempre que os dados mudam)"""
+        # Calculada uma vez por conjunto, mesmo depois de publicado (é derivada dos dados, que não mudam)
+        if self.dataset.fingerprint is None:
+            digest = hashlib.sha256()
+            for df in (self.cabecalho_df, self.itens_df):
+                if df is None:
+                    digest.update(b"-")
+                    continue
+                digest.update(repr(list(zip(df.columns, map(str, df.dtypes)))).encode('utf-8'))
+                digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+            self.dataset.fingerprint = digest.hexdigest()
+        return self.dataset.fingerprint
     
     def get_basic_stats(self) -> str:
-        """Calcula estatísticas básicas dos dados"""
+        """Estatísticas básicas dos dados, servidas pelo índice de estatísticas"""
         stats = []
         
         try:
             if self.cabecalho_df is not None:
+                index = self._stats_for('cabecalho')
                 stats.append("ESTATÍSTICAS DO CABEÇALHO:")
-                stats.append(f"- Total de registros: {len(self.cabecalho_df)}")
+                stats.append(f"- Total de registros: {index.rows}")
                 
                 # Colunas numéricas
-                numeric_cols = self.cabecalho_df.select_dtypes(include=[np.number]).columns
-                for col in numeric_cols:
-                    stats.append(f"- {col}: média={self.cabecalho_df[col].mean():.2f}, min={self.cabecalho_df[col].min():.2f}, max={self.cabecalho_df[col].max():.2f}")
+                stats.extend(self._numeric_stats_lines(index))
                 
                 # Colunas categóricas
-                categorical_cols = self.cabecalho_df.select_dtypes(include=['object']).columns
-                for col in categorical_cols[:3]:  # Limita a 3 colunas
-                    unique_count = self.cabecalho_df[col].nunique()
-                    stats.append(f"- {col}: {unique_count} valores únicos")
+                for col in index.of_kind('text')[:3]:  # Limita a 3 colunas
+                    column = index.get(col)
+                    prefix = "" if column.distinct_is_exact else "~"
+                    stats.append(f"- {col}: {prefix}{column.distinct} valores únicos")
                 
                 stats.append("")
             
             if self.itens_df is not None:
+                index = self._stats_for('itens')
                 stats.append("ESTATÍSTICAS DOS ITENS:")
-                stats.append(f"- Total de registros: {len(self.itens_df)}")
+                stats.append(f"- Total de registros: {index.rows}")
                 
                 # Colunas numéricas
-                numeric_cols = self.itens_df.select_dtypes(include=[np.number]).columns
-                for col in numeric_cols:
-                    stats.append(f"- {col}: média={self.itens_df[col].mean():.2f}, min={self.itens_df[col].min():.2f}, max={self.itens_df[col].max():.2f}")
+                stats.extend(self._numeric_stats_lines(index))
                 
                 stats.append("")
                 
@@ -292,36 +1168,439 @@ class OpenRouterAgent:
         
         return "\n".join(stats)
     
+    def _stats_for(self, table: str) -> FrameStats:
+        """Índice de estatísticas da tabela, reconstruído se estiver desatualizado"""
+        df = self.cabecalho_df if table == 'cabecalho' else self.itens_df
+        attr = f"{table}_stats"
+        index = getattr(self, attr)
+        if index is None or index.rows != len(df):
+            index = FrameStats.from_frame(df)
+            # Direto no conjunto, mesmo publicado: como a impressão digital, é derivado de dados que não mudam
+            setattr(self.dataset, attr, index)
+        return index
+    
+    def _numeric_stats_lines(self, index: FrameStats) -> List[str]:
+        """Linhas de média/mínimo/máximo das colunas numéricas"""
+        lines = []
+        for col in index.of_kind('numeric'):
+            column = index.get(col)
+            if column.count:
+                lines.append(f"- {col}: média={column.mean:.2f}, min={column.min:.2f}, max={column.max:.2f}")
+        return lines
+    
+    @traced('resumo')
     def get_data_summary(self) -> Dict[str, Any]:
         """Retorna um resumo dos dados carregados"""
         if self.cabecalho_df is None:
             return {}
         
+        cabecalho_index = self._stats_for('cabecalho')
         summary = {
-            'total_registros_cabecalho': len(self.cabecalho_df),
+            'total_registros_cabecalho': cabecalho_index.rows,
             'total_registros_itens': len(self.itens_df) if self.itens_df is not None else 0,
             'colunas_cabecalho': list(self.cabecalho_df.columns),
             'colunas_itens': list(self.itens_df.columns) if self.itens_df is not None else []
         }
         
         # Adiciona estatísticas específicas se as colunas existirem
-        try:
-            if 'valor_total' in self.cabecalho_df.columns:
-                summary['valor_total_geral'] = self.cabecalho_df['valor_total'].sum()
-                summary['valor_medio'] = self.cabecalho_df['valor_total'].mean()
-                
-            if 'fornecedor' in self.cabecalho_df.columns:
-                summary['fornecedores_unicos'] = self.cabecalho_df['fornecedor'].nunique()
-                
-            if 'data_emissao' in self.cabecalho_df.columns:
-                summary['periodo'] = {
-                    'inicio': self.cabecalho_df['data_emissao'].min(),
-                    'fim': self.cabecalho_df['data_emissao'].max()
-                }
-        except:
-            pass
+        valor_total = cabecalho_index.get('valor_total')
+        if valor_total is not None and valor_total.kind == 'numeric' and valor_total.count:
+            summary['valor_total_geral'] = valor_total.sum
+            summary['valor_medio'] = valor_total.mean
+        
+        fornecedor = cabecalho_index.get('fornecedor')
+        if fornecedor is not None:
+            summary['fornecedores_unicos'] = fornecedor.distinct
+        
+        data_emissao = cabecalho_index.get('data_emissao')
+        if data_emissao is not None and data_emissao.min is not None:
+            summary['periodo'] = {
+                'inicio': data_emissao.min,
+                'fim': data_emissao.max
+            }
             
         return summary
+    
+    @traced('graficos')
+    def get_chart_data(self) -> ChartData:
+        """Agregações dos gráficos (tamanho limitado, independente do número de linhas)"""
+        if self.cabecalho_df is None:
+            return ChartData()
+        return build_chart_data(self.cabecalho_df, self.itens_df)
+    
+    def get_column_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estatísticas por coluna de cada tabela (usadas na descrição para os planos de consulta)"""
+        column_stats = {}
+        if self.cabecalho_df is not None:
+            column_stats['cabecalho'] = self._stats_for('cabecalho').columns
+        if self.itens_df is not None:
+            column_stats['itens'] = self._stats_for('itens').columns
+        if self.combined_df is not None:
+            column_stats['combinado'] = {**column_stats.get('itens', {}), **column_stats.get('cabecalho', {})}
+        return column_stats
+
+def render_query_result(query: QueryResult):
+    """Mostra a resposta de uma consulta e os detalhes da execução local"""
+    if query.from_cache:
+        st.caption("⚡ Resposta obtida do cache (os dados não mudaram desde a última vez que esta pergunta foi feita)")
+    st.markdown(query.answer)
+    render_query_details(query)
+
+def render_streamed_answer(stream: AnswerStream):
+    """Mostra a resposta em streaming, atualizando o texto a cada trecho recebido"""
+    # Clicar em qualquer botão interrompe a execução atual do script e, com ela, a conexão
+    st.button("⏹️ Cancelar", key="cancelar_streaming")
+    placeholder = st.empty()
+    with st.spinner("🤖 Analisando dados..."):
+        for _ in stream:
+            placeholder.markdown(stream.text + "▌")
+    placeholder.markdown(stream.text)
+    
+    if stream.from_cache:
+        st.caption("⚡ Resposta obtida do cache (os dados não mudaram desde a última vez que esta pergunta foi feita)")
+    elif stream.ok and stream.first_token_latency is not None:
+        st.caption(f"⏱️ Primeiro trecho em {stream.first_token_latency:.2f}s · resposta completa em {stream.latency:.2f}s")
+    render_query_details(stream)
+
+def render_query_details(query):
+    """Detalhes da execução local (plano e resultado) ou o motivo de o plano ter sido descartado"""
+    if query.prompt_tokens:
+        details = []
+        if query.prefix_tokens:
+            details.append(f"{query.prefix_tokens:,} no contexto fixo")
+        if query.usage.get('cached_tokens'):
+            details.append(f"{query.usage['cached_tokens']:,} reaproveitados do cache de prompt")
+        st.caption(f"🧾 Prompt enviado: {query.prompt_tokens:,} tokens" + (f" ({', '.join(details)})" if details else ""))
+    route = query.route
+    if route is not None and not query.from_cache and (route.routed or route.escalations or route.hedges):
+        notes = [f"pergunta {route.complexity}"]
+        notes += [f"escalonada ({escalation})" for escalation in route.escalations]
+        if route.hedges:
+            notes.append("duplicata respondeu primeiro" if route.hedges_won else "duplicata disparada, original venceu")
+        st.caption(f"🧭 Respondida por {route.model} · " + " · ".join(notes))
+    if query.plan is not None:
+        with st.expander("🧮 Consulta executada localmente"):
+            st.json(query.plan)
+            st.dataframe(query.result, use_container_width=True)
+    elif query.plan_error:
+        st.caption(f"ℹ️ Plano de consulta descartado ({query.plan_error}); resposta baseada no resumo dos dados.")
+
+def render_metrics_panel(tracer: Tracer):
+    """Tempos por etapa, tokens e memória, com exportação em JSON e no formato do Prometheus"""
+    snapshot = tracer.snapshot()
+    if not snapshot['etapas']:
+        return
+    
+    st.markdown("### Métricas do Pipeline")
+    last_query = tracer.last_trace('consulta')
+    if last_query:
+        root = last_query[-1]
+        stages = " · ".join(f"{span.name} {span.seconds:.2f}s" for span in last_query[:-1])
+        st.markdown(
+            f"- **Última consulta**: {root.seconds:.2f}s ({root.attrs.get('status', '?')})"
+            + (f" — {stages}" if stages else "")
+        )
+    tokens = snapshot['tokens']
+    memoria_atual = 'n/d' if snapshot['memoria_atual_mb'] is None else f"{snapshot['memoria_atual_mb']:.0f} MB"
+    st.markdown(f"""
+    - **Tokens (OpenRouter)**: {tokens.get('prompt_tokens', 0):,} no prompt / {tokens.get('completion_tokens', 0):,} na resposta
+    - **Tokens de prompt contados localmente**: {tokens.get('prompt_contados', 0):,}
+    - **Memória do processo**: {memoria_atual} agora, pico de {snapshot['pico_memoria_mb']:.0f} MB desde o início
+    """)
+    st.dataframe(
+        pd.DataFrame([
+            {
+                'etapa': name,
+                'execuções': totals['count'],
+                'média (s)': totals['seconds'] / totals['count'],
+                'máximo (s)': totals['max_seconds'],
+                'última (s)': totals['last_seconds'],
+            }
+            for name, totals in sorted(snapshot['etapas'].items())
+        ]),
+        use_container_width=True,
+        hide_index=True,
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "⬇️ Métricas (JSON)",
+            json.dumps([asdict(span) for span in tracer.recent], ensure_ascii=False, default=str),
+            file_name="metricas.json",
+            mime="application/json",
+        )
+    with col2:
+        st.download_button(
+            "⬇️ Métricas (Prometheus)",
+            tracer.prometheus_text(),
+            file_name="metricas.prom",
+            mime="text/plain",
+        )
+    if tracer.log_path:
+        st.caption(f"Log JSON contínuo em `{tracer.log_path}`")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_data_summary(dataset_id: str, _agent: "OpenRouterAgent") -> Dict[str, Any]:
+    """Resumo dos dados memoizado pela chave de conteúdo do conjunto (igual para todas as sessões com os mesmos dados)"""
+    return _agent.get_data_summary()
+
+@fragment
+def render_data_summary(agent: "OpenRouterAgent"):
+    """Métricas e colunas dos dados carregados (não reexecuta enquanto o usuário só digita a pergunta)"""
+    summary = cached_data_summary(agent.dataset.key or agent.data_fingerprint(), agent)
+
+    st.subheader("📈 Resumo dos Dados")
+
+    # Métricas
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📄 Registros Cabeçalho", summary.get('total_registros_cabecalho', 0))
+    with col2:
+        st.metric("📦 Registros Itens", summary.get('total_registros_itens', 0))
+    with col3:
+        st.metric("🏢 Fornecedores", summary.get('fornecedores_unicos', 'N/A'))
+    with col4:
+        valor_total = summary.get('valor_total_geral', 0)
+        if valor_total > 0:
+            st.metric("💰 Valor Total", f"R$ {valor_total:,.2f}")
+        else:
+            st.metric("💰 Valor Total", "N/A")
+
+    # Informações das colunas
+    with st.expander("📋 Informações das Colunas"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write("**Colunas do Cabeçalho:**")
+            for col in summary.get('colunas_cabecalho', []):
+                st.write(f"• {col}")
+        with col2:
+            if summary.get('colunas_itens'):
+                st.write("**Colunas dos Itens:**")
+                for col in summary.get('colunas_itens', []):
+                    st.write(f"• {col}")
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_chart_data(dataset_id: str, _agent: "OpenRouterAgent") -> ChartData:
+    """Agregações dos gráficos memoizadas pela chave de conteúdo do conjunto"""
+    return _agent.get_chart_data()
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def cached_chart_figures(dataset_id: str, _agent: "OpenRouterAgent") -> Dict[str, Any]:
+    """Figuras prontas por conjunto (montar uma figura com plotly.express custa dezenas de ms)"""
+    # plotly só é importado quando os gráficos são abertos pela primeira vez
+    import plotly.express as px
+    
+    charts = cached_chart_data(dataset_id, _agent)
+    figures = {}
+    if charts.daily is not None:
+        title = "Faturamento por dia"
+        if charts.daily_points > len(charts.daily):
+            title += f" ({len(charts.daily):,} de {charts.daily_points:,} dias, LTTB)"
+        figures['diario'] = px.line(charts.daily, x='data', y='faturamento', title=title)
+        figures['mensal'] = px.bar(charts.monthly, x='mes', y='faturamento', hover_data=['notas'], title="Faturamento por mês")
+    if charts.suppliers is not None:
+        figures['fornecedores'] = px.bar(
+            charts.suppliers, x='faturamento', y='fornecedor', orientation='h', hover_data=['notas'],
+            title="Fornecedores por faturamento",
+        ).update_yaxes(autorange='reversed')
+    for column, distribution in charts.distributions.items():
+        figures[column] = px.pie(distribution, names=column, values='notas', title=f"Notas por {column}")
+    return figures
+
+@fragment
+def render_charts_panel(agent: "OpenRouterAgent"):
+    """Gráficos de faturamento, fornecedores e distribuições, montados só quando pedidos"""
+    if not st.checkbox("📊 Mostrar gráficos", value=False, key="mostrar_graficos"):
+        return
+    
+    figures = cached_chart_figures(agent.dataset.key or agent.data_fingerprint(), agent)
+    if not figures:
+        st.info("Nenhuma coluna reconhecida para os gráficos (data_emissao, valor_total, fornecedor, status, categoria).")
+        return
+    
+    with agent.tracer.span('renderizacao', graficos=len(figures)):
+        rows = [['diario', 'mensal'], ['fornecedores'], [name for name in figures if name not in ('diario', 'mensal', 'fornecedores')]]
+        for names in rows:
+            names = [name for name in names if name in figures]
+            if not names:
+                continue
+            for slot, name in zip(st.columns(len(names)), names):
+                with slot:
+                    st.plotly_chart(figures[name], use_container_width=True)
+
+def session_conversation(agent: "OpenRouterAgent") -> Conversation:
+    """Conversa da sessão; recomeça quando outro conjunto de dados é carregado"""
+    conversation = st.session_state.get('conversation')
+    if conversation is None or conversation.context_key != agent.dataset.key:
+        conversation = Conversation(agent.dataset.key, agent.model)
+        st.session_state.conversation = conversation
+    conversation.model = agent.model
+    return conversation
+
+def render_conversation(conversation: Conversation):
+    """Rodadas anteriores da conversa (o resumo das mais antigas fica recolhido)"""
+    if st.button("🧹 Nova conversa", key="nova_conversa"):
+        conversation.clear()
+    if conversation.summary:
+        with st.expander(f"📝 Resumo das {conversation.summarized_turns} primeiras perguntas"):
+            st.markdown(conversation.summary)
+    for turn in conversation.turns:
+        with st.chat_message("user"):
+            st.markdown(turn.question)
+        with st.chat_message("assistant"):
+            st.markdown(turn.answer)
+    if len(conversation):
+        st.caption(f"💬 {len(conversation)} perguntas nesta conversa · histórico com {conversation.history_tokens:,} tokens")
+
+@fragment
+def render_query_section(agent: "OpenRouterAgent", local_execution: bool, streaming: bool):
+    """Pergunta, botão de análise e respostas; digitar ou clicar aqui reexecuta só esta seção"""
+    conversation_mode = st.checkbox(
+        "💬 Modo conversa",
+        value=False,
+        key="modo_conversa",
+        help="Cada pergunta leva junto as anteriores; o contexto dos dados fica fixo no início do prompt"
+    )
+    conversation = session_conversation(agent) if conversation_mode and agent.dataset.key else None
+    if conversation is not None:
+        render_conversation(conversation)
+
+    # Campo de entrada para pergunta
+    question = st.text_area(
+        "✍️ Digite sua pergunta:",
+        height=100,
+        placeholder="Ex: Qual é o fornecedor com maior faturamento e qual o valor total?"
+    )
+
+    multiple_questions = st.checkbox(
+        "🔀 Várias perguntas (uma por linha)",
+        value=False,
+        help="As perguntas são enviadas em paralelo e respondidas na ordem em que foram escritas"
+    )
+
+    # Botão para executar consulta
+    if st.button("🚀 Analisar", type="primary"):
+        if not question.strip():
+            st.warning("⚠️ Por favor, digite uma pergunta.")
+        elif not st.session_state.data_loaded:
+            st.error("❌ Carregue os dados primeiro.")
+        else:
+            if multiple_questions:
+                # Perguntas paralelas não dependem umas das outras: ficam fora da conversa
+                questions = [line.strip() for line in question.splitlines() if line.strip()]
+                with st.spinner(f"🤖 Analisando {len(questions)} perguntas em paralelo..."):
+                    results = agent.query_many(questions, local_execution=local_execution)
+            elif streaming:
+                st.subheader("📋 Resposta da Análise:")
+                with agent.tracer.span('renderizacao', streaming=True):
+                    render_streamed_answer(
+                        agent.stream_answer(question, local_execution=local_execution, conversation=conversation)
+                    )
+                results = []
+            else:
+                with st.spinner("🤖 Analisando dados..."):
+                    results = [agent.answer_question(question, local_execution=local_execution, conversation=conversation)]
+
+            if results:
+                st.subheader("📋 Resposta da Análise:")
+            with agent.tracer.span('renderizacao', respostas=len(results)):
+                for query in results:
+                    if len(results) > 1:
+                        st.markdown(f"#### ❓ {query.question}")
+                    render_query_result(query)
+
+@fragment
+def render_technical_info(agent: "OpenRouterAgent", selected_model: str):
+    """Configuração, memória, caches e (sob demanda) métricas do pipeline"""
+    st.markdown(f"""
+    ### Configuração Atual
+    - **Modelo**: {selected_model}
+    - **API**: OpenRouter
+    - **Dados Carregados**: {'✅ Sim' if st.session_state.data_loaded else '❌ Não'}
+
+    ### Como Funciona
+    1. **Upload**: Arquivos CSV são carregados e processados
+    2. **Análise**: O modelo de IA analisa a estrutura dos dados
+    3. **Consulta**: Perguntas em linguagem natural são processadas
+    4. **Resposta**: O modelo retorna análises detalhadas e insights
+
+    ### Formatos de Arquivo Suportados
+    - Arquivos CSV com encoding UTF-8
+    - Separador de campos: vírgula (,)
+    - Suporte a múltiplos arquivos
+    - Detecção automática de colunas de data
+    """)
+
+    if agent.compaction_report is not None:
+        report = agent.compaction_report
+        limit = f"{agent.max_memory_mb:.0f} MB" if agent.max_memory_mb else "sem limite"
+        st.markdown(f"""
+    ### Memória dos Dados
+    - **Antes da compactação**: {report.total_before_mb:.1f} MB
+    - **Depois da compactação**: {report.total_after_mb:.1f} MB
+    - **Sessão (incluindo a tabela combinada)**: {agent.session_memory_mb():.1f} MB de {limit}
+    - **Colunas categóricas**: {', '.join(sorted({col for cols in report.categorical.values() for col in cols})) or 'nenhuma'}
+    """)
+
+    store_stats = agent.store.stats()
+    st.markdown(f"""
+    ### Dados Compartilhados entre Sessões
+    - **Conjuntos em memória**: {store_stats['conjuntos']} ({store_stats['memoria_mb']:.1f} MB)
+    - **Sessões usando este conjunto**: {agent.store.references(agent.dataset.key)}
+    - **Referências no total / conjuntos ociosos**: {store_stats['sessoes']} / {store_stats['ociosos']}
+    """)
+
+    if is_local_model(agent.model):
+        local_stats = agent.model_client.stats()
+        load = f"{local_stats['carga_s']:.1f}s" if local_stats['carga_s'] is not None else "ainda não carregado"
+        reused, computed = local_stats['tokens_reaproveitados'], local_stats['tokens_processados']
+        st.markdown(f"""
+    ### Modelo Local
+    - **Modelo**: {local_stats['modelo']} (carga: {load})
+    - **Lotes processados**: {local_stats['lotes']}
+    - **Janela de contexto**: {local_stats['janela_contexto'] or '—'} tokens ({local_stats['prompts_cortados']} prompts cortados)
+    - **Prefixo em cache (KV)**: {local_stats['prefixo_acertos']} acertos / {local_stats['prefixo_falhas']} falhas — {reused:,} de {reused + computed:,} tokens de prompt reaproveitados
+    """)
+
+    router_stats = agent.router.stats()
+    if router_stats['perguntas_simples'] or router_stats['perguntas_complexas']:
+        models = ", ".join(f"{model} ({count})" for model, count in router_stats['modelos'].items())
+        p95 = ", ".join(f"{model} {seconds:.2f}s" for model, seconds in router_stats['p95_s'].items() if seconds is not None)
+        st.markdown(f"""
+    ### Roteamento de Modelos
+    - **Perguntas simples / complexas**: {router_stats['perguntas_simples']} / {router_stats['perguntas_complexas']}
+    - **Modelos usados**: {models}
+    - **Escalonadas para o modelo selecionado**: {router_stats['escalonamentos']}
+    - **Duplicatas (vencedoras / disparadas)**: {router_stats['duplicatas_vencedoras']} / {router_stats['duplicatas']} — {router_stats['economia_s']:.1f}s economizados até o primeiro trecho
+    - **p95 até o primeiro trecho**: {p95 or 'sem amostras suficientes'}
+    """)
+
+    cache_stats = agent.response_cache.stats
+    st.markdown(f"""
+    ### Cache de Respostas
+    - **Acertos / Falhas**: {cache_stats.hits} / {cache_stats.misses} ({cache_stats.hit_rate:.0%} de acerto)
+    - **Tempo economizado**: {cache_stats.saved_seconds:.1f}s
+    - **Tokens economizados**: {cache_stats.saved_tokens:,}
+    """)
+
+    # Opcional: monta a tabela de etapas e os arquivos de exportação (JSON/Prometheus) só quando pedido
+    if st.checkbox("📊 Mostrar métricas do pipeline", value=False, key="mostrar_metricas"):
+        render_metrics_panel(agent.tracer)
+
+    ingested_files = agent.ingested_files
+    if ingested_files:
+        st.markdown("### Arquivos Incorporados")
+        for entry in ingested_files:
+            duplicates = f", {entry.duplicates:,} repetidas ignoradas" if entry.duplicates else ""
+            st.markdown(f"- **{entry.name}** ({entry.table}): {entry.rows:,} linhas{duplicates} — {entry.loaded_at}")
+
+    cache_events = agent.cache_events
+    if cache_events:
+        st.markdown("### Cache de Arquivos")
+        for event in cache_events:
+            status = "⚡ acerto" if event.hit else "🐢 falha"
+            st.markdown(f"- **{event.file_name}**: {status} — {event.seconds:.3f}s")
 
 def main():
     st.set_page_config(
@@ -351,7 +1630,8 @@ def main():
             "openai/gpt-4o",
             "openai/gpt-4o-mini",
             "google/gemini-pro",
-            "meta-llama/llama-3.1-8b-instruct"
+            "meta-llama/llama-3.1-8b-instruct",
+            f"{LOCAL_MODEL_PREFIX}{DEFAULT_LOCAL_MODEL}",
         ]
         
         selected_model = st.selectbox(
@@ -378,11 +1658,41 @@ def main():
             help="Marque para usar dados sintéticos para demonstração"
         )
         
+        # Execução local das consultas sobre a base completa
+        local_execution = st.checkbox(
+            "⚡ Executar consultas localmente",
+            value=True,
+            help="O modelo gera um plano de consulta que é executado sobre todos os dados; "
+                 "somente o resultado é enviado de volta para a resposta"
+        )
+        
+        # Exibe a resposta conforme o modelo gera (Server-Sent Events)
+        streaming = st.checkbox(
+            "📡 Resposta em streaming",
+            value=True,
+            help="Mostra a resposta palavra por palavra, sem esperar a resposta completa"
+        )
+        
+        # Perguntas simples (contagens, totais, rankings) vão para um modelo rápido e barato
+        routing = st.checkbox(
+            "🧭 Roteamento automático de modelos",
+            value=DEFAULT_ROUTING,
+            help="Consultas diretas vão para um modelo rápido (claude-3-haiku, gpt-4o-mini); análises e "
+                 "respostas que falharem no modelo rápido ficam com o modelo selecionado"
+        )
+        
+        hedging = st.checkbox(
+            "🏁 Duplicar requisições lentas",
+            value=DEFAULT_HEDGING,
+            help="Se a resposta não começar até o p95 histórico do modelo, a requisição é enviada de novo "
+                 "e a que responder primeiro é usada"
+        )
+        
         st.markdown("---")
         st.info("💡 Você pode obter sua API key do OpenRouter em: https://openrouter.ai/")
     
-    # Verifica se a API key foi fornecida
-    if not openrouter_api_key:
+    # Verifica se a API key foi fornecida (o modelo local não precisa dela)
+    if not openrouter_api_key and not is_local_model(selected_model):
         st.warning("⚠️ Por favor, forneça sua OpenRouter API Key na barra lateral para continuar.")
         return
     
@@ -391,6 +1701,9 @@ def main():
         st.session_state.agent = OpenRouterAgent(openrouter_api_key, selected_model)
         st.session_state.current_api_key = openrouter_api_key
         st.session_state.data_loaded = False
+    st.session_state.agent.model = selected_model
+    st.session_state.agent.routing = routing
+    st.session_state.agent.hedging = hedging
     
     # Carregamento de dados
     if not st.session_state.data_loaded:
@@ -407,40 +1720,17 @@ def main():
         else:
             st.info("📁 Faça upload dos arquivos CSV ou marque a opção para usar dados de exemplo.")
             return
+    elif uploaded_files:
+        # Arquivos enviados depois da carga (por exemplo, a exportação do dia seguinte) são anexados
+        pending = st.session_state.agent.pending_uploads(uploaded_files)
+        if pending and st.sidebar.button(f"➕ Anexar {len(pending)} arquivo(s) novo(s)"):
+            with st.spinner("🔄 Anexando arquivos novos..."):
+                st.session_state.agent.append_csv_files(pending)
     
     # Mostra resumo dos dados
     if st.session_state.data_loaded:
-        summary = st.session_state.agent.get_data_summary()
-        
-        st.subheader("📈 Resumo dos Dados")
-        
-        # Métricas
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("📄 Registros Cabeçalho", summary.get('total_registros_cabecalho', 0))
-        with col2:
-            st.metric("📦 Registros Itens", summary.get('total_registros_itens', 0))
-        with col3:
-            st.metric("🏢 Fornecedores", summary.get('fornecedores_unicos', 'N/A'))
-        with col4:
-            valor_total = summary.get('valor_total_geral', 0)
-            if valor_total > 0:
-                st.metric("💰 Valor Total", f"R$ {valor_total:,.2f}")
-            else:
-                st.metric("💰 Valor Total", "N/A")
-        
-        # Informações das colunas
-        with st.expander("📋 Informações das Colunas"):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.write("**Colunas do Cabeçalho:**")
-                for col in summary.get('colunas_cabecalho', []):
-                    st.write(f"• {col}")
-            with col2:
-                if summary.get('colunas_itens'):
-                    st.write("**Colunas dos Itens:**")
-                    for col in summary.get('colunas_itens', []):
-                        st.write(f"• {col}")
+        render_data_summary(st.session_state.agent)
+        render_charts_panel(st.session_state.agent)
     
     # Interface principal de consulta
     st.header("💬 Faça sua Análise")
@@ -467,50 +1757,11 @@ def main():
         - Qual categoria representa maior gasto?
         """)
     
-    # Campo de entrada para pergunta
-    question = st.text_area(
-        "✍️ Digite sua pergunta:",
-        height=100,
-        placeholder="Ex: Qual é o fornecedor com maior faturamento e qual o valor total?"
-    )
-    
-    # Botão para executar consulta
-    if st.button("🚀 Analisar", type="primary"):
-        if not question.strip():
-            st.warning("⚠️ Por favor, digite uma pergunta.")
-        elif not st.session_state.data_loaded:
-            st.error("❌ Carregue os dados primeiro.")
-        else:
-            with st.spinner("🤖 Analisando dados..."):
-                response = st.session_state.agent.query_data(question)
-            
-            st.subheader("📋 Resposta da Análise:")
-            st.markdown(response)
-    
-    # Histórico (opcional)
-    if 'query_history' not in st.session_state:
-        st.session_state.query_history = []
+    render_query_section(st.session_state.agent, local_execution, streaming)
     
     # Seção de informações técnicas
     with st.expander("🔧 Informações Técnicas"):
-        st.markdown(f"""
-        ### Configuração Atual
-        - **Modelo**: {selected_model}
-        - **API**: OpenRouter
-        - **Dados Carregados**: {'✅ Sim' if st.session_state.data_loaded else '❌ Não'}
-        
-        ### Como Funciona
-        1. **Upload**: Arquivos CSV são carregados e processados
-        2. **Análise**: O modelo de IA analisa a estrutura dos dados
-        3. **Consulta**: Perguntas em linguagem natural são processadas
-        4. **Resposta**: O modelo retorna análises detalhadas e insights
-        
-        ### Formatos de Arquivo Suportados
-        - Arquivos CSV com encoding UTF-8
-        - Separador de campos: vírgula (,)
-        - Suporte a múltiplos arquivos
-        - Detecção automática de colunas de data
-        """)
+        render_technical_info(st.session_state.agent, selected_model)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,328 @@
+"""Medição por etapa do pipeline (tempo, memória, tokens) com exportação em JSON e no formato Prometheus"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage, a memória de pico não é medida
+    resource = None
+
+DEFAULT_METRICS_LOG = os.getenv(
+    "METRICS_LOG",
+    os.path.join(os.path.expanduser("~"), ".cache", "analisador_nf", "metricas.jsonl"),
+)
+DEFAULT_PROMETHEUS_FILE = os.getenv("METRICS_PROM_FILE", "")
+DEFAULT_METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ENABLED = os.getenv("ENABLE_METRICS", "True").lower() in ("1", "true", "yes", "sim")
+RECENT_SPANS = 2000
+METRIC_PREFIX = "analisador_nf"
+
+_current_trace: ContextVar[Optional[str]] = ContextVar("current_trace", default=None)
+
+
+def peak_rss_mb() -> float:
+    """Pico de memória residente desde o início do processo, em MB (ru_maxrss nunca diminui)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """Memória residente atual do processo, em MB (None se não houver como medir)"""
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil  # opcional: fora do Linux, é a única forma de ler a memória atual
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+@dataclass
+class Span:
+    """Uma etapa medida: duração, memória do processo e atributos (tokens, arquivo etc.)
+
+    `rss_mb` e `rss_delta_mb` vêm da memória residente atual lida no início e
+    no fim da etapa (picos transitórios no meio dela não aparecem);
+    `lifetime_peak_mb` é o pico desde o início do processo, e
+    `lifetime_peak_growth_mb` só é positivo quando a etapa levou o processo a
+    um novo pico.
+    """
+    name: str
+    trace: str
+    started_at: float
+    seconds: float = 0.0
+    rss_mb: Optional[float] = None
+    rss_delta_mb: Optional[float] = None
+    lifetime_peak_mb: float = 0.0
+    lifetime_peak_growth_mb: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    root: bool = False
+
+
+@dataclass
+class StageTotals:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_seconds: float = 0.0
+
+
+class Tracer:
+    """Registra etapas do pipeline e acumula totais por etapa e de tokens.
+
+    `span` é um gerenciador de contexto; etapas abertas dentro de outra
+    compartilham o mesmo `trace` (uma consulta, uma carga de arquivos). Ao
+    fechar uma etapa raiz, o trace é gravado no log JSON e o arquivo do
+    Prometheus é reescrito, se configurados.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = DEFAULT_METRICS_LOG,
+        prometheus_path: Optional[str] = DEFAULT_PROMETHEUS_FILE,
+        enabled: bool = METRICS_ENABLED,
+    ):
+        self.log_path = log_path or None
+        self.prometheus_path = prometheus_path or None
+        self.enabled = enabled
+        self.recent: Deque[Span] = deque(maxlen=RECENT_SPANS)
+        self.stages: Dict[str, StageTotals] = {}
+        self.tokens: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self._pending: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    class _SpanContext:
+        def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+            self.tracer = tracer
+            parent = _current_trace.get()
+            self.span = Span(name, parent or uuid.uuid4().hex[:12], time.time(), attrs=attrs, root=parent is None)
+
+        def __enter__(self) -> Span:
+            self._token = _current_trace.set(self.span.trace)
+            self._start = time.perf_counter()
+            self._rss = current_rss_mb()
+            self._peak = peak_rss_mb()
+            return self.span
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.span.seconds = time.perf_counter() - self._start
+            self.span.rss_mb = current_rss_mb()
+            if self.span.rss_mb is not None and self._rss is not None:
+                self.span.rss_delta_mb = self.span.rss_mb - self._rss
+            self.span.lifetime_peak_mb = peak_rss_mb()
+            self.span.lifetime_peak_growth_mb = max(0.0, self.span.lifetime_peak_mb - self._peak)
+            if exc_type is not None:
+                self.span.attrs['erro'] = exc_type.__name__
+            _current_trace.reset(self._token)
+            self.tracer._finish(self.span)
+
+    def span(self, name: str, **attrs: Any) -> "Tracer._SpanContext":
+        return Tracer._SpanContext(self, name, attrs)
+
+    def record(self, name: str, seconds: float, **attrs: Any) -> Span:
+        """Registra uma etapa medida por fora (por exemplo, o tempo de um generator de streaming)"""
+        parent = _current_trace.get()
+        span = Span(
+            name, parent or uuid.uuid4().hex[:12], time.time() - seconds, seconds,
+            rss_mb=current_rss_mb(), lifetime_peak_mb=peak_rss_mb(), attrs=attrs, root=parent is None,
+        )
+        self._finish(span)
+        return span
+
+    def record_trace(self, name: str, seconds: float, stages: Dict[str, float], **attrs: Any) -> Span:
+        """Registra uma etapa raiz medida por fora junto com as subetapas (etapa -> segundos)"""
+        token = _current_trace.set(uuid.uuid4().hex[:12])
+        try:
+            for stage, stage_seconds in stages.items():
+                self.record(stage, stage_seconds)
+            trace = _current_trace.get()
+        finally:
+            _current_trace.reset(token)
+        span = Span(
+            name, trace, time.time() - seconds, seconds,
+            rss_mb=current_rss_mb(), lifetime_peak_mb=peak_rss_mb(), attrs=attrs, root=True,
+        )
+        self._finish(span)
+        return span
+
+    def _finish(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            totals = self.stages.setdefault(span.name, StageTotals())
+            totals.count += 1
+            totals.seconds += span.seconds
+            totals.max_seconds = max(totals.max_seconds, span.seconds)
+            totals.last_seconds = span.seconds
+            for key, value in (span.attrs.get('usage') or {}).items():
+                if isinstance(value, (int, float)):
+                    self.tokens[key] = self.tokens.get(key, 0) + int(value)
+            if 'prompt_tokens_contados' in span.attrs:
+                self.tokens['prompt_contados'] = self.tokens.get('prompt_contados', 0) + int(span.attrs['prompt_tokens_contados'])
+            if 'status' in span.attrs:
+                self.requests[span.attrs['status']] = self.requests.get(span.attrs['status'], 0) + 1
+            self.recent.append(span)
+            trace = self._pending.setdefault(span.trace, [])
+            trace.append(span)
+            if not span.root:
+                return
+            finished = self._pending.pop(span.trace)
+        self._export(finished)
+
+    def last_trace(self, root_name: Optional[str] = None) -> List[Span]:
+        """Etapas do trace raiz mais recente (opcionalmente, de um nome de raiz específico)"""
+        with self._lock:
+            spans = list(self.recent)
+        for span in reversed(spans):
+            if span.root and (root_name is None or span.name == root_name):
+                return [item for item in spans if item.trace == span.trace]
+        return []
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'etapas': {name: asdict(totals) for name, totals in self.stages.items()},
+                'tokens': dict(self.tokens),
+                'requisicoes': dict(self.requests),
+                'memoria_atual_mb': current_rss_mb(),
+                'pico_memoria_mb': peak_rss_mb(),
+            }
+
+    def _export(self, spans: List[Span]) -> None:
+        try:
+            if self.log_path:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as log:
+                    for span in spans:
+                        log.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+            if self.prometheus_path:
+                self.write_prometheus(self.prometheus_path)
+        except OSError:
+            pass  # métricas nunca devem derrubar uma consulta
+
+    def prometheus_text(self) -> str:
+        """Totais no formato texto de exposição do Prometheus"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds Tempo gasto em cada etapa do pipeline",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+        ]
+        for name, totals in sorted(snapshot['etapas'].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{name}"}} {totals["seconds"]:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{name}"}} {totals["count"]}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_seconds_max Maior duração observada de cada etapa",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds_max gauge",
+        ]
+        for name, totals in sorted(snapshot['etapas'].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_max{{stage="{name}"}} {totals["max_seconds"]:.6f}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_tokens_total Tokens por tipo (uso informado pelo OpenRouter e prompts contados localmente)",
+            f"# TYPE {METRIC_PREFIX}_tokens_total counter",
+        ]
+        for kind, value in sorted(snapshot['tokens'].items()):
+            lines.append(f'{METRIC_PREFIX}_tokens_total{{type="{kind}"}} {value}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_requests_total Consultas por status",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter",
+        ]
+        for status, value in sorted(snapshot['requisicoes'].items()):
+            lines.append(f'{METRIC_PREFIX}_requests_total{{status="{status}"}} {value}')
+        if snapshot['memoria_atual_mb'] is not None:
+            lines += [
+                f"# HELP {METRIC_PREFIX}_rss_bytes Memória residente atual do processo",
+                f"# TYPE {METRIC_PREFIX}_rss_bytes gauge",
+                f"{METRIC_PREFIX}_rss_bytes {int(snapshot['memoria_atual_mb'] * 1024 * 1024)}",
+            ]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_peak_rss_bytes Pico de memória residente desde o início do processo",
+            f"# TYPE {METRIC_PREFIX}_peak_rss_bytes gauge",
+            f"{METRIC_PREFIX}_peak_rss_bytes {int(snapshot['pico_memoria_mb'] * 1024 * 1024)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Grava o texto do Prometheus de forma atômica (para o textfile collector do node_exporter)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as output:
+            output.write(self.prometheus_text())
+        os.replace(temporary, path)
+
+    def serve_prometheus(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Expõe `/metrics` em uma thread de fundo (uma única vez por tracer)"""
+        if self._server is not None:
+            return self._server
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                data = tracer.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+def traced(name: str) -> Callable:
+    """Mede um método de um objeto que tenha o atributo `tracer`"""
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_shared_tracer: Optional[Tracer] = None
+_shared_lock = threading.Lock()
+
+
+def shared_tracer() -> Tracer:
+    """Instância única no processo; sobe o endpoint `/metrics` se METRICS_PORT estiver definido"""
+    global _shared_tracer
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Tracer()
+            if DEFAULT_METRICS_PORT and _shared_tracer.enabled:
+                try:
+                    _shared_tracer.serve_prometheus(DEFAULT_METRICS_PORT)
+                except OSError:
+                    pass  # porta ocupada: segue apenas com o log e o arquivo
+        return _shared_tracer
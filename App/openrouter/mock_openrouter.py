@@ -0,0 +1,210 @@
+"""Servidor local que imita a API de chat do OpenRouter, para testes e benchmarks
+
+Uso:
+    python mock_openrouter.py --port 8999 --delay 0.2 --fail-first 1
+
+e aponte o agente para ele com OPENROUTER_BASE_URL=http://127.0.0.1:8999/api/v1/chat/completions
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+CHAT_PATH = "/api/v1/chat/completions"
+
+
+class MockConfig:
+    """Comportamento configurável do servidor (atraso, falhas iniciais e resposta fixa)
+
+    `model_delays` soma um atraso por modelo; `slow_every`/`slow_delay`
+    atrasam uma a cada N requisições, para simular a cauda de latência.
+    """
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        fail_first: int = 0,
+        fail_status: int = 429,
+        retry_after: Optional[float] = 0.1,
+        answer: str = "Resposta simulada.",
+        chunk_delay: float = 0.0,
+        model_delays: Optional[Dict[str, float]] = None,
+        slow_every: int = 0,
+        slow_delay: float = 0.0,
+    ):
+        self.delay = delay
+        self.model_delays = model_delays or {}
+        self.slow_every = slow_every
+        self.slow_delay = slow_delay
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.answer = answer
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def delay_for(self, request_number: int, model: Optional[str]) -> float:
+        delay = self.delay + self.model_delays.get(model or '', 0.0)
+        if self.slow_every and request_number % self.slow_every == 0:
+            delay += self.slow_delay
+        return delay
+
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # mantém a conexão aberta entre requisições (keep-alive)
+    config: MockConfig = MockConfig()
+
+    def log_message(self, format, *args):  # silencia o log padrão do http.server
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path != CHAT_PATH:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            request_number = config.requests
+
+        if request_number <= config.fail_first:
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+            self._send_json(config.fail_status, {"error": {"message": "falha simulada"}}, headers)
+            return
+
+        time.sleep(config.delay_for(request_number, payload.get("model")))
+        prompt = " ".join(str(message.get("content", "")) for message in payload.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(config.answer) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        if payload.get("stream"):
+            self._send_stream(request_number, payload.get("model"), usage)
+            return
+
+        self._send_json(200, {
+            "id": f"mock-{request_number}",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": config.answer}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, request_number: int, model: Optional[str], usage: dict) -> None:
+        """Responde em Server-Sent Events, uma palavra por evento, como o OpenRouter com stream=true"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+            words = self.config.answer.split(" ")
+            for index, word in enumerate(words):
+                time.sleep(self.config.chunk_delay)
+                delta = word if index == 0 else f" {word}"
+                event = {
+                    "id": f"mock-{request_number}",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            final = {
+                "id": f"mock-{request_number}",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente cancelou a resposta no meio do caminho
+            self.close_connection = True
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, **options) -> ThreadingHTTPServer:
+    """Cria o servidor com uma configuração própria (`options` vão para MockConfig)"""
+    handler = type("ConfiguredHandler", (MockOpenRouterHandler,), {"config": MockConfig(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **options) -> Tuple[ThreadingHTTPServer, str]:
+    """Sobe o servidor em uma thread de fundo; retorna o servidor e a URL de chat"""
+    server = make_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{CHAT_PATH}"
+
+
+def parse_model_delays(entries) -> Dict[str, float]:
+    """Converte entradas "modelo=segundos" em um dicionário"""
+    delays = {}
+    for entry in entries:
+        model, _, seconds = entry.rpartition("=")
+        delays[model] = float(seconds)
+    return delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado da API do OpenRouter")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--delay", type=float, default=0.0, help="atraso por resposta, em segundos")
+    parser.add_argument("--fail-first", type=int, default=0, help="quantas requisições iniciais falham")
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--answer", default="Resposta simulada.")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="atraso entre eventos no modo streaming")
+    parser.add_argument("--model-delay", action="append", default=[], metavar="MODELO=SEGUNDOS",
+                        help="atraso extra para um modelo (pode repetir)")
+    parser.add_argument("--slow-every", type=int, default=0, help="a cada N requisições, uma é lenta")
+    parser.add_argument("--slow-delay", type=float, default=0.0, help="atraso extra das requisições lentas")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        delay=args.delay,
+        fail_first=args.fail_first,
+        fail_status=args.fail_status,
+        retry_after=args.retry_after,
+        answer=args.answer,
+        chunk_delay=args.chunk_delay,
+        model_delays=parse_model_delays(args.model_delay),
+        slow_every=args.slow_every,
+        slow_delay=args.slow_delay,
+    )
+    print(f"Servidor simulado em http://{args.host}:{args.port}{CHAT_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
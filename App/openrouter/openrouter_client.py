@@ -0,0 +1,225 @@
+"""Cliente HTTP do OpenRouter: conexões reaproveitadas, novas tentativas e limite de taxa"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
+DEFAULT_RATE_LIMIT = float(os.getenv("OPENROUTER_RATE_LIMIT", "5"))  # requisições por segundo
+DEFAULT_BURST = int(os.getenv("OPENROUTER_BURST", "10"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+DEFAULT_MAX_WORKERS = int(os.getenv("OPENROUTER_MAX_WORKERS", "4"))
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+# Status que valem uma nova tentativa (limite de taxa e falhas temporárias do servidor)
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class OpenRouterAPIError(Exception):
+    """Resposta de erro (status diferente de 200) da API do OpenRouter"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class TokenBucket:
+    """Limitador de taxa do lado do cliente (token bucket) seguro entre threads"""
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(capacity or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Bloqueia até haver uma ficha disponível; retorna o tempo esperado"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Interpreta o cabeçalho Retry-After (segundos ou data HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenRouterClient:
+    """Camada HTTP usada pelo agente para falar com o OpenRouter.
+
+    Mantém uma `requests.Session` com pool de conexões keep-alive, repete
+    requisições com backoff exponencial com jitter (respeitando Retry-After),
+    limita a taxa de envio e oferece caminhos concorrentes via pool de threads
+    (`submit`) e asyncio (`achat`).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = 30,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        rate_limit: Optional[float] = DEFAULT_RATE_LIMIT,
+        burst: Optional[int] = DEFAULT_BURST,
+        pool_size: int = 10,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_workers = max_workers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            **(extra_headers or {}),
+        })
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.retries = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="openrouter"
+                )
+            return self._executor
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Tempo de espera antes da próxima tentativa (full jitter, ou o Retry-After do servidor)"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max * 3)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(
+        self,
+        payload: Dict[str, Any],
+        stream: bool = False,
+        timeout: Optional[Union[float, Tuple[float, float]]] = None,
+    ) -> requests.Response:
+        """Envia o payload com limite de taxa e novas tentativas; retorna a resposta 200"""
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.base_url, json=payload, timeout=timeout or self.timeout, stream=stream
+                )
+            # Só falhas de conexão são repetidas: depois de um timeout de leitura o provedor pode já ter
+            # recebido (e cobrado) a requisição, então ela não é enviada de novo
+            except (requests.ConnectionError, requests.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise OpenRouterAPIError(response.status_code, response.text)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.close()
+
+            time.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+            self.retries += 1
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Requisição síncrona de chat completion; retorna o JSON da resposta"""
+        response = self.post(payload)
+        return response.json()
+
+    def stream_chat(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        chunk_timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Requisição em streaming (SSE): produz cada evento JSON conforme chega.
+
+        O timeout vale para o intervalo entre trechos e não para a resposta
+        inteira. Se `cancel_event` for acionado, a conexão é fechada e o gerador
+        termina sem erro.
+        """
+        response = self.post(
+            {**payload, "stream": True},
+            stream=True,
+            timeout=(DEFAULT_CONNECT_TIMEOUT, chunk_timeout or self.timeout),
+        )
+        try:
+            # chunk_size=None entrega cada trecho assim que ele chega, sem esperar encher um buffer
+            for line in response.iter_lines(chunk_size=None):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                # Linhas vazias separam eventos e linhas com ":" são comentários (keep-alive)
+                if not line or line.startswith(b":") or not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    error = event["error"]
+                    raise OpenRouterAPIError(error.get("code", 500), error.get("message", str(error)))
+                yield event
+        finally:
+            response.close()
+
+    def submit(self, payload: Dict[str, Any]) -> "Future[Dict[str, Any]]":
+        """Dispara a requisição no pool de threads sem bloquear quem chamou"""
+        return self.executor.submit(self.chat, payload)
+
+    async def achat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Versão assíncrona de `chat` para uso com asyncio"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.chat, payload)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,162 @@
+"""Cache em disco dos CSVs já convertidos, em formato colunar Arrow (Feather)"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow é opcional: sem ele o cache fica desativado
+    feather = None
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "PARSE_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "analisador_nf", "parse"),
+)
+DEFAULT_CACHE_MAX_MB = float(os.getenv("PARSE_CACHE_MAX_MB", "4096"))
+CACHE_ENABLED = os.getenv("ENABLE_CACHE", "True").lower() in ("1", "true", "yes", "sim")
+
+# Incrementar quando a forma de converter os CSVs mudar, invalidando entradas antigas
+CACHE_FORMAT_VERSION = 2
+
+
+def hash_upload(file, options: Dict[str, Any], block_size: int = 1 << 20) -> str:
+    """Hash SHA-256 do conteúdo enviado combinado com as opções de leitura"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({**options, 'versao': CACHE_FORMAT_VERSION}, sort_keys=True).encode())
+
+    position = file.tell()
+    file.seek(0)
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        digest.update(block)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheEvent:
+    """Registro de uma consulta ao cache (acerto/falha e tempo de carga)"""
+    file_name: str
+    key: str
+    hit: bool
+    seconds: float
+
+
+class ParseCache:
+    """Guarda DataFrames convertidos em arquivos Arrow lidos via memory-map.
+
+    Cada entrada é composta por `<hash>.arrow` (dados) e `<hash>.json`
+    (metadados, como estatísticas e formatos de data). Quando o tamanho total
+    passa do limite, as entradas usadas há mais tempo são removidas.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_mb: float = DEFAULT_CACHE_MAX_MB,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.enabled = enabled and feather is not None
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return f"{base}.arrow", f"{base}.json"
+
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        """Carrega uma entrada do cache ou retorna None se não existir"""
+        if not self.enabled:
+            return None
+
+        data_path, meta_path = self._paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+
+        try:
+            table = feather.read_table(data_path, memory_map=True)
+            df = table.to_pandas(split_blocks=True)
+            with open(meta_path, encoding='utf-8') as meta_file:
+                metadata = json.load(meta_file)
+        except (OSError, ValueError):
+            # Entrada corrompida: remove para que seja recriada
+            self._remove(key)
+            return None
+
+        # Atualiza o horário de acesso usado na política de remoção
+        now = time.time()
+        for path in (data_path, meta_path):
+            os.utime(path, (now, now))
+        return df, metadata
+
+    def put(self, key: str, df: pd.DataFrame, metadata: Dict[str, Any]) -> bool:
+        """Grava uma entrada no cache; falhas de conversão apenas desativam o cache da entrada"""
+        if not self.enabled:
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self._paths(key)
+        tmp_data, tmp_meta = f"{data_path}.tmp", f"{meta_path}.tmp"
+        try:
+            # Sem compressão para que a leitura possa usar memory-map direto do disco
+            feather.write_feather(df.reset_index(drop=True), tmp_data, compression='uncompressed')
+            with open(tmp_meta, 'w', encoding='utf-8') as meta_file:
+                json.dump(metadata, meta_file, default=str)
+            os.replace(tmp_data, data_path)
+            os.replace(tmp_meta, meta_path)
+        except Exception:
+            for path in (tmp_data, tmp_meta):
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+
+        self.evict()
+        return True
+
+    def _remove(self, key: str) -> None:
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """Lista (hash, tamanho em bytes, último acesso) das entradas em disco"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.arrow'):
+                continue
+            key = name[:-len('.arrow')]
+            data_path, meta_path = self._paths(key)
+            try:
+                size = os.path.getsize(data_path)
+                if os.path.exists(meta_path):
+                    size += os.path.getsize(meta_path)
+                entries.append((key, size, os.path.getmtime(data_path)))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self) -> int:
+        """Remove as entradas menos usadas até o cache caber no limite; retorna quantas saíram"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def size_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
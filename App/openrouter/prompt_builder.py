@@ -0,0 +1,266 @@
+"""Montagem de prompts com orçamento de tokens e compactação do contexto por relevância"""
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from stats_index import FrameStats
+
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+DEFAULT_SAMPLE_ROWS = 5
+DEFAULT_SAMPLE_COLUMNS = 8
+# Caracteres por token na estimativa sem tiktoken (texto em português com números)
+CHARS_PER_TOKEN = 3.5
+
+
+@lru_cache(maxsize=None)
+def _tiktoken():
+    """tiktoken importado na primeira contagem (é opcional: sem ele a contagem é estimada pelo tamanho do texto)"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    """Codificação do modelo, ou None se o tiktoken faltar ou não conseguir carregá-la.
+
+    O tiktoken baixa o arquivo BPE no primeiro uso; sem rede (caso do modelo
+    local) a falha fica em cache e a contagem passa a ser estimada.
+    """
+    tiktoken = _tiktoken()
+    if tiktoken is None:
+        return None
+    name = model.split('/', 1)[-1]
+    try:
+        try:
+            return tiktoken.encoding_for_model(name)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Quantidade de tokens do texto para o modelo (exata com tiktoken, senão estimada)"""
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(np.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in re.split(r"[^a-z0-9]+", _normalize(text)) if len(term) >= 3]
+
+
+def column_relevance(question: str, column: str) -> int:
+    """Quantas partes do nome da coluna aparecem (pelo radical) na pergunta"""
+    words = _terms(question)
+    score = 0
+    for part in _terms(column):
+        stem = part[:5]
+        if any(word.startswith(stem) or (len(word) >= 4 and part.startswith(word[:5])) for word in words):
+            score += 1
+    return score
+
+
+def rank_columns(question: str, columns: Sequence[str]) -> List[str]:
+    """Colunas ordenadas da mais para a menos relevante (empates mantêm a ordem original)"""
+    scores = {col: column_relevance(question, col) for col in columns}
+    return sorted(columns, key=lambda col: -scores[col])
+
+
+def stratified_sample(df: pd.DataFrame, n: int, stats: Optional[FrameStats] = None) -> pd.DataFrame:
+    """Amostra representativa: uma linha por valor frequente de uma coluna categórica e o
+    restante espalhado uniformemente pela tabela (determinística, ao contrário de `sample`)"""
+    if len(df) <= n:
+        return df
+    stats = stats or FrameStats.from_frame(df)
+    strata = [
+        col for col in stats.of_kind('text')
+        if col in df.columns and 1 < stats.get(col).distinct <= max(n * 4, 20)
+    ]
+    picked: List[int] = []
+    if strata:
+        col = min(strata, key=lambda name: stats.get(name).distinct)
+        values = stats.get(col).top(n)
+        positions = np.flatnonzero(df[col].isin(values).to_numpy())
+        first = pd.Series(positions, index=df[col].iloc[positions].to_numpy()).groupby(level=0, sort=False).first()
+        picked = sorted(first.tolist())[:n]
+    spread = np.linspace(0, len(df) - 1, num=n, dtype=np.int64)
+    for position in spread:
+        if len(picked) >= n:
+            break
+        if position not in picked:
+            picked.append(int(position))
+    return df.iloc[sorted(picked)]
+
+
+def schema_lines(name: str, df: pd.DataFrame, columns: Sequence[str]) -> List[str]:
+    """Uma linha por coluna: `tabela.coluna (tipo)`"""
+    return [f"- {name}.{col} ({df[col].dtype})" for col in columns]
+
+
+def stats_lines(name: str, stats: FrameStats, columns: Sequence[str], top_values: int = 3) -> List[str]:
+    """Uma linha de estatísticas por coluna, servida pelo índice de estatísticas"""
+    lines = []
+    for col in columns:
+        column = stats.get(col)
+        if column is None or column.count == 0:
+            continue
+        if column.kind == 'numeric':
+            lines.append(
+                f"- {name}.{col}: média={column.mean:.2f}, desvio={column.std:.2f}, "
+                f"min={column.min:.2f}, max={column.max:.2f}, soma={column.sum:.2f}"
+            )
+        elif column.kind == 'datetime':
+            lines.append(f"- {name}.{col}: de {column.min} a {column.max}")
+        else:
+            prefix = "" if column.distinct_is_exact else "~"
+            values = ', '.join(map(str, column.top(top_values)))
+            lines.append(f"- {name}.{col}: {prefix}{column.distinct} valores únicos (mais frequentes: {values})")
+    return lines
+
+
+def sample_lines(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    stats: Optional[FrameStats] = None,
+    rows: int = DEFAULT_SAMPLE_ROWS,
+) -> List[str]:
+    """Amostra estratificada das colunas indicadas, formatada como tabela (cabeçalho + linhas)"""
+    if df.empty or not columns:
+        return []
+    return stratified_sample(df, rows, stats)[list(columns)].to_string(index=False).splitlines()
+
+
+@dataclass
+class PromptSection:
+    """Bloco do prompt cujas linhas já estão ordenadas por relevância.
+
+    Na compactação, as últimas linhas são descartadas primeiro; `min_lines`
+    linhas são sempre mantidas (por exemplo, o cabeçalho de uma tabela).
+    """
+    title: str
+    lines: List[str]
+    min_lines: int = 0
+
+
+@dataclass
+class BuiltPrompt:
+    """Prompt final com a contagem de tokens e o que foi omitido para caber no orçamento"""
+    text: str
+    tokens: int
+    budget: int
+    omitted: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Monta prompts dentro de um orçamento de tokens do modelo.
+
+    O texto fixo (instruções e pergunta) é sempre incluído; as seções recebem
+    linhas alternadamente, na ordem de relevância, até o orçamento acabar.
+    """
+
+    def __init__(self, model: str, budget: int = DEFAULT_PROMPT_TOKEN_BUDGET):
+        self.model = model
+        self.budget = budget
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def build(self, template: str, sections: Dict[str, PromptSection], **fixed: str) -> BuiltPrompt:
+        """Preenche `template` com os textos fixos e as seções compactadas (chaves de `sections`)"""
+        fits = self._fitter(template, sections, fixed)
+        kept = {key: section.min_lines for key, section in sections.items()}
+
+        # Distribui as linhas em rodadas para que nenhuma seção consuma todo o orçamento
+        depth = max((len(section.lines) for section in sections.values()), default=0)
+        for position in range(depth):
+            for key, section in sections.items():
+                # Ignora linhas já garantidas pelo mínimo e seções que pararam de crescer
+                if kept[key] != position or position >= len(section.lines):
+                    continue
+                kept[key] += 1
+                if not fits(kept):
+                    kept[key] -= 1
+
+        text = self._render(template, sections, fixed, kept)
+        omitted = {
+            section.title: len(section.lines) - kept[key]
+            for key, section in sections.items() if len(section.lines) > kept[key]
+        }
+        return BuiltPrompt(text, self.count(text), self.budget, omitted)
+
+    def _fitter(self, template, sections, fixed) -> Callable[[Dict[str, int]], bool]:
+        # Conta cada linha uma única vez; o total é estimado pela soma das partes
+        base = self.count(template.format(**fixed, **{key: '' for key in sections}))
+        line_tokens = {key: [self.count(line + "\n") for line in section.lines] for key, section in sections.items()}
+        note_tokens = self.count("(+000 linhas omitidas)\n")
+
+        def fits(kept: Dict[str, int]) -> bool:
+            total = base
+            for key, section in sections.items():
+                total += sum(line_tokens[key][:kept[key]])
+                if kept[key] < len(section.lines):
+                    total += note_tokens
+            return total <= self.budget
+
+        return fits
+
+    @staticmethod
+    def _render(template, sections, fixed, kept) -> str:
+        rendered = {}
+        for key, section in sections.items():
+            lines = section.lines[:kept[key]]
+            if len(section.lines) > kept[key]:
+                lines = lines + [f"(+{len(section.lines) - kept[key]} linhas omitidas)"]
+            rendered[key] = "\n".join(lines)
+        return template.format(**fixed, **rendered)
+
+
+def context_sections(
+    question: str,
+    tables: Dict[str, Tuple[pd.DataFrame, FrameStats]],
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    sample_columns: int = DEFAULT_SAMPLE_COLUMNS,
+) -> Dict[str, PromptSection]:
+    """Seções de estrutura, estatísticas e amostra, com as colunas mais relevantes à pergunta primeiro"""
+    schema, stats, samples = [], [], []
+    for name, (df, index) in tables.items():
+        ranked = rank_columns(question, list(df.columns))
+        schema.extend(schema_lines(name, df, ranked))
+        stats.extend(stats_lines(name, index, ranked))
+        samples.append(f"TABELA {name} ({index.rows} registros):")
+        samples.extend(sample_lines(df, ranked[:sample_columns], index, sample_rows))
+
+    # Intercala as tabelas para que a relevância prevaleça sobre a ordem das tabelas
+    schema = rank_lines(question, schema)
+    stats = rank_lines(question, stats)
+    return {
+        'estrutura': PromptSection('estrutura', schema, min_lines=min(len(schema), len(tables))),
+        'estatisticas': PromptSection('estatísticas', stats),
+        'amostra': PromptSection('amostra', samples, min_lines=min(len(samples), 3)),
+    }
+
+
+def rank_lines(question: str, lines: List[str]) -> List[str]:
+    """Ordena linhas `- tabela.coluna ...` pela relevância da coluna (ordenação estável)"""
+    def score(line: str) -> int:
+        match = re.match(r"- [^.\s]+\.(\S+?)[:\s]", line)
+        return column_relevance(question, match.group(1)) if match else 0
+    return sorted(lines, key=lambda line: -score(line))
@@ -0,0 +1,334 @@
+"""Planos de consulta restritos (JSON) gerados pelo modelo e executados localmente com pandas"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MAX_RESULT_ROWS = 50
+
+FILTER_OPS = {'==', '!=', '>', '>=', '<', '<=', 'in', 'not in', 'contains', 'between', 'is null', 'not null'}
+AGG_FUNCS = {'sum', 'mean', 'median', 'min', 'max', 'count', 'nunique', 'std'}
+# Tipos de coluna aceitos por cada agregação e pelos operadores de ordem (as demais aceitam qualquer tipo)
+AGG_KINDS = {
+    'sum': {'numeric'},
+    'std': {'numeric'},
+    'mean': {'numeric', 'datetime'},
+    'median': {'numeric', 'datetime'},
+    'min': {'numeric', 'datetime'},
+    'max': {'numeric', 'datetime'},
+}
+ORDER_OPS = {'>', '>=', '<', '<=', 'between'}
+PERIODS = {'D': 'D', 'W': 'W', 'M': 'M', 'Q': 'Q', 'Y': 'Y'}
+
+PLAN_INSTRUCTIONS = """
+Responda APENAS com um objeto JSON (sem texto adicional) no formato:
+{
+  "tabela": "cabecalho" | "itens" | "combinado",
+  "filtros": [{"coluna": "<nome>", "op": "==|!=|>|>=|<|<=|in|not in|contains|between|is null|not null", "valor": <valor>}],
+  "agrupar_por": ["<coluna>" ou {"coluna": "<coluna de data>", "periodo": "D|W|M|Q|Y"}],
+  "agregacoes": [{"coluna": "<nome> ou *", "funcao": "sum|mean|median|min|max|count|nunique|std", "nome": "<alias>"}],
+  "colunas": ["<colunas a retornar quando não houver agregação>"],
+  "ordenar_por": [{"coluna": "<coluna ou alias>", "direcao": "asc|desc"}],
+  "limite": <até 50>
+}
+Use somente as tabelas e colunas listadas. Campos não usados podem ser omitidos.
+sum, mean, median, min, max, std e os operadores >, >=, <, <=, between só valem para colunas numéricas ou de data.
+"""
+
+
+class QueryPlanError(ValueError):
+    """Plano de consulta inválido ou que não pode ser executado"""
+
+
+def parse_plan(text: str) -> Dict[str, Any]:
+    """Extrai o objeto JSON da resposta do modelo (tolerando blocos ```json)"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise QueryPlanError("a resposta do modelo não contém um objeto JSON")
+    try:
+        plan = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise QueryPlanError(f"JSON inválido no plano: {e}") from e
+    if not isinstance(plan, dict):
+        raise QueryPlanError("o plano deve ser um objeto JSON")
+    return plan
+
+
+def _as_list(value) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _kind(dtype) -> str:
+    """Tipo da coluna para a validação: 'numeric' (inclui booleanos), 'datetime' ou 'text'"""
+    if pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    return 'text'
+
+
+def _group_spec(entry) -> Dict[str, Optional[str]]:
+    if isinstance(entry, str):
+        return {'coluna': entry, 'periodo': None}
+    if isinstance(entry, dict) and 'coluna' in entry:
+        return {'coluna': entry['coluna'], 'periodo': entry.get('periodo')}
+    raise QueryPlanError(f"agrupamento inválido: {entry!r}")
+
+
+def validate_plan(plan: Dict[str, Any], tables: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """Valida o plano contra as tabelas disponíveis e retorna uma versão normalizada"""
+    table_name = plan.get('tabela', 'combinado')
+    if table_name not in tables or tables[table_name] is None:
+        raise QueryPlanError(f"tabela desconhecida: {table_name!r}")
+    columns = set(tables[table_name].columns)
+    dtypes = tables[table_name].dtypes
+
+    def check_column(name: str) -> str:
+        if name not in columns:
+            raise QueryPlanError(f"coluna {name!r} não existe na tabela {table_name!r}")
+        return name
+
+    filters = []
+    for entry in _as_list(plan.get('filtros')):
+        if not isinstance(entry, dict):
+            raise QueryPlanError(f"filtro inválido: {entry!r}")
+        op = str(entry.get('op', '==')).lower()
+        if op not in FILTER_OPS:
+            raise QueryPlanError(f"operador não permitido: {op!r}")
+        value = entry.get('valor')
+        if op in ('in', 'not in', 'between'):
+            value = _as_list(value)
+            if op == 'between' and len(value) != 2:
+                raise QueryPlanError("'between' exige exatamente dois valores")
+        column = check_column(entry.get('coluna'))
+        if op in ORDER_OPS and _kind(dtypes[column]) == 'text':
+            raise QueryPlanError(f"operador {op!r} exige coluna numérica ou de data, e {column!r} é texto")
+        if op not in ('is null', 'not null', 'contains'):
+            _coerce_value(dtypes[column], column, value)  # valor incompatível com o tipo falha aqui, não na execução
+        filters.append({'coluna': column, 'op': op, 'valor': value})
+
+    group_by = []
+    for entry in _as_list(plan.get('agrupar_por')):
+        spec = _group_spec(entry)
+        check_column(spec['coluna'])
+        if spec['periodo'] is not None:
+            if spec['periodo'] not in PERIODS:
+                raise QueryPlanError(f"período não permitido: {spec['periodo']!r}")
+            if _kind(dtypes[spec['coluna']]) != 'datetime':
+                raise QueryPlanError(f"coluna {spec['coluna']!r} não é de data")
+        group_by.append(spec)
+
+    aggregations = []
+    for entry in _as_list(plan.get('agregacoes')):
+        if not isinstance(entry, dict):
+            raise QueryPlanError(f"agregação inválida: {entry!r}")
+        func = str(entry.get('funcao', '')).lower()
+        if func not in AGG_FUNCS:
+            raise QueryPlanError(f"função de agregação não permitida: {func!r}")
+        column = entry.get('coluna', '*')
+        if column == '*':
+            if func != 'count':
+                raise QueryPlanError("'*' só pode ser usado com 'count'")
+        else:
+            check_column(column)
+            kinds = AGG_KINDS.get(func)
+            if kinds and _kind(dtypes[column]) not in kinds:
+                raise QueryPlanError(f"{func!r} não se aplica à coluna {column!r} ({dtypes[column]})")
+        alias = str(entry.get('nome') or f"{func}_{'linhas' if column == '*' else column}")
+        aggregations.append({'coluna': column, 'funcao': func, 'nome': alias})
+
+    select = [check_column(col) for col in _as_list(plan.get('colunas'))]
+
+    output_columns = (
+        {spec['coluna'] for spec in group_by} | {agg['nome'] for agg in aggregations}
+        if aggregations else (set(select) or columns)
+    )
+    order_by = []
+    for entry in _as_list(plan.get('ordenar_por')):
+        if isinstance(entry, str):
+            entry = {'coluna': entry}
+        if not isinstance(entry, dict) or entry.get('coluna') not in output_columns:
+            raise QueryPlanError(f"ordenação inválida: {entry!r}")
+        direction = str(entry.get('direcao', 'asc')).lower()
+        if direction not in ('asc', 'desc'):
+            raise QueryPlanError(f"direção de ordenação inválida: {direction!r}")
+        order_by.append({'coluna': entry['coluna'], 'direcao': direction})
+
+    try:
+        limit = int(plan.get('limite') or MAX_RESULT_ROWS)
+    except (TypeError, ValueError) as e:
+        raise QueryPlanError(f"limite inválido: {plan.get('limite')!r}") from e
+    limit = max(1, min(limit, MAX_RESULT_ROWS))
+
+    if group_by and not aggregations:
+        aggregations.append({'coluna': '*', 'funcao': 'count', 'nome': 'quantidade'})
+
+    return {
+        'tabela': table_name,
+        'filtros': filters,
+        'agrupar_por': group_by,
+        'agregacoes': aggregations,
+        'colunas': select,
+        'ordenar_por': order_by,
+        'limite': limit,
+    }
+
+
+def _coerce_value(dtype, column: str, value):
+    """Converte o valor do filtro para o tipo da coluna"""
+    if isinstance(value, list):
+        return [_coerce_value(dtype, column, item) for item in value]
+    if value is None:
+        return value
+    try:
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return pd.to_datetime(value, dayfirst=isinstance(value, str) and '/' in value)
+        if pd.api.types.is_numeric_dtype(dtype) and not isinstance(value, bool):
+            return float(value)
+    except (TypeError, ValueError) as e:
+        raise QueryPlanError(f"valor {value!r} incompatível com a coluna {column!r}") from e
+    return value
+
+
+def _filter_mask(df: pd.DataFrame, spec: Dict[str, Any]) -> pd.Series:
+    series = df[spec['coluna']]
+    op = spec['op']
+    if op == 'is null':
+        return series.isna()
+    if op == 'not null':
+        return series.notna()
+    if op == 'contains':
+        return series.astype(str).str.contains(str(spec['valor']), case=False, regex=False, na=False)
+
+    value = _coerce_value(series.dtype, spec['coluna'], spec['valor'])
+    if op == 'in':
+        return series.isin(value)
+    if op == 'not in':
+        return ~series.isin(value)
+    if op == 'between':
+        return series.between(value[0], value[1])
+    if op == '==':
+        return series == value
+    if op == '!=':
+        return series != value
+    if op == '>':
+        return series > value
+    if op == '>=':
+        return series >= value
+    if op == '<':
+        return series < value
+    return series <= value
+
+
+def plan_columns(plan: Dict[str, Any]) -> List[str]:
+    """Colunas da tabela que um plano validado lê (filtros, agrupamentos, agregações e seleção)"""
+    columns = [spec['coluna'] for spec in plan['filtros']]
+    columns += [spec['coluna'] for spec in plan['agrupar_por']]
+    columns += [agg['coluna'] for agg in plan['agregacoes'] if agg['coluna'] != '*']
+    columns += plan['colunas']
+    if not plan['agregacoes']:
+        columns += [spec['coluna'] for spec in plan['ordenar_por']]
+    return list(dict.fromkeys(columns))
+
+
+def execute_plan(plan: Dict[str, Any], tables: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Executa um plano validado de forma vetorizada sobre a tabela escolhida
+
+    Erros do pandas durante a execução viram QueryPlanError, para que quem
+    chama possa voltar ao modo de contexto.
+    """
+    try:
+        return _execute(plan, tables)
+    except QueryPlanError:
+        raise
+    except (TypeError, ValueError, KeyError) as e:
+        raise QueryPlanError(f"falha ao executar o plano: {e}") from e
+
+
+def _execute(plan: Dict[str, Any], tables: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    df = tables[plan['tabela']]
+    view = None
+    if not isinstance(df, pd.DataFrame):
+        # Visões (como a tabela combinada) materializam só as colunas usadas pelo plano
+        view, columns = df, plan_columns(plan)
+        df = view.select(columns) if columns else pd.DataFrame(index=pd.RangeIndex(len(view)))
+
+    if plan['filtros']:
+        mask = np.ones(len(df), dtype=bool)
+        for spec in plan['filtros']:
+            mask &= _filter_mask(df, spec).to_numpy(dtype=bool, na_value=False)
+        df = df[mask]
+
+    if plan['agregacoes']:
+        keys = []
+        for spec in plan['agrupar_por']:
+            key = df[spec['coluna']]
+            if spec['periodo']:
+                key = key.dt.to_period(PERIODS[spec['periodo']]).astype(str)
+            keys.append(key.rename(spec['coluna']))
+
+        named = {
+            agg['nome']: pd.NamedAgg(column=agg['coluna'], aggfunc=agg['funcao'])
+            for agg in plan['agregacoes'] if agg['coluna'] != '*'
+        }
+        counts = [agg['nome'] for agg in plan['agregacoes'] if agg['coluna'] == '*']
+
+        if keys:
+            grouped = df.groupby(keys, observed=True, sort=False)
+            parts = [grouped.agg(**named)] if named else []
+            parts += [grouped.size().rename(alias) for alias in counts]
+            result = pd.concat(parts, axis=1).reset_index()
+        else:
+            row = {alias: df[spec.column].agg(spec.aggfunc) for alias, spec in named.items()}
+            row.update({alias: len(df) for alias in counts})
+            result = pd.DataFrame([row])
+        result = result[[spec['coluna'] for spec in plan['agrupar_por']] + [agg['nome'] for agg in plan['agregacoes']]]
+    else:
+        result = df[plan['colunas']] if plan['colunas'] else df
+
+    if plan['ordenar_por']:
+        result = result.sort_values(
+            [spec['coluna'] for spec in plan['ordenar_por']],
+            ascending=[spec['direcao'] == 'asc' for spec in plan['ordenar_por']],
+        )
+
+    result = result.head(plan['limite'])
+    if view is not None and not plan['agregacoes'] and not plan['colunas']:
+        # Todas as colunas só para as linhas que vão para o resultado (o índice guarda a posição na visão)
+        result = view.take(result.index.to_numpy())
+    return result.reset_index(drop=True)
+
+
+def describe_tables(
+    tables: Dict[str, pd.DataFrame],
+    column_stats: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_values: int = 8,
+) -> str:
+    """Descreve colunas, tipos e valores frequentes de cada tabela para o modelo montar o plano
+
+    `column_stats` (tabela -> coluna -> ColumnStats) evita recontar os valores a cada consulta.
+    """
+    lines = []
+    for name, df in tables.items():
+        if df is None:
+            continue
+        stats = (column_stats or {}).get(name, {})
+        lines.append(f"TABELA {name} ({len(df)} registros):")
+        for col, dtype in df.dtypes.items():
+            line = f"- {col} ({dtype})"
+            if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+                column = stats.get(col)
+                if column is not None:
+                    values, distinct = column.top(max_values), column.distinct
+                else:
+                    series = df[col]
+                    values, distinct = series.value_counts().head(max_values).index.tolist(), series.nunique()
+                if values and distinct <= max_values * 4:
+                    line += f": valores como {', '.join(map(str, values))}"
+            lines.append(line)
+        lines.append("")
+    return "\n".join(lines)
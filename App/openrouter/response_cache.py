@@ -0,0 +1,226 @@
+"""Cache de respostas das consultas: LRU em memória + SQLite persistente com TTL"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from parse_cache import CACHE_ENABLED
+
+DEFAULT_DB_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "analisador_nf", "respostas.sqlite3"),
+)
+DEFAULT_TTL = float(os.getenv("CACHE_TTL", "3600"))
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "256"))
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza a pergunta: sem acentos, minúsculas, espaços únicos e sem pontuação final"""
+    text = unicodedata.normalize('NFKD', question)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip(" ?!.;:")
+
+
+@dataclass
+class CachedResponse:
+    """Resposta guardada no cache com o custo original da consulta"""
+    answer: str
+    latency: float
+    tokens: int
+    created_at: float
+
+
+@dataclass
+class ResponseCacheStats:
+    """Contadores de uso do cache"""
+    hits: int = 0
+    misses: int = 0
+    saved_seconds: float = 0.0
+    saved_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResponseCache:
+    """Cache em duas camadas para as respostas do modelo.
+
+    A chave combina modelo, impressão digital dos dados, modo de consulta e a
+    pergunta normalizada; quando os dados mudam a impressão digital muda e as
+    entradas antigas simplesmente deixam de ser encontradas.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        ttl: float = DEFAULT_TTL,
+        max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.enabled = enabled
+        self.stats = ResponseCacheStats()
+        self._memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.enabled:
+            try:
+                self._init_db()
+            except (OSError, sqlite3.Error):
+                # Sem acesso ao arquivo: segue apenas com a camada em memória
+                self.db_path = ':memory:'
+
+    @staticmethod
+    def make_key(model: str, fingerprint: str, question: str, mode: str = '') -> str:
+        raw = "\x1f".join([model, fingerprint, mode, normalize_question(question)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    resposta TEXT NOT NULL,
+                    latencia REAL NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    criado_em REAL NOT NULL
+                )
+                """
+            )
+
+    def _expired(self, entry: CachedResponse) -> bool:
+        return self.ttl > 0 and time.time() - entry.created_at > self.ttl
+
+    def get(self, key: str, *alternatives: str) -> Optional[CachedResponse]:
+        """Busca na memória e depois no SQLite; entradas vencidas contam como falha.
+
+        Com `alternatives`, devolve a primeira chave encontrada; a busca conta
+        um único acerto ou falha, qualquer que seja o número de chaves.
+        """
+        if not self.enabled:
+            return None
+
+        entry = None
+        for candidate in (key, *alternatives):
+            entry = self.peek(candidate)
+            if entry is not None:
+                break
+
+        with self._lock:
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                self.stats.saved_seconds += entry.latency
+                self.stats.saved_tokens += entry.tokens
+        return entry
+
+    def peek(self, key: str) -> Optional[CachedResponse]:
+        """Como `get`, sem contar acerto nem falha nas estatísticas"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is None:
+            entry = self._get_persistent(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def _get_persistent(self, key: str) -> Optional[CachedResponse]:
+        if self.db_path == ':memory:':
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT resposta, latencia, tokens, criado_em FROM respostas WHERE chave = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = CachedResponse(*row)
+                if self._expired(entry):
+                    conn.execute("DELETE FROM respostas WHERE chave = ?", (key,))
+                    return None
+                return entry
+        except sqlite3.Error:
+            return None
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, answer: str, latency: float, tokens: int = 0) -> None:
+        """Guarda a resposta nas duas camadas e descarta entradas vencidas do SQLite"""
+        if not self.enabled:
+            return
+
+        entry = CachedResponse(answer, latency, int(tokens or 0), time.time())
+        self._remember(key, entry)
+        if self.db_path == ':memory:':
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO respostas (chave, resposta, latencia, tokens, criado_em) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, entry.answer, entry.latency, entry.tokens, entry.created_at),
+                )
+                if self.ttl > 0:
+                    conn.execute("DELETE FROM respostas WHERE criado_em < ?", (entry.created_at - self.ttl,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.enabled and self.db_path != ':memory:':
+            with self._connect() as conn:
+                conn.execute("DELETE FROM respostas")
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_response_cache() -> ResponseCache:
+    """Instância única do cache no processo, compartilhada entre as sessões do Streamlit"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
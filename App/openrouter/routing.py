@@ -0,0 +1,363 @@
+"""Roteamento de perguntas entre modelos rápidos e o modelo escolhido, com requisições em duplicata (hedging)"""
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from metrics import Tracer, shared_tracer
+from openrouter_client import RETRY_STATUSES, OpenRouterAPIError
+
+# Modelos baratos e rápidos para perguntas simples (o primeiro do mesmo provedor do modelo escolhido tem preferência)
+DEFAULT_FAST_MODELS = tuple(
+    model.strip()
+    for model in os.getenv("ROUTER_FAST_MODELS", "anthropic/claude-3-haiku,openai/gpt-4o-mini").split(",")
+    if model.strip()
+)
+# Perguntas com mais palavras que isso vão sempre para o modelo escolhido
+DEFAULT_MAX_SIMPLE_WORDS = int(os.getenv("ROUTER_MAX_SIMPLE_WORDS", "25"))
+# Espera antes da duplicata enquanto não há amostras suficientes para o p95 do modelo
+DEFAULT_HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "2.0"))
+DEFAULT_HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+SIMPLE = 'simples'
+COMPLEX = 'complexa'
+
+# Termos (sem acentos) que indicam consulta direta: contagens, totais, rankings
+LOOKUP_TERMS = (
+    'quantas', 'quantos', 'quanto', 'qual', 'quais', 'total', 'soma', 'media', 'maior', 'menor',
+    'maximo', 'minimo', 'liste', 'listar', 'mostre', 'valor', 'top',
+)
+# Termos que pedem raciocínio além de buscar um número
+ANALYSIS_TERMS = (
+    'por que', 'porque', 'explique', 'explica', 'analise', 'compare', 'compara', 'tendencia', 'sazonal',
+    'correlac', 'previs', 'projec', 'recomend', 'estrateg', 'insight', 'anomal', 'padrao', 'padroes',
+    'causa', 'impacto', 'otimiz', 'risco', 'evolucao', 'cenario', 'justifi', 'avalie', 'interprete',
+)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def classify_question(question: str, max_simple_words: int = DEFAULT_MAX_SIMPLE_WORDS) -> Tuple[str, List[str]]:
+    """Complexidade da pergunta ('simples' ou 'complexa') e os motivos da classificação.
+
+    Só é simples a pergunta curta, com cara de consulta direta e sem pedido de
+    análise; na dúvida, a pergunta fica com o modelo escolhido.
+    """
+    text = _normalize(question)
+    words = re.findall(r"\w+", text)
+    reasons = []
+    analysis = [term for term in ANALYSIS_TERMS if term in text]
+    if analysis:
+        reasons.append(f"pede análise ({', '.join(analysis[:3])})")
+    if len(words) > max_simple_words:
+        reasons.append(f"{len(words)} palavras")
+    if text.count('?') > 1:
+        reasons.append("várias perguntas")
+    if not any(term in words for term in LOOKUP_TERMS):
+        reasons.append("não é consulta direta")
+    if reasons:
+        return COMPLEX, reasons
+    return SIMPLE, ["consulta direta"]
+
+
+def _retryable(error: Exception) -> bool:
+    """Falha temporária (timeout, conexão, status de nova tentativa): as demais se repetiriam na duplicata"""
+    if isinstance(error, OpenRouterAPIError):
+        return error.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+@dataclass
+class RouteDecision:
+    """Modelo escolhido para uma pergunta e o que aconteceu nas chamadas (escalonamentos e duplicatas)"""
+    question: str
+    requested_model: str  # modelo selecionado na barra lateral
+    model: str            # modelo que responde (vira o selecionado quando a resposta é escalonada)
+    complexity: str
+    reasons: List[str] = field(default_factory=list)
+    hedge: bool = False   # duplicar chamadas lentas
+    escalations: List[str] = field(default_factory=list)
+    hedges: int = 0       # duplicatas disparadas
+    hedges_won: int = 0   # duplicatas que responderam primeiro
+
+    @property
+    def routed(self) -> bool:
+        return self.model != self.requested_model
+
+    def escalate(self, reason: str) -> None:
+        self.escalations.append(f"{self.model} → {self.requested_model}: {reason}")
+        self.model = self.requested_model
+
+    def attrs(self) -> Dict[str, Any]:
+        """Atributos gravados no trace da consulta"""
+        return {
+            'modelo': self.model,
+            'complexidade': self.complexity,
+            'motivos': self.reasons,
+            'escalonamentos': self.escalations,
+            'duplicatas': self.hedges,
+            'duplicatas_vencedoras': self.hedges_won,
+        }
+
+
+class LatencyWindow:
+    """Últimas latências até o primeiro trecho, por modelo, para estimar o p95"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.size = size
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.size)).append(seconds)
+
+    def quantile(self, model: str, q: float, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {model: len(samples) for model, samples in self._samples.items()}
+
+
+class _Attempt:
+    def __init__(self, number: int):
+        self.number = number
+        self.started = time.perf_counter()
+        self.first_event_at: Optional[float] = None
+        self.cancel = threading.Event()
+        self.lost_to: Optional["_Attempt"] = None  # duplicata que respondeu antes desta
+        self.settled = False
+
+
+_DONE = object()
+
+
+class ModelRouter:
+    """Escolhe o modelo de cada pergunta e dispara duplicatas quando a resposta demora.
+
+    Perguntas simples vão para um modelo rápido (`fast_models`); as demais,
+    e as que falham no modelo rápido, para o modelo escolhido. Com hedging, se
+    o primeiro trecho não chega até o p95 histórico do modelo, a mesma
+    requisição é enviada de novo; a que responder primeiro segue e a outra tem
+    a conexão fechada. As latências e os contadores valem para o processo
+    inteiro (veja `shared_model_router`).
+    """
+
+    def __init__(
+        self,
+        fast_models: Tuple[str, ...] = DEFAULT_FAST_MODELS,
+        hedge_quantile: float = DEFAULT_HEDGE_QUANTILE,
+        default_hedge_delay: float = DEFAULT_HEDGE_DELAY,
+        max_hedges: int = 1,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.fast_models = tuple(fast_models)
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.max_hedges = max_hedges
+        self.tracer = tracer
+        self.latencies = LatencyWindow()
+        self.counters: Dict[str, float] = {}
+        self.routes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def fast_model_for(self, model: str) -> str:
+        """Modelo rápido do mesmo provedor, se houver; o próprio modelo quando ele já é rápido"""
+        if not self.fast_models or model in self.fast_models:
+            return model
+        provider = model.split('/', 1)[0] + '/'
+        return next((fast for fast in self.fast_models if fast.startswith(provider)), self.fast_models[0])
+
+    def route(self, question: str, model: str, routing: bool = True, hedge: bool = False) -> RouteDecision:
+        complexity, reasons = classify_question(question)
+        target = self.fast_model_for(model) if routing and complexity == SIMPLE else model
+        decision = RouteDecision(question, model, target, complexity, reasons, hedge=hedge)
+        with self._lock:
+            self.routes[target] = self.routes.get(target, 0) + 1
+        self._count(f'perguntas_{complexity}')
+        return decision
+
+    def record_escalation(self) -> None:
+        self._count('escalonamentos')
+
+    def hedge_delay(self, model: str) -> float:
+        """Espera antes da duplicata: p95 do modelo até o primeiro trecho (ou o padrão, sem histórico)"""
+        observed = self.latencies.quantile(model, self.hedge_quantile)
+        return max(HEDGE_MIN_DELAY, observed if observed is not None else self.default_hedge_delay)
+
+    def _run_attempt(self, client, payload: Dict[str, Any], attempt: _Attempt, events: "queue.Queue", chunk_timeout: float):
+        model = payload.get('model', '')
+        try:
+            # Cancelada, a requisição fecha a conexão sem ler o resto da resposta
+            for event in client.stream_chat(payload, cancel_event=attempt.cancel, chunk_timeout=chunk_timeout):
+                if attempt.first_event_at is None:
+                    attempt.first_event_at = time.perf_counter()
+                    self.latencies.record(model, attempt.first_event_at - attempt.started)
+                if attempt.cancel.is_set():
+                    break
+                events.put((attempt, event))
+            if attempt.cancel.is_set():
+                # O cliente só percebe o cancelamento quando chega o primeiro dado: esse instante é quando a
+                # perdedora responderia, o que mede quanto a duplicata economizou
+                if attempt.first_event_at is None:
+                    attempt.first_event_at = time.perf_counter()
+                self._settle(attempt, model)
+            events.put((attempt, _DONE))
+        except Exception as e:
+            events.put((attempt, e))
+
+    def _launch(self, client, payload, attempts: List[_Attempt], events, chunk_timeout) -> _Attempt:
+        attempt = _Attempt(len(attempts))
+        attempts.append(attempt)
+        threading.Thread(
+            target=self._run_attempt, args=(client, payload, attempt, events, chunk_timeout),
+            name=f"hedge-{attempt.number}", daemon=True,
+        ).start()
+        return attempt
+
+    def _settle(self, loser: _Attempt, model: str) -> None:
+        """Registra quanto a duplicata economizou quando a original chega ao primeiro trecho"""
+        with self._lock:
+            if loser.settled or loser.lost_to is None or loser.first_event_at is None:
+                return
+            loser.settled = True
+        saved = loser.first_event_at - loser.lost_to.first_event_at
+        self._count('economia_s', saved)
+        self._count('economias_medidas')
+        if self.tracer is not None:
+            self.tracer.record('economia_duplicata', saved, modelo=model)
+
+    def stream(
+        self,
+        client,
+        payload: Dict[str, Any],
+        decision: RouteDecision,
+        cancel_event: Optional[threading.Event] = None,
+        chunk_timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Eventos de streaming da requisição que responder primeiro (a original ou uma duplicata)"""
+        model = payload.get('model', '')
+        chunk_timeout = chunk_timeout or client.timeout
+        delay = self.hedge_delay(model)
+        events: "queue.Queue" = queue.Queue()
+        attempts: List[_Attempt] = []
+        self._launch(client, payload, attempts, events, chunk_timeout)
+        winner: Optional[_Attempt] = None
+        errors: List[Exception] = []
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                can_hedge = winner is None and len(attempts) <= self.max_hedges
+                timeout = None
+                if can_hedge:
+                    timeout = max(0.0, attempts[0].started + delay * len(attempts) - time.perf_counter())
+                try:
+                    attempt, item = events.get(timeout=timeout)
+                except queue.Empty:
+                    self._launch(client, payload, attempts, events, chunk_timeout)
+                    decision.hedges += 1
+                    self._count('duplicatas')
+                    continue
+
+                if winner is not None and attempt is not winner:
+                    continue
+                if isinstance(item, Exception):
+                    # Erro definitivo (chave inválida, modelo inexistente...) não é reenviado
+                    if attempt is winner or not _retryable(item):
+                        raise item
+                    errors.append(item)
+                    if len(errors) < len(attempts):
+                        continue
+                    if not can_hedge:
+                        raise errors[0]
+                    # Todas falharam antes do primeiro trecho: a duplicata sai na hora
+                    self._launch(client, payload, attempts, events, chunk_timeout)
+                    decision.hedges += 1
+                    self._count('duplicatas')
+                    continue
+                if winner is None:
+                    winner = attempt
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel.set()
+                    if winner.number > 0 and winner.first_event_at is not None:
+                        decision.hedges_won += 1
+                        self._count('duplicatas_vencedoras')
+                        attempts[0].lost_to = winner
+                        self._settle(attempts[0], model)
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            for attempt in attempts:
+                attempt.cancel.set()
+
+    def chat(self, client, payload: Dict[str, Any], decision: RouteDecision) -> Dict[str, Any]:
+        """Como `client.chat`, mas com duplicata: a resposta é montada a partir do streaming"""
+        parts, usage = [], {}
+        for event in self.stream(client, payload, decision):
+            if event.get('usage'):
+                usage = event['usage']
+            delta = ((event.get('choices') or [{}])[0].get('delta') or {}).get('content')
+            if delta:
+                parts.append(delta)
+        return {
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(parts)}}],
+            'usage': usage,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            routes = dict(self.routes)
+        return {
+            'perguntas_simples': int(counters.get(f'perguntas_{SIMPLE}', 0)),
+            'perguntas_complexas': int(counters.get(f'perguntas_{COMPLEX}', 0)),
+            'modelos': routes,
+            'escalonamentos': int(counters.get('escalonamentos', 0)),
+            'duplicatas': int(counters.get('duplicatas', 0)),
+            'duplicatas_vencedoras': int(counters.get('duplicatas_vencedoras', 0)),
+            'economia_s': counters.get('economia_s', 0.0),
+            'economias_medidas': int(counters.get('economias_medidas', 0)),
+            'p95_s': {
+                model: self.latencies.quantile(model, self.hedge_quantile)
+                for model in self.latencies.counts()
+            },
+        }
+
+
+_shared_router: Optional[ModelRouter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_model_router() -> ModelRouter:
+    """Instância única no processo: o histórico de latência e os contadores valem para todas as sessões"""
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter(tracer=shared_tracer())
+        return _shared_router
@@ -0,0 +1,105 @@
+"""Índice de hashes das chaves das linhas já carregadas, usado para deduplicar cargas incrementais"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Nomes da coluna que numera os itens dentro de uma NF (a chave do item é NF + número do item)
+ITEM_NUMBER_HINTS = ('item_numero', 'numero_item', 'n_item', 'item', 'seq', 'sequencia')
+# Acima deste número de segmentos, o índice é fundido em um só
+MAX_SEGMENTS = 8
+
+
+def item_number_column(df: pd.DataFrame, key: str) -> Optional[str]:
+    """Coluna que numera os itens de cada NF, pelo nome"""
+    names = {col.lower(): col for col in df.columns if col != key}
+    for hint in ITEM_NUMBER_HINTS:
+        if hint in names:
+            return names[hint]
+    return None
+
+
+def key_columns(df: pd.DataFrame, key: Optional[str], items: bool) -> List[str]:
+    """Colunas que identificam uma linha: NF no cabeçalho, NF + número do item nos itens.
+
+    Sem chave de junção (ou sem coluna de número do item), a linha inteira
+    é a chave.
+    """
+    if key is None or key not in df.columns:
+        return list(df.columns)
+    if not items:
+        return [key]
+    item_number = item_number_column(df, key)
+    return [key, item_number] if item_number else list(df.columns)
+
+
+def row_hashes(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    """Hash de 64 bits das colunas-chave de cada linha.
+
+    Números são comparados como float64 para que `5` lido de um CSV novo e
+    `5` já compactado para int32 tenham o mesmo hash; categorias têm o mesmo
+    hash do texto original.
+    """
+    keys = {}
+    for col in columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            series = series.astype(np.float64)
+        keys[col] = series.reset_index(drop=True)
+    return pd.util.hash_pandas_object(pd.DataFrame(keys), index=False).to_numpy(dtype=np.uint64)
+
+
+def _sorted_unique(hashes: np.ndarray) -> np.ndarray:
+    # Ordenar e comparar vizinhos é bem mais rápido que np.unique para hashes de 64 bits
+    ordered = np.sort(hashes)
+    keep = np.ones(len(ordered), dtype=bool)
+    keep[1:] = ordered[1:] != ordered[:-1]
+    return ordered[keep]
+
+
+class RowIndex:
+    """Conjunto de hashes em segmentos ordenados.
+
+    Cada carga acrescenta um segmento; a busca é uma `searchsorted` por
+    segmento, então consultar e inserir custa proporcional às linhas novas
+    (vezes log do total). Quando os segmentos passam de `MAX_SEGMENTS`, eles
+    são fundidos em um só.
+    """
+
+    def __init__(self):
+        self.segments: List[np.ndarray] = []
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: Sequence[str]) -> "RowIndex":
+        index = cls()
+        index.add(row_hashes(df, columns))
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Máscara dos hashes que já estão no índice"""
+        found = np.zeros(len(hashes), dtype=bool)
+        for segment in self.segments:
+            positions = np.searchsorted(segment, hashes)
+            inside = positions < len(segment)
+            found[inside] |= segment[positions[inside]] == hashes[inside]
+        return found
+
+    def add(self, hashes: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        self.segments.append(_sorted_unique(hashes))
+        if len(self.segments) > MAX_SEGMENTS:
+            self.segments = [_sorted_unique(np.concatenate(self.segments))]
+
+    def new_rows(self, hashes: np.ndarray) -> np.ndarray:
+        """Máscara das linhas ainda não vistas (nem no índice nem antes no próprio bloco)"""
+        return ~self.contains(hashes) & ~pd.Series(hashes).duplicated().to_numpy()
+
+    def copy(self) -> "RowIndex":
+        """Cópia independente (os segmentos, que nunca são alterados, são reaproveitados)"""
+        index = RowIndex()
+        index.segments = list(self.segments)
+        return index
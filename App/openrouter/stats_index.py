@@ -0,0 +1,227 @@
+"""Índice de estatísticas por coluna, construído na carga e atualizado incrementalmente"""
+import base64
+import copy
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Precisão do HyperLogLog (2^12 registradores, erro típico de ~1,6%)
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+# Até quantos valores distintos a contagem por valor é exata; depois vira aproximada (top-k)
+EXACT_DISTINCT_LIMIT = 10_000
+TOPK_CAPACITY = 1_000
+
+
+def _column_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return 'text'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    return 'text'
+
+
+def _hll_add(registers: np.ndarray, values: pd.Series) -> None:
+    """Atualiza os registradores do HyperLogLog com os hashes dos valores"""
+    if values.empty:
+        return
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    # Bit sentinela garante w > 0 e limita o posto ao tamanho da parte restante
+    rest = (hashes << np.uint64(HLL_PRECISION)) | np.uint64(1 << (HLL_PRECISION - 1))
+    rank = (64 - np.floor(np.log2(rest.astype(np.float64)))).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+
+def _hll_estimate(registers: np.ndarray) -> float:
+    m = float(HLL_REGISTERS)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / float(np.sum(np.power(2.0, -registers.astype(np.float64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # correção para cardinalidades pequenas
+    return estimate
+
+
+class ColumnStats:
+    """Estatísticas de uma coluna: contagens, momentos, extremos, distintos e valores mais frequentes"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.nulls = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # soma dos quadrados dos desvios (Welford/Chan)
+        self.min: Any = None
+        self.max: Any = None
+        self.registers = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+        self.counts = pd.Series(dtype='int64')  # valor -> ocorrências
+        self.exact = True
+
+    def update(self, series: pd.Series) -> None:
+        """Incorpora os valores de um bloco em uma única passada vetorizada"""
+        valid = series.dropna()
+        n = len(valid)
+        self.nulls += len(series) - n
+        if n == 0:
+            return
+
+        if self.kind == 'numeric':
+            values = valid.to_numpy(dtype=np.float64)
+            chunk_mean = float(values.mean())
+            chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+            total = self.count + n
+            delta = chunk_mean - self.mean
+            self.m2 += chunk_m2 + delta * delta * self.count * n / total
+            self.mean += delta * n / total
+            self.sum += float(values.sum())
+            low, high = float(values.min()), float(values.max())
+        elif self.kind == 'datetime':
+            low, high = valid.min(), valid.max()
+        else:
+            low = high = None
+            self._update_counts(valid)
+
+        if low is not None:
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        self.count += n
+        _hll_add(self.registers, valid)
+
+    def _update_counts(self, valid: pd.Series) -> None:
+        chunk_counts = valid.value_counts(sort=False)
+        chunk_counts = chunk_counts[chunk_counts > 0]
+        if isinstance(chunk_counts.index, pd.CategoricalIndex):
+            chunk_counts.index = chunk_counts.index.astype(object)
+        if self.counts.empty:
+            self.counts = chunk_counts.astype('int64')
+        else:
+            self.counts = self.counts.add(chunk_counts, fill_value=0).astype('int64')
+        if len(self.counts) > EXACT_DISTINCT_LIMIT or (not self.exact and len(self.counts) > TOPK_CAPACITY):
+            # Mantém apenas os mais frequentes: contagem vira aproximada a partir daqui
+            self.exact = False
+            self.counts = self.counts.nlargest(TOPK_CAPACITY)
+
+    @property
+    def distinct(self) -> int:
+        """Quantidade de valores distintos (exata enquanto possível, senão estimada)"""
+        if self.kind == 'text' and self.exact:
+            return len(self.counts)
+        return int(round(min(_hll_estimate(self.registers), self.count)))
+
+    @property
+    def distinct_is_exact(self) -> bool:
+        return self.kind == 'text' and self.exact
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    def copy(self) -> "ColumnStats":
+        """Cópia independente (os registradores são alterados no lugar por `update`)"""
+        stats = copy.copy(self)
+        stats.registers = self.registers.copy()
+        stats.counts = self.counts.copy()
+        return stats
+
+    def top(self, k: int = 5) -> List[Any]:
+        """Valores mais frequentes (colunas de texto)"""
+        return self.counts.nlargest(k).index.tolist()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'count': self.count,
+            'nulls': self.nulls,
+            'sum': self.sum,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': None if self.min is None else (str(self.min) if self.kind == 'datetime' else self.min),
+            'max': None if self.max is None else (str(self.max) if self.kind == 'datetime' else self.max),
+            'registers': base64.b64encode(self.registers.tobytes()).decode('ascii'),
+            'counts': [[value, int(count)] for value, count in self.counts.items()],
+            'exact': self.exact,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ColumnStats":
+        stats = cls(data['kind'])
+        stats.count = int(data['count'])
+        stats.nulls = int(data['nulls'])
+        stats.sum = float(data['sum'])
+        stats.mean = float(data['mean'])
+        stats.m2 = float(data['m2'])
+        stats.min, stats.max = data['min'], data['max']
+        if stats.kind == 'datetime' and stats.min is not None:
+            stats.min, stats.max = pd.Timestamp(stats.min), pd.Timestamp(stats.max)
+        stats.registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        stats.counts = pd.Series(
+            [count for _, count in data['counts']],
+            index=[value for value, _ in data['counts']],
+            dtype='int64',
+        )
+        stats.exact = bool(data['exact'])
+        return stats
+
+
+class FrameStats:
+    """Índice de estatísticas de um DataFrame, mantido bloco a bloco.
+
+    Construído durante a carga (ou a partir de um DataFrame pronto) e
+    atualizado com `update` quando novas linhas chegam; as consultas de resumo
+    passam a custar O(colunas) em vez de varrer os dados.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, ColumnStats] = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FrameStats":
+        stats = cls()
+        stats.update(df)
+        return stats
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Incorpora um novo bloco de linhas ao índice"""
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnStats(_column_kind(chunk[col]))
+            self.columns[col].update(chunk[col])
+
+    def reconcile(self, df: pd.DataFrame) -> None:
+        """Reconstrói as colunas cujo tipo final (após juntar os blocos) difere do visto nos blocos"""
+        for col in df.columns:
+            current = self.columns.get(col)
+            if current is None or current.kind != _column_kind(df[col]):
+                rebuilt = ColumnStats(_column_kind(df[col]))
+                rebuilt.update(df[col])
+                self.columns[col] = rebuilt
+
+    def copy(self) -> "FrameStats":
+        """Cópia independente, para preparar atualizações sem mexer no índice em uso"""
+        stats = FrameStats()
+        stats.rows = self.rows
+        stats.columns = {col: column.copy() for col, column in self.columns.items()}
+        return stats
+
+    def get(self, col: str) -> Optional[ColumnStats]:
+        return self.columns.get(col)
+
+    def of_kind(self, kind: str) -> List[str]:
+        return [col for col, stats in self.columns.items() if stats.kind == kind]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'rows': self.rows, 'columns': {col: stats.to_dict() for col, stats in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FrameStats":
+        stats = cls()
+        stats.rows = int(data.get('rows', 0))
+        stats.columns = {col: ColumnStats.from_dict(values) for col, values in data.get('columns', {}).items()}
+        return stats
@@ -0,0 +1,236 @@
+"""Gerador vetorizado de notas fiscais sintéticas (cabeçalho e itens) para demonstração e testes de carga
+
+Uso:
+    python synthetic_data.py --nfs 3000000 --mean-items 3.3 --format feather --out dados/
+
+Os dados são gerados em blocos de NFs com NumPy, sem laços por item; cada
+bloco usa um gerador derivado de (semente, número do bloco), então o mesmo
+`seed` e o mesmo `chunk_nfs` produzem sempre os mesmos arquivos.
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_NFS = 500_000
+
+SUPPLIERS = ['Empresa Alpha Ltda', 'Beta Soluções SA', 'Gamma Tech Corp', 'Delta Serviços', 'Epsilon Materiais']
+STATUSES = ['Pago', 'Pendente', 'Cancelado']
+STATUS_WEIGHTS = [0.7, 0.2, 0.1]
+CATEGORIES = ['Material de Escritório', 'Equipamentos de TI', 'Serviços de Consultoria', 'Material de Limpeza', 'Manutenção']
+PRODUCTS = ['Notebook Dell', 'Impressora HP', 'Mouse Óptico', 'Teclado Mecânico', 'Monitor 24"', 'Papel A4', 'Caneta Esferográfica']
+UNITS = ['UN', 'PC', 'KG', 'CX', 'LT']
+
+
+@dataclass
+class SyntheticSpec:
+    """Parâmetros do conjunto de dados sintético.
+
+    `item_distribution` é 'uniform' (entre `min_items` e `max_items`) ou
+    'poisson' (média `mean_items`, limitada ao mesmo intervalo).
+    `supplier_skew` > 0 concentra as notas nos primeiros fornecedores (Zipf).
+    Sem `end_date`, as datas de emissão avançam um dia por NF.
+    """
+    num_nfs: int = 100
+    item_distribution: str = 'uniform'
+    min_items: int = 1
+    max_items: int = 5
+    mean_items: float = 3.0
+    num_suppliers: int = len(SUPPLIERS)
+    supplier_skew: float = 0.0
+    start_date: str = '2024-01-01'
+    end_date: Optional[str] = None
+    seed: int = 42
+
+
+def supplier_names(count: int) -> List[str]:
+    """Nomes dos fornecedores: os cinco do exemplo original e depois nomes numerados"""
+    width = len(str(count))
+    return SUPPLIERS[:count] + [f'Fornecedor {i:0{width}d}' for i in range(len(SUPPLIERS) + 1, count + 1)]
+
+
+def _weights(count: int, skew: float) -> Optional[np.ndarray]:
+    if skew <= 0:
+        return None
+    weights = 1.0 / np.power(np.arange(1, count + 1, dtype=np.float64), skew)
+    return weights / weights.sum()
+
+
+def _labels(rng: np.random.Generator, categories: List[str], size: int, p=None) -> pd.Categorical:
+    codes = rng.choice(len(categories), size=size, p=p).astype(np.int32)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def nf_number_width(num_nfs: int) -> int:
+    """Dígitos do número da NF, fixos para o conjunto inteiro (a ordem textual segue a numérica em todos os blocos)"""
+    return max(6, len(str(num_nfs)))
+
+
+def _nf_numbers(start: int, stop: int, width: int) -> np.ndarray:
+    digits = np.arange(start + 1, stop + 1, dtype=np.int64).astype(f'U{width}')
+    return np.char.add('NF', np.char.zfill(digits, width)).astype(object)
+
+
+def _item_counts(spec: SyntheticSpec, rng: np.random.Generator, size: int) -> np.ndarray:
+    if spec.item_distribution == 'uniform':
+        return rng.integers(spec.min_items, spec.max_items + 1, size=size)
+    if spec.item_distribution == 'poisson':
+        return np.clip(rng.poisson(spec.mean_items, size=size), spec.min_items, spec.max_items)
+    raise ValueError(f"distribuição de itens desconhecida: {spec.item_distribution!r}")
+
+
+def generate_chunk(spec: SyntheticSpec, start: int, stop: int, rng: np.random.Generator) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Gera as NFs `start` a `stop - 1` (cabeçalho e itens) de uma só vez"""
+    size = stop - start
+    numbers = _nf_numbers(start, stop, nf_number_width(spec.num_nfs))
+
+    first_day = pd.Timestamp(spec.start_date)
+    span_days = (pd.Timestamp(spec.end_date) - first_day).days + 1 if spec.end_date else spec.num_nfs
+    days = (np.arange(start, stop, dtype=np.int64) * span_days) // max(spec.num_nfs, 1)
+
+    suppliers = supplier_names(spec.num_suppliers)
+    cabecalho = pd.DataFrame({
+        'numero_nf': numbers,
+        'fornecedor': _labels(rng, suppliers, size, _weights(len(suppliers), spec.supplier_skew)),
+        'data_emissao': first_day + pd.to_timedelta(days, unit='D'),
+        'valor_total': rng.uniform(1000, 50000, size).round(2),
+        'status': _labels(rng, STATUSES, size, STATUS_WEIGHTS),
+        'categoria': _labels(rng, CATEGORIES, size),
+    })
+
+    counts = _item_counts(spec, rng, size)
+    total = int(counts.sum())
+    offsets = np.cumsum(counts) - counts
+    quantidade = rng.integers(1, 50, total)
+    valor_unitario = rng.uniform(10, 2000, total).round(2)
+    itens = pd.DataFrame({
+        'numero_nf': np.repeat(numbers, counts),
+        'item_numero': np.arange(total) - np.repeat(offsets, counts) + 1,
+        'descricao': _labels(rng, PRODUCTS, total),
+        'quantidade': quantidade,
+        'valor_unitario': valor_unitario,
+        'valor_total_item': (quantidade * valor_unitario).round(2),
+        'unidade': _labels(rng, UNITS, total),
+    })
+    return cabecalho, itens
+
+
+def iter_chunks(spec: SyntheticSpec, chunk_nfs: int = DEFAULT_CHUNK_NFS) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Gera o conjunto em blocos de até `chunk_nfs` notas fiscais"""
+    for index, start in enumerate(range(0, spec.num_nfs, chunk_nfs)):
+        rng = np.random.default_rng([spec.seed, index])
+        yield generate_chunk(spec, start, min(start + chunk_nfs, spec.num_nfs), rng)
+
+
+def generate_frames(spec: SyntheticSpec, chunk_nfs: int = DEFAULT_CHUNK_NFS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Gera o conjunto completo em memória (cabeçalho, itens)"""
+    chunks = list(iter_chunks(spec, chunk_nfs))
+    if len(chunks) == 1:
+        return chunks[0]
+    cabecalho = pd.concat([chunk[0] for chunk in chunks], ignore_index=True)
+    itens = pd.concat([chunk[1] for chunk in chunks], ignore_index=True)
+    return cabecalho, itens
+
+
+def _pyarrow():
+    """pyarrow é opcional e só é importado ao gravar em parquet/feather"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("pyarrow é necessário para gravar em parquet/feather") from None
+    return pa, pq
+
+
+class _TableWriter:
+    """Escreve um DataFrame bloco a bloco em CSV, Parquet ou Feather (Arrow IPC)"""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.fmt == 'csv':
+            df.to_csv(self.path, mode='w' if self._writer is None else 'a', header=self._writer is None, index=False)
+            self._writer = True
+            return
+        pa, pq = _pyarrow()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            if self.fmt == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self.fmt != 'csv' and self._writer is not None:
+            self._writer.close()
+
+
+def write_dataset(
+    spec: SyntheticSpec,
+    directory: str,
+    fmt: str = 'csv',
+    chunk_nfs: int = DEFAULT_CHUNK_NFS,
+) -> Tuple[str, str]:
+    """Grava `cabecalho.<fmt>` e `itens.<fmt>` em `directory` sem manter o conjunto inteiro em memória"""
+    if fmt not in ('csv', 'parquet', 'feather'):
+        raise ValueError(f"formato desconhecido: {fmt!r}")
+    if fmt != 'csv':
+        _pyarrow()
+
+    os.makedirs(directory, exist_ok=True)
+    paths = (os.path.join(directory, f'cabecalho.{fmt}'), os.path.join(directory, f'itens.{fmt}'))
+    writers = [_TableWriter(path, fmt) for path in paths]
+    try:
+        for chunk in iter_chunks(spec, chunk_nfs):
+            for writer, df in zip(writers, chunk):
+                writer.write(df)
+    finally:
+        for writer in writers:
+            writer.close()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera notas fiscais sintéticas (cabeçalho e itens)")
+    parser.add_argument("--nfs", type=int, default=100_000, help="quantidade de notas fiscais")
+    parser.add_argument("--distribution", choices=['uniform', 'poisson'], default='uniform')
+    parser.add_argument("--min-items", type=int, default=1)
+    parser.add_argument("--max-items", type=int, default=5)
+    parser.add_argument("--mean-items", type=float, default=3.0)
+    parser.add_argument("--suppliers", type=int, default=len(SUPPLIERS))
+    parser.add_argument("--supplier-skew", type=float, default=0.0)
+    parser.add_argument("--start-date", default='2024-01-01')
+    parser.add_argument("--end-date")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-nfs", type=int, default=DEFAULT_CHUNK_NFS)
+    parser.add_argument("--format", choices=['csv', 'parquet', 'feather'], default='csv')
+    parser.add_argument("--out", default='.', help="diretório de saída")
+    args = parser.parse_args()
+
+    spec = SyntheticSpec(
+        num_nfs=args.nfs,
+        item_distribution=args.distribution,
+        min_items=args.min_items,
+        max_items=args.max_items,
+        mean_items=args.mean_items,
+        num_suppliers=args.suppliers,
+        supplier_skew=args.supplier_skew,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    paths = write_dataset(spec, args.out, args.format, args.chunk_nfs)
+    print(f"{', '.join(paths)} gerados em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Configuração comum dos testes: módulos do app no caminho e caches/logs em um diretório temporário"""
+import io
+import os
+import sys
+import tempfile
+
+# Definido antes de importar os módulos do app, que leem as variáveis na importação
+_CACHE_DIR = tempfile.mkdtemp(prefix="analisador_nf_testes_")
+os.environ.setdefault("PARSE_CACHE_DIR", os.path.join(_CACHE_DIR, "parse"))
+os.environ.setdefault("DATASET_STORE_DIR", os.path.join(_CACHE_DIR, "datasets"))
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(_CACHE_DIR, "respostas.sqlite3"))
+os.environ.setdefault("METRICS_LOG", os.path.join(_CACHE_DIR, "metricas.jsonl"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from mock_openrouter import start_mock_server  # noqa: E402
+
+
+@pytest.fixture
+def mock_server():
+    """Fábrica de servidores simulados do OpenRouter, encerrados ao fim do teste"""
+    servers = []
+
+    def start(**options):
+        server, url = start_mock_server(**options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def make_agent(mock_server):
+    """Agente com dados de exemplo apontando para um servidor simulado (sem cache de respostas nem roteamento)"""
+    from main import OpenRouterAgent
+    from response_cache import ResponseCache
+    from synthetic_data import SyntheticSpec
+
+    def make(num_nfs: int = 50, model: str = "mock/modelo", url: str = None, **options):
+        if url is None:
+            _, url = mock_server(**options)
+        agent = OpenRouterAgent("chave", model=model, base_url=url)
+        agent.response_cache = ResponseCache(enabled=False)
+        agent.routing = agent.hedging = False
+        assert agent.create_sample_data(SyntheticSpec(num_nfs=num_nfs))
+        return agent
+
+    return make
+
+
+class Upload(io.BytesIO):
+    """Arquivo em memória com a interface do UploadedFile do Streamlit (`name` e `size`)"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+@pytest.fixture
+def csv_upload():
+    """Monta um upload CSV a partir de um DataFrame"""
+    def make(name: str, df):
+        return Upload(name, df.to_csv(index=False).encode('utf-8'))
+    return make
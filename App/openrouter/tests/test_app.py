@@ -0,0 +1,73 @@
+import ast
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import main
+import prompt_builder
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _top_level_imports(module: str):
+    with open(os.path.join(APP_DIR, f"{module}.py"), encoding="utf-8") as source:
+        tree = ast.parse(source.read())
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+@pytest.mark.parametrize('module, heavy', [
+    ('main', {'plotly', 'tiktoken', 'torch', 'transformers'}),
+    ('prompt_builder', {'tiktoken'}),
+    ('synthetic_data', {'pyarrow'}),
+])
+def test_heavy_dependencies_are_not_imported_at_module_level(module, heavy):
+    assert not _top_level_imports(module) & heavy
+
+
+def test_tiktoken_is_resolved_on_first_count(monkeypatch):
+    prompt_builder._tiktoken.cache_clear()
+    prompt_builder._encoding_for.cache_clear()
+    assert prompt_builder._tiktoken.cache_info().currsize == 0
+    prompt_builder.count_tokens("texto", "m")
+    assert prompt_builder._tiktoken.cache_info().currsize == 1
+
+
+def test_sections_are_fragments():
+    import streamlit as st
+    assert main.fragment is (getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None))
+
+
+def test_data_summary_is_memoized_by_dataset_key(make_agent, monkeypatch):
+    main.cached_data_summary.clear()
+    first, second = make_agent(num_nfs=45), make_agent(num_nfs=45)
+    assert first.dataset is second.dataset
+    calls = []
+    original = main.OpenRouterAgent.get_data_summary
+    monkeypatch.setattr(main.OpenRouterAgent, 'get_data_summary', lambda self: calls.append(self) or original(self))
+    summaries = [main.cached_data_summary(agent.dataset.key, agent) for agent in (first, second, first)]
+    assert len(calls) == 1
+    assert summaries[0] == summaries[1] and summaries[0]['total_registros_cabecalho'] == 45
+
+
+def test_app_renders_sample_data_and_survives_a_question_rerun():
+    app = AppTest.from_file(os.path.join(APP_DIR, "main.py"), default_timeout=60)
+    app.run()
+    assert "API Key" in app.warning[0].value
+    app.sidebar.text_input[0].input("chave")
+    app.sidebar.checkbox[0].check()
+    app.run()
+    assert not app.exception
+    assert [metric.value for metric in app.metric][:2] == ['100', '316']
+    assert '📈 Resumo dos Dados' in [header.value for header in app.subheader]
+
+    app.text_area[0].input("Quantas notas existem?")
+    app.run()
+    assert not app.exception
+    assert '📈 Resumo dos Dados' in [header.value for header in app.subheader]
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from compaction import append_frames, compact_frames
+from ingest import MemoryLimitExceeded
+from joins import CombinedView
+from row_index import RowIndex, key_columns, row_hashes
+from synthetic_data import SyntheticSpec, generate_frames
+
+
+def _csv_frames(num_nfs: int, seed: int):
+    header, items = generate_frames(SyntheticSpec(num_nfs=num_nfs, seed=seed))
+    header['data_emissao'] = header['data_emissao'].dt.strftime('%d/%m/%Y')
+    return header, items
+
+
+_seeds = itertools.count(100)
+
+
+@pytest.fixture
+def loaded(make_agent, csv_upload):
+    """Agente com cabeçalho e itens carregados de CSV e um lote novo (com sobreposição) para anexar
+
+    Cada uso gera dados próprios: o registro de conjuntos é compartilhado no processo.
+    """
+    header, items = _csv_frames(60, seed=next(_seeds))
+    agent = make_agent()
+    assert agent.load_csv_files([csv_upload('cabecalho.csv', header.iloc[:40]), csv_upload('itens.csv', items[items['numero_nf'] <= 'NF000040'])])
+    new_header = header.iloc[30:]  # 10 NFs já carregadas + 20 novas
+    new_items = items[items['numero_nf'] > 'NF000030']
+    return agent, csv_upload('cabecalho_2.csv', new_header), csv_upload('itens_2.csv', new_items), header, items
+
+
+def test_row_index_detects_known_rows_and_repeats():
+    df = pd.DataFrame({'numero_nf': ['NF1', 'NF2', 'NF3'], 'item_numero': [1, 1, 2]})
+    columns = key_columns(df, 'numero_nf', items=True)
+    assert columns == ['numero_nf', 'item_numero']
+    index = RowIndex.from_frame(df, columns)
+    incoming = pd.DataFrame({'numero_nf': ['NF1', 'NF4', 'NF4'], 'item_numero': [1.0, 1.0, 1.0]})
+    assert index.new_rows(row_hashes(incoming, columns)).tolist() == [False, True, False]
+    copy = index.copy()
+    copy.add(row_hashes(incoming, columns))
+    assert len(copy) == 5 and len(index) == 3
+
+
+def test_append_frames_extends_shared_dictionaries_without_recoding():
+    compacted, _ = compact_frames({
+        'cabecalho': pd.DataFrame({'numero_nf': ['NF1', 'NF2'], 'uf': ['SP', 'SP']}),
+        'itens': pd.DataFrame({'numero_nf': ['NF1', 'NF1', 'NF2'], 'qtd': [1, 2, 3]}),
+    })
+    old_codes = compacted['itens']['numero_nf'].cat.codes.tolist()
+    appended = append_frames(compacted, {
+        'cabecalho': pd.DataFrame({'numero_nf': ['NF3'], 'uf': ['RJ']}),
+        'itens': pd.DataFrame({'numero_nf': ['NF3'], 'qtd': [300]}),
+    })
+    header, items = appended['cabecalho'], appended['itens']
+    assert header['numero_nf'].dtype == items['numero_nf'].dtype
+    assert items['numero_nf'].cat.codes.tolist()[:3] == old_codes
+    assert items['numero_nf'].tolist() == ['NF1', 'NF1', 'NF2', 'NF3']
+    assert items['qtd'].tolist() == [1, 2, 3, 300] and items['qtd'].dtype == np.int32
+    assert header['uf'].tolist() == ['SP', 'SP', 'RJ']
+    with pytest.raises(ValueError):
+        append_frames(compacted, {'itens': pd.DataFrame({'numero_nf': ['NF4']})})
+
+
+def test_append_adds_only_new_rows_and_matches_a_full_load(loaded):
+    agent, new_header, new_items, header, items = loaded
+    assert agent.append_csv_files([new_header, new_items])
+    assert len(agent.cabecalho_df) == len(header)
+    assert len(agent.itens_df) == len(items)
+    assert [entry.duplicates for entry in agent.ingested_files[-2:]] == [10, len(items[(items['numero_nf'] > 'NF000030') & (items['numero_nf'] <= 'NF000040')])]
+    assert agent.cabecalho_stats.rows == len(header) and agent.itens_stats.rows == len(items)
+    assert agent.cabecalho_stats.get('valor_total').sum == pytest.approx(header['valor_total'].sum())
+    assert len(agent.combined_df) == len(pd.merge(header, items, on='numero_nf', how='left'))
+    # Repetir o mesmo anexo não muda nada
+    assert agent.append_csv_files([new_header, new_items])
+    assert len(agent.itens_df) == len(items)
+
+
+@pytest.mark.parametrize('error', [MemoryLimitExceeded('teto'), RuntimeError('falha')])
+def test_failed_append_leaves_tables_and_stats_untouched(loaded, monkeypatch, error):
+    agent, new_header, new_items, _, _ = loaded
+    published = agent.dataset
+    before = {table: (getattr(agent, f"{table}_stats").rows, getattr(agent, f"{table}_stats").get('numero_nf').count) for table in ('cabecalho', 'itens')}
+
+    def fail(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(CombinedView, 'extend', fail)
+
+    assert not agent.append_csv_files([new_header, new_items])
+    assert agent.dataset is published
+    for table, (rows, count) in before.items():
+        stats = getattr(agent, f"{table}_stats")
+        assert (stats.rows, stats.get('numero_nf').count) == (rows, count)
+        assert stats.rows == len(getattr(agent, f"{table}_df"))
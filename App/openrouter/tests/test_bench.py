@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import bench
+from openrouter_client import OpenRouterClient
+
+
+def _questions(tmp_path, lines):
+    path = tmp_path / "perguntas.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_read_questions_accepts_field_aliases_and_skips_blank_lines(tmp_path):
+    path = _questions(tmp_path, [
+        json.dumps({"id": "a", "question": "Q1"}),
+        "",
+        json.dumps({"request_id": "b", "pergunta": "Q2"}),
+        json.dumps({"title": "Q3"}),
+    ])
+    assert bench.read_questions(path) == [
+        {"id": "a", "question": "Q1"},
+        {"id": "b", "question": "Q2"},
+        {"id": "4", "question": "Q3"},
+    ]
+
+
+def test_read_questions_rejects_lines_without_question(tmp_path):
+    path = _questions(tmp_path, [json.dumps({"id": "a"})])
+    with pytest.raises(ValueError, match=":1:"):
+        bench.read_questions(path)
+
+
+def test_percentiles():
+    assert bench.percentiles([]) == {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    result = bench.percentiles(list(range(1, 101)))
+    assert result['p50'] == pytest.approx(50.5)
+    assert result['p95'] == pytest.approx(95.05)
+
+
+def test_run_batch_answers_in_order_with_summary(make_agent):
+    agent = make_agent(delay=0.25)
+    questions = [{"id": str(i), "question": f"Quantas NFs existem? ({i})"} for i in range(8)]
+    batch = bench.run_batch(agent, questions, workers=4)
+    records, summary = batch['records'], batch['summary']
+    assert [record['id'] for record in records] == [str(i) for i in range(8)]
+    assert all(record['status'] == 'ok' and record['answer'] == "Resposta simulada." for record in records)
+    assert summary['perguntas'] == 8 and summary['erros'] == 0
+    assert summary['tempo_total'] < 8 * 0.25 * 0.6  # em série seriam 2 s; com 4 workers, ~0,5 s
+    assert summary['tokens'] > 0
+    assert 'modelo' in summary['etapas']
+
+
+def test_main_with_mock_server_writes_results(tmp_path, capsys):
+    path = _questions(tmp_path, [json.dumps({"id": i, "question": f"Qual o valor total? {i}"}) for i in range(3)])
+    output = tmp_path / "resultados.jsonl"
+    code = bench.main([path, "--sample", "--sample-nfs", "30", "--mock", "--mock-delay", "0", "--output", str(output)])
+    assert code == 0
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [record['id'] for record in records] == ["0", "1", "2"]
+    err = capsys.readouterr().err
+    assert json.loads(err[err.index("{"):])['perguntas'] == 3
+
+
+def test_read_questions_keeps_zero_ids(tmp_path):
+    path = _questions(tmp_path, [json.dumps({"id": 0, "question": "Q"})])
+    assert bench.read_questions(path) == [{"id": "0", "question": "Q"}]
+
+
+def test_main_closes_clients_and_mock_server_on_failure(tmp_path, monkeypatch):
+    closed, servers = [], []
+    original_close, original_start = OpenRouterClient.close, bench.start_mock_server
+
+    def close(client):
+        closed.append(client)
+        original_close(client)
+
+    def start(**options):
+        server, url = original_start(**options)
+        servers.append(server)
+        return server, url
+
+    monkeypatch.setattr(OpenRouterClient, "close", close)
+    monkeypatch.setattr(bench, "start_mock_server", start)
+    monkeypatch.setattr(bench, "load_data", lambda agent, args: False)
+    path = _questions(tmp_path, [json.dumps({"id": 1, "question": "Q"})])
+    assert bench.main([path, "--sample", "--mock"]) == 1
+    # O cliente original do agente e o do benchmark são fechados, mesmo sem chegar ao fim
+    assert len(closed) == 2 and closed[0] is not closed[1]
+    assert servers[0].socket.fileno() == -1
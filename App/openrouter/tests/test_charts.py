@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import OTHERS_LABEL, build_chart_data, lttb
+from synthetic_data import SyntheticSpec, generate_frames
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(10_000, dtype=np.float64)
+    y = np.sin(x / 300)
+    y[4321] = 50.0  # pico isolado
+    y[7777] = -50.0  # vale isolado
+    keep = lttb(x, y, 200)
+    assert len(keep) == 200
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert (np.diff(keep) > 0).all()
+    assert {4321, 7777} <= set(keep.tolist())
+
+
+@pytest.mark.parametrize('threshold', [2, 10, 50])
+def test_lttb_returns_everything_when_there_is_nothing_to_reduce(threshold):
+    x = np.arange(10, dtype=np.float64)
+    assert lttb(x, x, threshold).tolist() == list(range(10))
+
+
+def test_chart_data_size_does_not_depend_on_rows():
+    header, items = generate_frames(SyntheticSpec(num_nfs=20_000, num_suppliers=40, end_date='2026-12-31'))
+    charts = build_chart_data(header, items, max_points=100, top_n=5)
+    assert charts.daily_points > 100
+    assert len(charts.daily) == 100
+    assert len(charts.suppliers) == 6 and charts.suppliers['fornecedor'].iloc[-1] == OTHERS_LABEL
+    assert charts.rows == len(header)
+
+
+def test_aggregates_match_pandas():
+    header, items = generate_frames(SyntheticSpec(num_nfs=3000, num_suppliers=8, end_date='2024-06-30'))
+    charts = build_chart_data(header, items, max_points=10_000, top_n=20)
+
+    daily = header.groupby(header['data_emissao'].dt.normalize())['valor_total'].sum()
+    assert charts.daily['faturamento'].to_numpy() == pytest.approx(daily.to_numpy())
+    monthly = header.groupby(header['data_emissao'].dt.to_period('M')).agg(faturamento=('valor_total', 'sum'), notas=('valor_total', 'size'))
+    assert charts.monthly['faturamento'].to_numpy() == pytest.approx(monthly['faturamento'].to_numpy())
+    assert charts.monthly['notas'].tolist() == monthly['notas'].tolist()
+
+    suppliers = header.groupby('fornecedor', observed=True)['valor_total'].sum().sort_values(ascending=False)
+    assert charts.suppliers['fornecedor'].tolist() == suppliers.index.astype(str).tolist()
+    assert charts.suppliers['faturamento'].to_numpy() == pytest.approx(suppliers.to_numpy())
+    status = charts.distributions['status'].set_index('status')
+    assert status['notas'].to_dict() == header['status'].value_counts().to_dict()
+
+
+def test_others_row_sums_the_tail():
+    header = pd.DataFrame({
+        'fornecedor': list('ABCDE') * 2,
+        'valor_total': [50.0, 40.0, 30.0, 20.0, 10.0] * 2,
+    })
+    suppliers = build_chart_data(header, top_n=2).suppliers
+    assert suppliers['fornecedor'].tolist() == ['A', 'B', OTHERS_LABEL]
+    assert suppliers['faturamento'].tolist() == [100.0, 80.0, 120.0]
+    assert suppliers['notas'].tolist() == [2, 2, 6]
+
+
+def test_brazilian_text_dates_are_day_first():
+    header = pd.DataFrame({
+        'data_emissao': ['15/01/2024', '20/01/2024', '03/02/2024', '03/02/2024'],
+        'valor_total': [1.0, 2.0, 3.0, 4.0],
+    })
+    daily = build_chart_data(header).daily
+    assert daily['data'].dt.strftime('%Y-%m-%d').tolist() == ['2024-01-15', '2024-01-20', '2024-02-03']
+    assert daily['faturamento'].tolist() == [1.0, 2.0, 7.0]
+    # Com todos os dias até 12, ler mês antes do dia trocaria as datas em silêncio
+    header['data_emissao'] = ['01/02/2024', '05/02/2024', '10/03/2024', '10/03/2024']
+    daily = build_chart_data(header).daily
+    assert daily['data'].dt.strftime('%Y-%m-%d').tolist() == ['2024-02-01', '2024-02-05', '2024-03-10']
+
+
+def test_missing_columns_and_text_dates():
+    header = pd.DataFrame({'data_emissao': ['01/02/2024', 'inválida', '03/02/2024'], 'valor_total': [1.0, 2.0, 3.0]})
+    charts = build_chart_data(header)
+    assert charts.daily['faturamento'].sum() == pytest.approx(1.0 + 3.0)
+    assert charts.suppliers is None and charts.distributions == {}
+    assert build_chart_data(pd.DataFrame({'x': [1]})).empty
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from compaction import compact_frame, compact_frames, shared_categories
+
+
+def _frames(rows: int = 1000):
+    rng = np.random.default_rng(0)
+    numbers = [f"NF{i:06d}" for i in range(rows // 4)]
+    header = pd.DataFrame({
+        'numero_nf': numbers,
+        'fornecedor': rng.choice(['Alpha', 'Beta', 'Gamma'], len(numbers)),
+        'valor_total': rng.uniform(10, 1000, len(numbers)).round(2),
+        'parcelas': rng.integers(1, 12, len(numbers)),
+    })
+    items = pd.DataFrame({
+        'numero_nf': np.repeat(numbers, 4),
+        'descricao': rng.choice(['Papel', 'Caneta', 'Mouse'], rows),
+        'quantidade': rng.integers(1, 50, rows).astype(np.int64),
+        'saldo': rng.integers(-500, 500, rows).astype(np.int64),
+        'peso': np.full(rows, 2.0),
+        'observacao': [f"obs {i}" for i in range(rows)],
+    })
+    return {'cabecalho': header, 'itens': items}
+
+
+def test_compaction_preserves_values_and_reduces_memory():
+    frames = _frames()
+    compacted, report = compact_frames(frames)
+    for name, df in frames.items():
+        pd.testing.assert_frame_equal(
+            compacted[name].astype(object), df.astype(object), check_dtype=False,
+        )
+    # No cabeçalho a chave é única: o dicionário compartilhado não compensa ali, só nos itens
+    assert report.after_mb['itens'] < report.before_mb['itens']
+    converted = ['descricao'] + report.downcast['itens']  # a chave tem um valor a cada 4 linhas: ganho menor
+    before = frames['itens'][converted].memory_usage(deep=True).sum()
+    assert compacted['itens'][converted].memory_usage(deep=True).sum() < before / 2
+    assert set(report.categorical['itens']) >= {'numero_nf', 'descricao'}
+
+
+def test_integers_narrow_to_int32_and_floats_stay():
+    compacted, report = compact_frames(_frames())
+    items = compacted['itens']
+    assert items['quantidade'].dtype == np.int32
+    assert items['saldo'].dtype == np.int32
+    assert items['peso'].dtype == np.float64  # decimais inteiros continuam decimais
+    assert compacted['cabecalho']['valor_total'].dtype == np.float64  # nunca vira float32
+    assert report.downcast['itens'] == ['quantidade', 'saldo']
+    assert 'valor_total' not in report.downcast['cabecalho']
+
+
+def test_integers_beyond_int32_are_kept():
+    df = pd.DataFrame({'chave': np.array([0, 2 ** 40], dtype=np.int64)})
+    compacted, _, downcast = compact_frame(df, {})
+    assert compacted['chave'].dtype == np.int64 and downcast == []
+
+
+def test_arithmetic_on_compacted_columns_does_not_overflow():
+    df = pd.DataFrame({'quantidade': np.full(1000, 200, dtype=np.int64), 'peso': np.full(1000, 2.0)})
+    compacted, _, _ = compact_frame(df, {})
+    # Em uint8, 200 * 2 e a soma das quantidades dariam a volta
+    assert (compacted['quantidade'] * 2).tolist() == [400] * 1000
+    assert (compacted['quantidade'] * compacted['peso']).sum() == 400_000
+    assert compacted['quantidade'].sum() == 200_000
+    assert (compacted['quantidade'] * 20_000).max() == 4_000_000
+
+
+def test_high_cardinality_text_stays_text():
+    compacted, _ = compact_frames(_frames())
+    assert not isinstance(compacted['itens']['observacao'].dtype, pd.CategoricalDtype)
+
+
+def test_join_keys_share_one_dictionary_and_merge_keeps_the_category():
+    compacted, _ = compact_frames(_frames())
+    header, items = compacted['cabecalho'], compacted['itens']
+    # A chave é única no cabeçalho (razão 1), mas entra porque aparece nas duas tabelas
+    assert header['numero_nf'].dtype == items['numero_nf'].dtype
+    merged = header.merge(items, on='numero_nf', how='left')
+    assert isinstance(merged['numero_nf'].dtype, pd.CategoricalDtype)
+    assert len(merged) == len(items)
+
+
+def test_shared_categories_are_sorted_unions():
+    frames = {
+        'a': pd.DataFrame({'uf': ['SP', 'RJ', 'SP', 'SP']}),
+        'b': pd.DataFrame({'uf': ['MG', 'SP', 'MG', 'MG']}),
+    }
+    categories = shared_categories(frames)
+    assert categories['uf'].tolist() == ['MG', 'RJ', 'SP']
+
+
+def test_nulls_survive_compaction():
+    df = pd.DataFrame({'uf': ['SP', None, 'SP', 'RJ'], 'qtd': [1.0, np.nan, 3.0, 4.0]})
+    compacted, categorical, downcast = compact_frame(df, shared_categories({'t': df}))
+    assert categorical == ['uf'] and downcast == []
+    assert compacted['uf'].isna().tolist() == [False, True, False, False]
+    assert compacted['qtd'].dtype == np.float64
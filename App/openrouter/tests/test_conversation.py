@@ -0,0 +1,136 @@
+import pytest
+
+import prompt_builder
+from conversation import SUMMARY_ANSWER_CHARS, Conversation, Turn, extractive_summary, turns_text
+from main import OpenRouterAgent
+
+
+@pytest.fixture(autouse=True)
+def _estimated_tokens(monkeypatch):
+    # Contagem determinística, com ou sem tiktoken instalado
+    monkeypatch.setattr(prompt_builder, "_encoding_for", lambda model: None)
+
+
+def test_extractive_summary_appends_one_topic_per_turn():
+    turns = [Turn("Quantas notas?", "São   100\nnotas."), Turn("Maior UF?", "SP")]
+    summary = extractive_summary("- resumo anterior", turns)
+    assert summary.splitlines() == ["- resumo anterior", "- Quantas notas? → São 100 notas.", "- Maior UF? → SP"]
+
+
+def test_extractive_summary_cuts_long_answers_at_a_word():
+    answer = "palavra " * 100
+    line = extractive_summary("", [Turn("P", answer)])
+    topic = line.split(" → ", 1)[1]
+    assert topic.endswith("…") and len(topic) <= SUMMARY_ANSWER_CHARS + 1
+    assert topic[:-1].split(" ") == ["palavra"] * len(topic[:-1].split(" "))
+
+
+def test_messages_follow_the_conversation_order():
+    conversation = Conversation(token_budget=10_000)
+    assert conversation.messages() == []
+    conversation.add("P1", "R1")
+    conversation.add("P2", "R2")
+    assert conversation.messages() == [
+        {"role": "user", "content": "P1"}, {"role": "assistant", "content": "R1"},
+        {"role": "user", "content": "P2"}, {"role": "assistant", "content": "R2"},
+    ]
+    conversation.summary = "- antes"
+    assert conversation.messages()[0] == {"role": "system", "content": "RESUMO DA CONVERSA ATÉ AQUI:\n- antes"}
+
+
+def test_digest_changes_with_every_turn_and_the_summary():
+    conversation = Conversation(token_budget=10_000)
+    digests = {conversation.digest()}
+    conversation.add("P1", "R1")
+    digests.add(conversation.digest())
+    conversation.add("P2", "R2")
+    digests.add(conversation.digest())
+    conversation.summary = "resumo"
+    digests.add(conversation.digest())
+    assert len(digests) == 4
+    # Perguntas e respostas com separadores: mover texto de uma para a outra muda o digest
+    a, b = Conversation(), Conversation()
+    a.turns, b.turns = [Turn("ab", "c")], [Turn("a", "bc")]
+    assert a.digest() != b.digest()
+
+
+def test_add_stays_under_budget_without_summary():
+    conversation = Conversation(token_budget=10_000)
+    assert conversation.add("Quantas notas?", "100") is False
+    assert conversation.history_tokens > 0 and len(conversation) == 1 and conversation.summary == ''
+
+
+def test_add_compacts_old_turns_keeping_the_last_ones():
+    conversation = Conversation(token_budget=20, keep_turns=2)
+    answer = "x" * 35  # 10 tokens estimados
+    assert conversation.add("P1", answer) is False
+    compacted = [conversation.add(f"P{n}", answer) for n in (2, 3)]
+    assert compacted == [False, True]
+    assert [turn.question for turn in conversation.turns] == ["P2", "P3"]
+    assert conversation.summarized_turns == 1 and len(conversation) == 3
+    assert conversation.summary.startswith("- P1 → ")
+    assert conversation.history_tokens == conversation.summary_tokens + sum(turn.tokens for turn in conversation.turns)
+
+
+def test_compact_uses_summarizer_with_previous_summary():
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append((summary, [turn.question for turn in turns]))
+        return f"  resumo {len(calls)}  "
+
+    conversation = Conversation(token_budget=0, keep_turns=1)
+    conversation.add("P1", "R1", summarize)
+    conversation.add("P2", "R2", summarize)
+    conversation.add("P3", "R3", summarize)
+    assert calls == [("", ["P1"]), ("resumo 1", ["P2"])]
+    assert conversation.summary == "resumo 2"
+    assert [turn.question for turn in conversation.turns] == ["P3"]
+
+
+def test_compact_falls_back_to_extractive_summary_on_error():
+    def failing(summary, turns):
+        raise RuntimeError("modelo fora do ar")
+
+    conversation = Conversation(token_budget=0, keep_turns=1)
+    conversation.add("P1", "R1", failing)
+    conversation.add("P2", "R2", failing)
+    assert conversation.summary == "- P1 → R1"
+
+
+def test_clear_resets_history():
+    conversation = Conversation(token_budget=0, keep_turns=1)
+    conversation.add("P1", "R1")
+    conversation.add("P2", "R2")
+    conversation.clear()
+    assert len(conversation) == 0 and conversation.messages() == [] and conversation.history_tokens == 0
+
+
+def test_turns_text_labels_questions_and_answers():
+    assert turns_text([Turn("P1", "R1"), Turn("P2", "R2")]) == "PERGUNTA: P1\nRESPOSTA: R1\n\nPERGUNTA: P2\nRESPOSTA: R2"
+
+
+def test_agent_sends_history_and_summarizes_with_the_model(make_agent):
+    agent = make_agent(answer="resposta simulada")
+    conversation = Conversation(agent.dataset.key, agent.model, token_budget=0, keep_turns=1)
+    first = agent.answer_question("Quantas notas?", conversation=conversation)
+    assert first.ok and len(conversation) == 1 and conversation.summary == ''
+    messages, _ = agent._prepare_answer("Maior UF?", False, conversation, agent.route("Maior UF?"))
+    assert messages[1:] == [
+        {"role": "user", "content": "Quantas notas?"},
+        {"role": "assistant", "content": "resposta simulada"},
+        messages[-1],
+    ]
+    assert agent.answer_question("Maior UF?", conversation=conversation).ok
+    # A rodada antiga foi resumida pelo modelo (o servidor simulado responde o mesmo texto)
+    assert conversation.summary == "resposta simulada" and conversation.summarized_turns == 1
+    assert [turn.question for turn in conversation.turns] == ["Maior UF?"]
+
+
+def test_cache_mode_depends_on_conversation_state():
+    conversation = Conversation(token_budget=10_000)
+    empty = OpenRouterAgent._cache_mode(False, conversation)
+    conversation.add("P1", "R1")
+    assert OpenRouterAgent._cache_mode(False, conversation) != empty
+    assert OpenRouterAgent._cache_mode(False, None) == 'contexto'
+    assert OpenRouterAgent._cache_mode(True, None) == 'local'
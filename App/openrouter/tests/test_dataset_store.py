@@ -0,0 +1,85 @@
+import itertools
+
+import pytest
+
+from dataset_store import Dataset, DatasetStore, dataset_key
+from stats_index import FrameStats
+from synthetic_data import SyntheticSpec, generate_frames
+
+_seeds = itertools.count(500)
+
+
+def _dataset(key: str = 'k') -> Dataset:
+    header, items = generate_frames(SyntheticSpec(num_nfs=20))
+    return Dataset(
+        key=key, cabecalho_df=header, itens_df=items, combined_df=header,
+        cabecalho_stats=FrameStats.from_frame(header), itens_stats=FrameStats.from_frame(items),
+    )
+
+
+def test_dataset_key_depends_on_every_part():
+    assert dataset_key('csv', [('a.csv', 'h1')]) == dataset_key('csv', [('a.csv', 'h1')])
+    assert dataset_key('csv', [('a.csv', 'h1')]) != dataset_key('csv', [('a.csv', 'h2')])
+
+
+def test_publish_shares_one_copy_and_counts_references():
+    store = DatasetStore()
+    first = store.publish(_dataset())
+    second = store.publish(_dataset())
+    assert second is first and first.published
+    assert store.acquire('k') is first
+    assert store.references('k') == 3
+    for _ in range(3):
+        store.release('k')
+    assert store.acquire('k') is None  # sem memória ociosa nem disco, sai do registro
+
+
+def test_idle_datasets_are_kept_within_the_budget():
+    store = DatasetStore(idle_mb=1e6)
+    dataset = store.publish(_dataset())
+    store.release('k')
+    assert store.stats()['ociosos'] == 1
+    assert store.acquire('k') is dataset
+
+
+def test_draft_gets_its_own_statistics():
+    published = DatasetStore().publish(_dataset())
+    draft = published.draft()
+    assert not draft.published and draft.cabecalho_df is published.cabecalho_df
+    draft.cabecalho_stats.update(published.cabecalho_df.head(5))
+    draft.itens_stats.update(published.itens_df.head(5))
+    assert published.cabecalho_stats.rows == len(published.cabecalho_df)
+    assert published.itens_stats.rows == len(published.itens_df)
+
+
+def test_draft_keeps_a_single_index_for_a_single_table():
+    dataset = _dataset()
+    dataset.itens_df, dataset.itens_stats = dataset.cabecalho_df, dataset.cabecalho_stats
+    draft = dataset.draft()
+    assert draft.itens_stats is draft.cabecalho_stats
+    assert draft.cabecalho_stats is not dataset.cabecalho_stats
+
+
+def test_append_in_one_session_does_not_touch_another(make_agent, csv_upload):
+    header, items = generate_frames(SyntheticSpec(num_nfs=40, seed=next(_seeds)))
+    uploads = lambda: [csv_upload('cabecalho.csv', header.iloc[:30]), csv_upload('itens.csv', items[items['numero_nf'] <= 'NF000030'])]
+    first, second = make_agent(), make_agent()
+    assert first.load_csv_files(uploads()) and second.load_csv_files(uploads())
+    assert first.dataset is second.dataset
+    shared = second.dataset
+    total = shared.cabecalho_stats.get('valor_total').sum
+
+    assert first.append_csv_files([csv_upload('cabecalho_2.csv', header.iloc[30:]), csv_upload('itens_2.csv', items[items['numero_nf'] > 'NF000030'])])
+    assert len(first.cabecalho_df) == 40
+    assert second.dataset is shared and len(second.cabecalho_df) == 30
+    assert second.cabecalho_stats.rows == 30
+    assert second.cabecalho_stats.get('valor_total').sum == pytest.approx(total)
+    assert "30" in second.get_basic_stats()
+
+
+def test_stale_statistics_of_a_published_dataset_are_rebuilt(make_agent):
+    agent = make_agent(num_nfs=35)
+    assert agent.dataset.published
+    agent.dataset.cabecalho_stats = FrameStats()  # índice desatualizado em um conjunto somente leitura
+    agent.get_basic_stats()
+    assert agent.cabecalho_stats.rows == len(agent.cabecalho_df)
@@ -0,0 +1,48 @@
+import io
+
+import pandas as pd
+import pytest
+
+from ingest import MemoryLimitExceeded, read_csv_chunked, sniff_date_format
+
+
+def _csv(rows: int) -> str:
+    lines = ["numero_nf,data_emissao,valor_total,fornecedor"]
+    lines += [f"NF{i:05d},{(i % 28) + 1:02d}/03/2024,{i * 1.5},F{i % 7}" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def _frame_bytes(text: str) -> int:
+    df, _, _ = read_csv_chunked(io.StringIO(text), chunksize=10 ** 6, max_memory_mb=None)
+    return int(df.memory_usage(deep=True).sum())
+
+
+def test_chunks_are_joined_with_dates_and_stats():
+    df, stats, formats = read_csv_chunked(io.StringIO(_csv(1000)), chunksize=128, max_memory_mb=None)
+    assert len(df) == 1000
+    assert list(df.index) == list(range(1000))
+    assert formats == {'data_emissao': '%d/%m/%Y'}
+    assert pd.api.types.is_datetime64_any_dtype(df['data_emissao'])
+    assert stats.rows == 1000
+    assert stats.get('valor_total').sum == pytest.approx(df['valor_total'].sum())
+    assert stats.get('fornecedor').distinct == 7
+
+
+def test_limit_counts_the_concat_copy():
+    text = _csv(5000)
+    budget_mb = 1.5 * _frame_bytes(text) / (1024 * 1024)  # cabe uma vez, não duas
+    with pytest.raises(MemoryLimitExceeded):
+        read_csv_chunked(io.StringIO(text), chunksize=500, max_memory_mb=budget_mb)
+
+
+def test_single_chunk_is_not_copied():
+    text = _csv(5000)
+    budget_mb = 1.5 * _frame_bytes(text) / (1024 * 1024)
+    df, stats, _ = read_csv_chunked(io.StringIO(text), chunksize=10 ** 6, max_memory_mb=budget_mb)
+    assert len(df) == stats.rows == 5000
+
+
+def test_sniff_prefers_brazilian_day_first():
+    assert sniff_date_format(pd.Series(["01/02/2024", "15/02/2024"])) == "%d/%m/%Y"
+    assert sniff_date_format(pd.Series(["2024-02-15"])) == "%Y-%m-%d"
+    assert sniff_date_format(pd.Series([None, None])) is None
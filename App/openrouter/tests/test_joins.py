@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compaction import compact_frames
+from joins import CombinedView, detect_join_key, rank_join_keys
+
+
+def _frames(seed: int = 0, nfs: int = 40, start: int = 0):
+    rng = np.random.default_rng(seed)
+    numbers = [f"NF{i:04d}" for i in range(start, start + nfs)]
+    header = pd.DataFrame({
+        'numero_nf': numbers,
+        'fornecedor': rng.choice(['A', 'B', 'C'], nfs),
+        'valor': rng.uniform(1, 100, nfs).round(2),
+        'status': rng.choice(['Pago', 'Pendente'], nfs),
+    })
+    counts = rng.integers(0, 4, nfs)  # algumas NFs sem itens
+    items = pd.DataFrame({
+        'numero_nf': np.repeat(numbers, counts),
+        'item_numero': np.concatenate([np.arange(1, count + 1) for count in counts]).astype(np.int64),
+        'quantidade': rng.integers(1, 9, int(counts.sum())).astype(np.int64),
+        'status': rng.choice(['ok', 'devolvido'], int(counts.sum())),
+    })
+    # Itens fora da ordem do cabeçalho e um item órfão
+    items = items.sample(frac=1, random_state=seed).reset_index(drop=True)
+    orphan = pd.DataFrame({'numero_nf': ['NF9999'], 'item_numero': [1], 'quantidade': [1], 'status': ['ok']})
+    return header, pd.concat([items, orphan], ignore_index=True)
+
+
+def _assert_matches_merge(view: CombinedView, header: pd.DataFrame, items: pd.DataFrame):
+    expected = pd.merge(header, items, on='numero_nf', how='left')
+    assert list(view.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(view.select(), expected, check_dtype=False, check_categorical=False)
+
+
+def test_detect_join_key_prefers_unique_header_key():
+    header, items = _frames()
+    key = detect_join_key(header, items)
+    assert key.column == 'numero_nf' and key.valid
+    assert [candidate.column for candidate in rank_join_keys(header, items)] == ['numero_nf', 'status']
+    assert detect_join_key(header[['fornecedor']], items.assign(fornecedor='A')) is None
+
+
+def test_view_matches_left_merge_with_suffixes_and_missing_items():
+    header, items = _frames()
+    view = CombinedView(header, items, 'numero_nf')
+    _assert_matches_merge(view, header, items)
+    assert {'status_x', 'status_y'} <= set(view.columns)
+    assert view.dtypes['quantidade'] == np.float64  # há NF sem itens, como no merge
+
+
+def test_view_over_compacted_frames_matches_merge():
+    header, items = _frames(seed=3)
+    compacted, _ = compact_frames({'cabecalho': header, 'itens': items})
+    view = CombinedView(compacted['cabecalho'], compacted['itens'], 'numero_nf')
+    _assert_matches_merge(view, header, items)
+
+
+def test_take_head_lookup_and_getitem():
+    header, items = _frames()
+    view = CombinedView(header, items, 'numero_nf')
+    expected = pd.merge(header, items, on='numero_nf', how='left')
+    pd.testing.assert_frame_equal(view.head(3), expected.head(3), check_dtype=False)
+    pd.testing.assert_series_equal(view['valor'], expected['valor'], check_dtype=False)
+    number = items['numero_nf'].iloc[0]
+    found = view.lookup(number)
+    assert (found['numero_nf'] == number).all()
+    assert len(found) == (items['numero_nf'] == number).sum()
+    assert view.lookup('inexistente').empty
+    with pytest.raises(KeyError):
+        view['inexistente']
+
+
+@pytest.mark.parametrize('times', [1, 10])
+def test_extend_matches_merge_over_the_concatenated_tables(times):
+    header, items = _frames(seed=1)
+    view = CombinedView(header, items, 'numero_nf')
+    for round_ in range(times):
+        new_header, new_items = _frames(seed=10 + round_, nfs=5, start=1000 + 5 * round_)
+        # Itens novos também para NFs antigas: entram depois dos itens já existentes da mesma NF
+        old_nf = pd.DataFrame({'numero_nf': [header['numero_nf'].iloc[0]], 'item_numero': [99], 'quantidade': [7], 'status': ['ok']})
+        header = pd.concat([header, new_header], ignore_index=True)
+        items = pd.concat([items, new_items, old_nf], ignore_index=True)
+        view = view.extend(header, items)
+    _assert_matches_merge(view, header, items)
+    assert len(view.header_segments) <= 8
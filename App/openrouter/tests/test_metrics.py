@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from metrics import Tracer, current_rss_mb, peak_rss_mb, traced
+
+needs_rss = pytest.mark.skipif(current_rss_mb() is None, reason="memória atual indisponível nesta plataforma")
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    return Tracer(log_path=str(tmp_path / "metricas.jsonl"), prometheus_path=str(tmp_path / "metricas.prom"), enabled=True)
+
+
+def _allocate(mb: int) -> bytearray:
+    block = bytearray(mb * 1024 * 1024)
+    block[::4096] = b"\x01" * len(block[::4096])  # toca cada página para que ela conte como residente
+    return block
+
+
+@needs_rss
+def test_span_measures_current_memory_not_the_lifetime_peak(tracer):
+    block = _allocate(200)
+    del block
+    # O pico do processo já inclui os 200 MB; a etapa seguinte não deve herdá-los
+    with tracer.span('pequena') as small:
+        pass
+    assert small.rss_delta_mb == pytest.approx(0, abs=20)
+    assert small.lifetime_peak_mb >= small.rss_mb
+
+    with tracer.span('grande') as big:
+        block = _allocate(120)
+    assert big.rss_delta_mb > 100
+    del block
+
+
+def test_nested_spans_share_the_trace_and_export_on_root(tracer):
+    with tracer.span('consulta', modo='contexto') as root:
+        with tracer.span('prompt') as child:
+            pass
+        tracer.record('modelo', 0.25, usage={'prompt_tokens': 10, 'completion_tokens': 5})
+    assert child.trace == root.trace and root.root and not child.root
+    assert [span.name for span in tracer.last_trace('consulta')] == ['prompt', 'modelo', 'consulta']
+
+    lines = [json.loads(line) for line in open(tracer.log_path, encoding='utf-8')]
+    assert [line['name'] for line in lines] == ['prompt', 'modelo', 'consulta']
+    assert {'rss_mb', 'rss_delta_mb', 'lifetime_peak_mb'} <= set(lines[-1])
+    assert tracer.tokens == {'prompt_tokens': 10, 'completion_tokens': 5}
+
+
+def test_errors_are_recorded_on_the_span(tracer):
+    with pytest.raises(KeyError):
+        with tracer.span('carga') as span:
+            raise KeyError('x')
+    assert span.attrs['erro'] == 'KeyError'
+
+
+def test_record_trace_groups_stages(tracer):
+    span = tracer.record_trace('consulta', 1.0, {'prompt': 0.1, 'modelo': 0.8}, status='ok')
+    assert [item.name for item in tracer.last_trace()] == ['prompt', 'modelo', 'consulta']
+    assert all(item.trace == span.trace for item in tracer.last_trace())
+    assert tracer.requests == {'ok': 1}
+
+
+def test_prometheus_text_has_stage_totals_and_memory(tracer):
+    tracer.record('juncao', 0.5)
+    tracer.record('juncao', 1.5)
+    text = open(tracer.prometheus_path, encoding='utf-8').read()
+    assert 'analisador_nf_stage_seconds_sum{stage="juncao"} 2.000000' in text
+    assert 'analisador_nf_stage_seconds_count{stage="juncao"} 2' in text
+    assert 'analisador_nf_stage_seconds_max{stage="juncao"} 1.500000' in text
+    assert 'desde o início do processo' in text
+    if current_rss_mb() is not None:
+        assert 'analisador_nf_rss_bytes ' in text
+
+
+def test_lifetime_peak_never_decreases():
+    before = peak_rss_mb()
+    assert peak_rss_mb() >= before
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    tracer = Tracer(log_path=str(tmp_path / "x.jsonl"), prometheus_path=None, enabled=False)
+    with tracer.span('consulta'):
+        pass
+    assert tracer.stages == {} and not (tmp_path / "x.jsonl").exists()
+
+
+def test_traced_decorator_uses_the_object_tracer(tracer):
+    class Loader:
+        def __init__(self):
+            self.tracer = tracer
+
+        @traced('carga')
+        def load(self):
+            return 42
+
+    assert Loader().load() == 42
+    assert tracer.stages['carga'].count == 1
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from openrouter_client import OpenRouterAPIError, OpenRouterClient, TokenBucket, parse_retry_after
+
+PAYLOAD = {"model": "m", "messages": [{"role": "user", "content": "oi"}]}
+
+
+def _client(url, **options):
+    options = {"rate_limit": None, "backoff_base": 0.01, **options}
+    return OpenRouterClient("chave", base_url=url, **options)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after("amanhã") is None
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=20, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    started = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0
+    assert time.monotonic() - started >= 0.04
+
+
+def test_chat_retries_retryable_statuses(mock_server):
+    server, url = mock_server(fail_first=2, fail_status=503, retry_after=0.01)
+    client = _client(url)
+    body = client.chat(PAYLOAD)
+    assert body["choices"][0]["message"]["content"] == "Resposta simulada."
+    assert client.retries == 2
+    assert server.RequestHandlerClass.config.requests == 3
+
+
+def test_chat_gives_up_after_max_retries(mock_server):
+    _, url = mock_server(fail_first=10, fail_status=429, retry_after=0.01)
+    client = _client(url, max_retries=1)
+    with pytest.raises(OpenRouterAPIError) as error:
+        client.chat(PAYLOAD)
+    assert error.value.status_code == 429
+    assert client.retries == 1
+
+
+def test_non_retryable_status_fails_at_once(mock_server):
+    server, url = mock_server(fail_first=1, fail_status=401)
+    client = _client(url)
+    with pytest.raises(OpenRouterAPIError) as error:
+        client.chat(PAYLOAD)
+    assert error.value.status_code == 401
+    assert server.RequestHandlerClass.config.requests == 1
+
+
+def test_read_timeout_is_not_retried(mock_server):
+    # O provedor pode já ter recebido (e cobrado) a requisição: repetir duplicaria o trabalho
+    server, url = mock_server(delay=0.5)
+    client = _client(url, timeout=0.1)
+    with pytest.raises(requests.ReadTimeout):
+        client.chat(PAYLOAD)
+    assert client.retries == 0
+    assert server.RequestHandlerClass.config.requests == 1
+
+
+def test_connection_errors_are_retried():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Porta sem servidor: a conexão é recusada antes de qualquer byte chegar ao provedor
+    client = _client(f"http://127.0.0.1:{port}/api/v1/chat/completions", max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.chat(PAYLOAD)
+    assert client.retries == 2
+
+
+def test_backoff_honours_retry_after_and_caps_jitter():
+    client = OpenRouterClient("chave", backoff_base=1.0, backoff_max=4.0)
+    assert client._backoff(0, 2.0) == 2.0
+    assert client._backoff(0, 100.0) == 12.0
+    assert all(0 <= client._backoff(10, None) <= 4.0 for _ in range(50))
+
+
+def test_submit_and_achat_run_concurrently(mock_server):
+    _, url = mock_server(delay=0.2)
+    client = _client(url, max_workers=4)
+    started = time.monotonic()
+    futures = [client.submit(PAYLOAD) for _ in range(4)]
+    assert all(future.result()["choices"] for future in futures)
+
+    async def gather():
+        return await asyncio.gather(*(client.achat(PAYLOAD) for _ in range(4)))
+
+    assert len(asyncio.run(gather())) == 4
+    assert time.monotonic() - started < 1.2  # 8 chamadas de 0,2 s em paralelo, não em série
+    client.close()
@@ -0,0 +1,69 @@
+import io
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from parse_cache import ParseCache, hash_upload
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'numero_nf': ['NF1', 'NF2', 'NF3'],
+        'data_emissao': pd.to_datetime(['2024-01-01', '2024-01-02', None]),
+        'valor_total': [10.0, 20.5, None],
+    })
+
+
+def test_roundtrip_keeps_data_and_metadata(tmp_path, frame):
+    cache = ParseCache(str(tmp_path), enabled=True)
+    assert cache.get('abc') is None
+    assert cache.put('abc', frame, {'formatos': {'data_emissao': '%Y-%m-%d'}})
+
+    df, metadata = cache.get('abc')
+    pd.testing.assert_frame_equal(df, frame)
+    assert metadata == {'formatos': {'data_emissao': '%Y-%m-%d'}}
+
+
+def test_hash_depends_on_content_and_options_and_keeps_position():
+    upload = io.BytesIO(b"a,b\n1,2\n")
+    upload.seek(3)
+    key = hash_upload(upload, {'sep': ','})
+    assert upload.tell() == 3
+    assert key == hash_upload(io.BytesIO(b"a,b\n1,2\n"), {'sep': ','})
+    assert key != hash_upload(io.BytesIO(b"a,b\n1,3\n"), {'sep': ','})
+    assert key != hash_upload(io.BytesIO(b"a,b\n1,2\n"), {'sep': ';'})
+
+
+def test_evicts_least_recently_used(tmp_path, frame):
+    cache = ParseCache(str(tmp_path), enabled=True)
+    cache.put('antiga', frame, {})
+    cache.put('nova', frame, {})
+    entry_size = max(size for _, size, _ in cache.entries())
+    old = time.time() - 100
+    for path in cache._paths('antiga'):
+        os.utime(path, (old, old))
+
+    cache.max_bytes = entry_size * 1.5
+    assert cache.evict() == 1
+    assert [key for key, _, _ in cache.entries()] == ['nova']
+
+
+def test_corrupt_entry_is_dropped(tmp_path, frame):
+    cache = ParseCache(str(tmp_path), enabled=True)
+    cache.put('abc', frame, {})
+    data_path, _ = cache._paths('abc')
+    with open(data_path, 'wb') as data:
+        data.write(b"lixo")
+    assert cache.get('abc') is None
+    assert cache.entries() == []
+
+
+def test_disabled_cache_is_a_no_op(tmp_path, frame):
+    cache = ParseCache(str(tmp_path), enabled=False)
+    assert not cache.put('abc', frame, {})
+    assert cache.get('abc') is None
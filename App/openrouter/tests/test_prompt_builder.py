@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import prompt_builder
+from prompt_builder import (
+    PromptBuilder, PromptSection, context_sections, count_tokens, rank_columns, stratified_sample,
+)
+from stats_index import FrameStats
+
+TEMPLATE = "Instruções fixas.\n{estrutura}\n{amostra}\nPergunta: {question}"
+
+
+@pytest.fixture(autouse=True)
+def _estimated_tokens(monkeypatch):
+    # Contagem determinística, com ou sem tiktoken instalado
+    monkeypatch.setattr(prompt_builder, "_encoding_for", lambda model: None)
+
+
+def test_count_tokens_estimate():
+    assert count_tokens("", "m") == 0
+    assert count_tokens("a" * 35, "m") == 10
+
+
+def test_count_tokens_estimates_when_encoding_cannot_load(monkeypatch):
+    class OfflineTiktoken:
+        calls = 0
+
+        @classmethod
+        def encoding_for_model(cls, name):
+            cls.calls += 1
+            raise OSError("sem rede para baixar o BPE")
+
+    monkeypatch.undo()
+    monkeypatch.setattr(prompt_builder, "_tiktoken", lambda: OfflineTiktoken)
+    prompt_builder._encoding_for.cache_clear()
+    try:
+        assert count_tokens("a" * 35, "openai/gpt-4o") == 10
+        assert count_tokens("a" * 7, "openai/gpt-4o") == 2
+        assert OfflineTiktoken.calls == 1  # a falha fica em cache: não tenta baixar a cada prompt
+    finally:
+        prompt_builder._encoding_for.cache_clear()
+
+
+def test_rank_columns_puts_question_terms_first():
+    columns = ['numero_nf', 'data_emissao', 'valor_total', 'uf_emitente']
+    assert rank_columns("Qual o valor médio por UF?", columns)[:1] == ['valor_total']
+    assert rank_columns("sem relação", columns) == columns
+
+
+def test_everything_fits_in_a_large_budget():
+    sections = {'estrutura': PromptSection('estrutura', ['- a', '- b']), 'amostra': PromptSection('amostra', ['x'])}
+    built = PromptBuilder('m', budget=10_000).build(TEMPLATE, sections, question="q")
+    assert built.omitted == {}
+    assert "- a\n- b" in built.text
+    assert built.tokens <= built.budget
+
+
+def test_compaction_respects_budget_minimum_and_round_robin():
+    lines = [f"- tabela.coluna_{i:03d} (float64)" for i in range(200)]
+    sections = {
+        'estrutura': PromptSection('estrutura', lines, min_lines=2),
+        'amostra': PromptSection('amostra', lines),
+    }
+    builder = PromptBuilder('m', budget=300)
+    built = builder.build(TEMPLATE, sections, question="Qual o total?")
+    assert built.tokens <= 300
+    kept = {key: len(sections[key].lines) - built.omitted[section.title] for key, section in sections.items()}
+    assert kept['estrutura'] >= 2
+    assert abs(kept['estrutura'] - kept['amostra']) <= 1  # nenhuma seção toma o orçamento inteiro
+    assert f"(+{built.omitted['estrutura']} linhas omitidas)" in built.text
+    assert "Pergunta: Qual o total?" in built.text
+
+
+def test_fixed_text_is_kept_even_over_budget():
+    sections = {'estrutura': PromptSection('estrutura', ['- a'], min_lines=1), 'amostra': PromptSection('amostra', [])}
+    built = PromptBuilder('m', budget=1).build(TEMPLATE, sections, question="pergunta longa " * 10)
+    assert "pergunta longa" in built.text and "- a" in built.text
+    assert built.tokens > built.budget
+
+
+def test_stratified_sample_is_deterministic_and_covers_categories():
+    df = pd.DataFrame({'uf': ['SP'] * 90 + ['RJ'] * 9 + ['AC'], 'valor': np.arange(100.0)})
+    sample = stratified_sample(df, 5)
+    assert len(sample) == 5
+    assert set(sample['uf']) == {'SP', 'RJ', 'AC'}
+    pd.testing.assert_frame_equal(sample, stratified_sample(df, 5))
+
+
+def test_context_sections_rank_relevant_columns_first():
+    df = pd.DataFrame({'numero_nf': ['NF1', 'NF2'], 'valor_total': [1.0, 2.0], 'uf': ['SP', 'RJ']})
+    sections = context_sections("Qual o valor total?", {'cabecalho': (df, FrameStats.from_frame(df))})
+    assert sections['estrutura'].lines[0].startswith("- cabecalho.valor_total")
+    assert sections['estatisticas'].lines[0].startswith("- cabecalho.valor_total")
+    assert sections['amostra'].lines[0] == "TABELA cabecalho (2 registros):"
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from joins import CombinedView
+from query_plan import QueryPlanError, execute_plan, parse_plan, validate_plan
+
+
+@pytest.fixture
+def tables():
+    header = pd.DataFrame({
+        'numero_nf': ['NF1', 'NF2', 'NF3', 'NF4'],
+        'data_emissao': pd.to_datetime(['2024-01-05', '2024-01-20', '2024-02-03', '2024-03-15']),
+        'fornecedor': pd.Categorical(['A', 'B', 'A', 'C']),
+        'valor_total': [100.0, 250.0, 80.0, 40.0],
+    })
+    items = pd.DataFrame({
+        'numero_nf': ['NF1', 'NF1', 'NF2', 'NF3', 'NF3', 'NF3'],
+        'produto': ['p1', 'p2', 'p1', 'p3', 'p1', 'p2'],
+        'quantidade': [1, 2, 3, 4, 5, 6],
+    })
+    return {
+        'cabecalho': header,
+        'itens': items,
+        'combinado': CombinedView(header, items, 'numero_nf'),
+    }
+
+
+def _run(plan, tables):
+    return execute_plan(validate_plan(plan, tables), tables)
+
+
+def test_parse_plan_accepts_code_fences():
+    assert parse_plan('```json\n{"tabela": "itens"}\n```') == {'tabela': 'itens'}
+    with pytest.raises(QueryPlanError):
+        parse_plan('sem json aqui')
+
+
+def test_validate_rejects_unknown_table_column_and_operator(tables):
+    with pytest.raises(QueryPlanError):
+        validate_plan({'tabela': 'nada'}, tables)
+    with pytest.raises(QueryPlanError):
+        validate_plan({'tabela': 'itens', 'colunas': ['inexistente']}, tables)
+    with pytest.raises(QueryPlanError):
+        validate_plan({'tabela': 'itens', 'filtros': [{'coluna': 'produto', 'op': 'like', 'valor': 'p'}]}, tables)
+
+
+@pytest.mark.parametrize('func', ['sum', 'mean', 'median', 'std', 'min', 'max'])
+def test_validate_rejects_numeric_aggregation_on_text(tables, func):
+    plan = {'tabela': 'cabecalho', 'agregacoes': [{'coluna': 'fornecedor', 'funcao': func}]}
+    with pytest.raises(QueryPlanError):
+        validate_plan(plan, tables)
+
+
+def test_validate_accepts_count_on_text_and_mean_on_dates(tables):
+    plan = validate_plan({'tabela': 'cabecalho', 'agregacoes': [
+        {'coluna': 'fornecedor', 'funcao': 'nunique'},
+        {'coluna': 'data_emissao', 'funcao': 'max'},
+    ]}, tables)
+    assert [agg['nome'] for agg in plan['agregacoes']] == ['nunique_fornecedor', 'max_data_emissao']
+
+
+@pytest.mark.parametrize('spec', [
+    {'coluna': 'fornecedor', 'op': '>', 'valor': 'A'},
+    {'coluna': 'valor_total', 'op': '>', 'valor': 'muito'},
+    {'coluna': 'valor_total', 'op': '==', 'valor': 'cem'},
+    {'coluna': 'data_emissao', 'op': 'between', 'valor': ['ontem', 'hoje']},
+])
+def test_validate_rejects_filters_incompatible_with_the_column(tables, spec):
+    with pytest.raises(QueryPlanError):
+        validate_plan({'tabela': 'cabecalho', 'filtros': [spec]}, tables)
+
+
+def test_execution_errors_become_query_plan_errors(tables):
+    plan = validate_plan({'tabela': 'itens', 'agregacoes': [{'coluna': 'quantidade', 'funcao': 'mean'}]}, tables)
+    tables = dict(tables, itens=tables['itens'].assign(quantidade=['x'] * 6))
+    with pytest.raises(QueryPlanError):
+        execute_plan(plan, tables)
+
+
+def test_group_by_month_with_filter(tables):
+    result = _run({
+        'tabela': 'cabecalho',
+        'filtros': [{'coluna': 'data_emissao', 'op': '>=', 'valor': '01/01/2024'}],
+        'agrupar_por': [{'coluna': 'data_emissao', 'periodo': 'M'}],
+        'agregacoes': [{'coluna': 'valor_total', 'funcao': 'sum', 'nome': 'total'}],
+        'ordenar_por': [{'coluna': 'total', 'direcao': 'desc'}],
+    }, tables)
+    assert result.to_dict('records') == [
+        {'data_emissao': '2024-01', 'total': 350.0},
+        {'data_emissao': '2024-02', 'total': 80.0},
+        {'data_emissao': '2024-03', 'total': 40.0},
+    ]
+
+
+def test_count_star_on_view_without_columns(tables):
+    result = _run({'tabela': 'combinado', 'agregacoes': [{'coluna': '*', 'funcao': 'count', 'nome': 'n'}]}, tables)
+    assert result['n'].tolist() == [7]  # 6 itens + NF4 sem itens
+
+
+def test_view_rows_match_merge(tables):
+    merged = pd.merge(tables['cabecalho'], tables['itens'], on='numero_nf', how='left')
+    result = _run({
+        'tabela': 'combinado',
+        'filtros': [{'coluna': 'produto', 'op': '==', 'valor': 'p1'}],
+        'ordenar_por': [{'coluna': 'quantidade', 'direcao': 'desc'}],
+    }, tables)
+    expected = merged[merged['produto'] == 'p1'].sort_values('quantidade', ascending=False).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_categorical=False)
+
+
+def test_view_without_columns_materializes_only_result_rows(tables, monkeypatch):
+    view = tables['combinado']
+    selected, taken = [], []
+    select, take = view.select, view.take
+    monkeypatch.setattr(view, 'select', lambda columns=None: selected.append(columns) or select(columns))
+    monkeypatch.setattr(view, 'take', lambda rows, columns=None: taken.append(len(rows)) or take(rows, columns))
+
+    result = _run({
+        'tabela': 'combinado',
+        'ordenar_por': [{'coluna': 'valor_total', 'direcao': 'desc'}],
+        'limite': 2,
+    }, tables)
+    assert selected == [['valor_total']]
+    assert taken == [2]
+    assert list(result.columns) == list(view.columns)
+    assert result['numero_nf'].tolist() == ['NF2', 'NF1']
+    assert np.isnan(result['quantidade']).sum() == 0
@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+from response_cache import ResponseCache, normalize_question
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(db_path=str(tmp_path / "respostas.sqlite3"), ttl=60, max_memory_entries=2, enabled=True)
+
+
+def test_normalize_question_ignores_accents_case_spaces_and_punctuation():
+    assert normalize_question("  Qual o  VALOR médio? ") == normalize_question("qual o valor medio")
+
+
+def test_key_depends_on_model_data_and_mode():
+    key = ResponseCache.make_key('m', 'fp', 'Qual o total?', 'plano')
+    assert key == ResponseCache.make_key('m', 'fp', 'qual o total', 'plano')
+    assert key != ResponseCache.make_key('outro', 'fp', 'Qual o total?', 'plano')
+    assert key != ResponseCache.make_key('m', 'fp2', 'Qual o total?', 'plano')
+    assert key != ResponseCache.make_key('m', 'fp', 'Qual o total?', 'contexto')
+
+
+def test_hit_and_miss_are_counted_with_savings(cache):
+    assert cache.get('k') is None
+    cache.put('k', 'resposta', latency=2.5, tokens=100)
+    entry = cache.get('k')
+    assert entry.answer == 'resposta'
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cache.stats.saved_seconds == pytest.approx(2.5)
+    assert cache.stats.saved_tokens == 100
+    assert cache.stats.hit_rate == pytest.approx(0.5)
+
+
+def test_alternative_keys_count_as_one_lookup(cache):
+    assert cache.get('a', 'b') is None
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+    cache.put('b', 'da segunda chave', latency=1.0)
+    assert cache.get('a', 'b').answer == 'da segunda chave'
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_peek_does_not_touch_stats(cache):
+    assert cache.peek('k') is None
+    cache.put('k', 'resposta', latency=1.0)
+    assert cache.peek('k').answer == 'resposta'
+    assert (cache.stats.hits, cache.stats.misses) == (0, 0)
+
+
+def test_entries_survive_in_sqlite_across_instances(cache):
+    cache.put('k', 'persistida', latency=1.0)
+    other = ResponseCache(db_path=cache.db_path, ttl=60, enabled=True)
+    assert other.get('k').answer == 'persistida'
+
+
+def test_memory_layer_is_lru_bounded_but_sqlite_keeps_everything(cache):
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key.upper(), latency=0.1)
+    assert list(cache._memory) == ['b', 'c']
+    assert cache.get('a').answer == 'A'  # volta do SQLite e entra de novo na memória
+    assert list(cache._memory) == ['c', 'a']
+
+
+def test_expired_entries_are_misses(cache, monkeypatch):
+    cache.put('k', 'velha', latency=1.0)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert cache.get('k') is None
+    assert 'k' not in cache._memory
+    assert ResponseCache(db_path=cache.db_path, ttl=60, enabled=True).get('k') is None
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    path = str(tmp_path / "nada.sqlite3")
+    cache = ResponseCache(db_path=path, enabled=False)
+    cache.put('k', 'x', latency=1.0)
+    assert cache.get('k') is None
+    assert not os.path.exists(path)
+
+
+def test_clear_empties_both_layers(cache):
+    cache.put('k', 'x', latency=1.0)
+    cache.clear()
+    assert cache.get('k') is None
+    assert ResponseCache(db_path=cache.db_path, ttl=60, enabled=True).get('k') is None
@@ -0,0 +1,215 @@
+import threading
+import time
+
+import pytest
+
+from openrouter_client import OpenRouterAPIError, OpenRouterClient
+from response_cache import ResponseCache
+from routing import COMPLEX, HEDGE_MIN_DELAY, SIMPLE, LatencyWindow, ModelRouter, RouteDecision, classify_question
+
+ANSWER = "resposta da duplicata"
+
+
+def _client(url):
+    return OpenRouterClient("chave", base_url=url, rate_limit=None)
+
+
+def _payload(model="openai/gpt-4o"):
+    return {"model": model, "messages": [{"role": "user", "content": "Quantas notas?"}]}
+
+
+def _decision(model="openai/gpt-4o"):
+    return RouteDecision("Quantas notas?", model, model, SIMPLE, hedge=True)
+
+
+@pytest.mark.parametrize("question", [
+    "Quantas notas estão pendentes?",
+    "Qual a média do valor total?",
+    "Top 5 fornecedores por valor",
+])
+def test_classify_question_simple_lookups(question):
+    assert classify_question(question) == (SIMPLE, ["consulta direta"])
+
+
+def test_classify_question_analysis_terms_ignore_accents():
+    complexity, reasons = classify_question("Qual a tendência e o impacto das devoluções?")
+    assert complexity == COMPLEX
+    assert reasons == ["pede análise (tendencia, impacto)"]
+
+
+def test_classify_question_reasons_accumulate():
+    complexity, reasons = classify_question("Fale das notas? E dos itens?", max_simple_words=3)
+    assert complexity == COMPLEX
+    assert reasons == ["6 palavras", "várias perguntas", "não é consulta direta"]
+
+
+def test_fast_model_for_prefers_same_provider():
+    router = ModelRouter(fast_models=("anthropic/claude-3-haiku", "openai/gpt-4o-mini"))
+    assert router.fast_model_for("openai/gpt-4o") == "openai/gpt-4o-mini"
+    assert router.fast_model_for("anthropic/claude-3-opus") == "anthropic/claude-3-haiku"
+    assert router.fast_model_for("google/gemini-pro") == "anthropic/claude-3-haiku"
+    assert router.fast_model_for("openai/gpt-4o-mini") == "openai/gpt-4o-mini"
+    assert ModelRouter(fast_models=()).fast_model_for("openai/gpt-4o") == "openai/gpt-4o"
+
+
+def test_route_sends_only_simple_questions_to_fast_model():
+    router = ModelRouter(fast_models=("openai/gpt-4o-mini",))
+    simple = router.route("Quantas notas?", "openai/gpt-4o")
+    complex_ = router.route("Explique a sazonalidade das vendas", "openai/gpt-4o")
+    unrouted = router.route("Quantas notas?", "openai/gpt-4o", routing=False)
+    assert simple.model == "openai/gpt-4o-mini" and simple.routed
+    assert complex_.model == unrouted.model == "openai/gpt-4o"
+    simple.escalate("erro 400")
+    assert simple.model == "openai/gpt-4o" and not simple.routed
+    assert simple.escalations == ["openai/gpt-4o-mini → openai/gpt-4o: erro 400"]
+    stats = router.stats()
+    assert stats['perguntas_simples'] == 2 and stats['perguntas_complexas'] == 1
+    assert stats['modelos'] == {"openai/gpt-4o-mini": 1, "openai/gpt-4o": 2}
+
+
+def test_hedge_delay_uses_observed_quantile():
+    router = ModelRouter(default_hedge_delay=2.0, hedge_quantile=0.9)
+    assert router.hedge_delay("m") == 2.0
+    for seconds in range(1, 11):
+        router.latencies.record("m", seconds / 100)
+    assert router.hedge_delay("m") == pytest.approx(0.10)
+    for _ in range(10):
+        router.latencies.record("rapido", 0.001)
+    assert router.hedge_delay("rapido") == HEDGE_MIN_DELAY
+
+
+def test_latency_window_keeps_only_recent_samples():
+    window = LatencyWindow(size=3)
+    for seconds in (9.0, 1.0, 2.0, 3.0):
+        window.record("m", seconds)
+    assert window.counts() == {"m": 3}
+    assert window.quantile("m", 1.0, min_samples=1) == 3.0
+    assert window.quantile("m", 0.0, min_samples=1) == 1.0
+    assert window.quantile("m", 0.5, min_samples=4) is None
+
+
+def test_stream_without_hedge_when_first_chunk_is_fast(mock_server):
+    server, url = mock_server(answer=ANSWER)
+    router = ModelRouter(default_hedge_delay=1.0)
+    decision = _decision()
+    events = list(router.stream(_client(url), _payload(), decision))
+    text = "".join((event["choices"][0]["delta"].get("content") or "") for event in events)
+    assert text == ANSWER
+    assert decision.hedges == 0 and server.RequestHandlerClass.config.requests == 1
+
+
+def test_hedge_wins_over_slow_original_and_cancels_it(mock_server):
+    # A cada duas requisições uma é lenta: a primeira (aquecimento) é rápida, a original é lenta e a duplicata rápida
+    server, url = mock_server(answer=ANSWER, slow_every=2, slow_delay=1.0)
+    client = _client(url)
+    client.chat(_payload())
+    router = ModelRouter(default_hedge_delay=0.1)
+    decision = _decision()
+    started = time.perf_counter()
+    response = router.chat(client, _payload(), decision)
+    assert response["choices"][0]["message"]["content"] == ANSWER
+    assert time.perf_counter() - started < 0.8
+    assert decision.hedges == 1 and decision.hedges_won == 1
+    assert server.RequestHandlerClass.config.requests == 3
+    # A original cancelada fecha a conexão quando o primeiro dado chega, o que mede a economia
+    deadline = time.monotonic() + 3
+    while router.stats()['economias_medidas'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stats = router.stats()
+    assert stats['duplicatas'] == 1 and stats['duplicatas_vencedoras'] == 1
+    assert stats['economias_medidas'] == 1 and 0.3 < stats['economia_s'] < 1.5
+
+
+def test_non_retryable_error_fails_fast_without_hedging(mock_server):
+    server, url = mock_server(fail_first=1, fail_status=401, answer=ANSWER)
+    router = ModelRouter(default_hedge_delay=1.0)
+    decision = _decision()
+    with pytest.raises(OpenRouterAPIError) as error:
+        router.chat(_client(url), _payload(), decision)
+    assert error.value.status_code == 401
+    assert decision.hedges == 0 and server.RequestHandlerClass.config.requests == 1
+
+
+def test_retryable_error_before_first_chunk_hedges_at_once(mock_server):
+    server, url = mock_server(fail_first=1, fail_status=503, answer=ANSWER)
+    client = OpenRouterClient("chave", base_url=url, rate_limit=None, max_retries=0)
+    router = ModelRouter(default_hedge_delay=5.0)
+    decision = _decision()
+    started = time.perf_counter()
+    assert router.chat(client, _payload(), decision)["choices"][0]["message"]["content"] == ANSWER
+    assert time.perf_counter() - started < 2.0
+    assert decision.hedges == 1 and server.RequestHandlerClass.config.requests == 2
+
+
+def test_stream_stops_all_attempts_when_cancelled(mock_server):
+    _, url = mock_server(answer=ANSWER, chunk_delay=0.05)
+    cancel = threading.Event()
+    received = []
+    for event in ModelRouter(default_hedge_delay=1.0).stream(_client(url), _payload(), _decision(), cancel_event=cancel):
+        received.append(event)
+        cancel.set()
+    assert len(received) == 1
+
+
+def test_attempts_pass_their_cancel_event_to_the_client():
+    class Client:
+        timeout = 1.0
+        cancel_events = []
+
+        def stream_chat(self, payload, cancel_event=None, chunk_timeout=None):
+            self.cancel_events.append(cancel_event)
+            yield {"choices": [{"delta": {"content": ANSWER}}]}
+
+    client = Client()
+    assert ModelRouter().chat(client, _payload(), _decision())["choices"][0]["message"]["content"] == ANSWER
+    assert len(client.cancel_events) == 1 and isinstance(client.cancel_events[0], threading.Event)
+
+
+@pytest.fixture
+def routed_agent(make_agent, tmp_path):
+    def make(**options):
+        agent = make_agent(model="openai/gpt-4o", **options)
+        agent.router = ModelRouter(fast_models=("openai/gpt-4o-mini",))
+        agent.routing = True
+        agent.response_cache = ResponseCache(str(tmp_path / "respostas.sqlite3"), enabled=True)
+        return agent
+    return make
+
+
+def test_escalated_answer_is_cached_under_the_answering_model(routed_agent, mock_server):
+    # O modelo rápido falha (400, sem nova tentativa) e a pergunta escalona para o escolhido
+    server, url = mock_server(fail_first=1, fail_status=400, answer=ANSWER)
+    agent = routed_agent(url=url)
+    first = agent.answer_question("Quantas notas estão pendentes?")
+    assert first.ok and first.answer == ANSWER
+    assert first.route.model == "openai/gpt-4o" and first.route.escalations
+    fingerprint = agent.data_fingerprint()
+    mode = agent._cache_mode(False, None)
+    question = "Quantas notas estão pendentes?"
+    assert agent.response_cache.get(agent.response_cache.make_key("openai/gpt-4o", fingerprint, question, mode))
+    assert agent.response_cache.get(agent.response_cache.make_key("openai/gpt-4o-mini", fingerprint, question, mode)) is None
+
+    again = agent.answer_question(question)
+    assert again.from_cache and again.answer == ANSWER
+    assert server.RequestHandlerClass.config.requests == 2
+
+
+def test_routed_lookup_counts_one_miss_and_one_hit(routed_agent):
+    agent = routed_agent()
+    question = "Quantas notas estão canceladas?"
+    first = agent.answer_question(question)
+    assert first.ok and first.route.routed
+    assert (agent.response_cache.stats.hits, agent.response_cache.stats.misses) == (0, 1)
+    assert agent.answer_question(question).from_cache
+    assert (agent.response_cache.stats.hits, agent.response_cache.stats.misses) == (1, 1)
+
+
+def test_streamed_escalation_is_cached_under_the_answering_model(routed_agent, mock_server):
+    server, url = mock_server(fail_first=1, fail_status=400, answer=ANSWER)
+    agent = routed_agent(url=url)
+    question = "Qual o maior valor total?"
+    stream = agent.stream_answer(question)
+    assert "".join(stream) == ANSWER and stream.route.model == "openai/gpt-4o"
+    again = agent.stream_answer(question)
+    assert "".join(again) == ANSWER and again.from_cache
+    assert server.RequestHandlerClass.config.requests == 2
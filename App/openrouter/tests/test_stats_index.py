@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import stats_index
+from stats_index import FrameStats
+
+
+def _frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    valores = rng.normal(500, 120, rows)
+    valores[::17] = np.nan
+    return pd.DataFrame({
+        'valor': valores,
+        'quantidade': rng.integers(1, 20, rows),
+        'data': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'uf': rng.choice(['SP', 'RJ', 'MG', None], rows),
+    })
+
+
+def test_chunked_updates_match_a_single_pass():
+    df = _frame(5000)
+    whole = FrameStats.from_frame(df)
+    merged = FrameStats()
+    for start in range(0, len(df), 700):
+        merged.update(df.iloc[start:start + 700])
+
+    assert merged.rows == whole.rows == len(df)
+    for col in ('valor', 'quantidade'):
+        a, b = merged.get(col), whole.get(col)
+        assert (a.count, a.nulls, a.min, a.max) == (b.count, b.nulls, b.min, b.max)
+        assert a.sum == pytest.approx(b.sum)
+        assert a.mean == pytest.approx(b.mean)
+        assert a.std == pytest.approx(b.std)
+    assert merged.get('valor').std == pytest.approx(df['valor'].std())
+    assert merged.get('valor').nulls == df['valor'].isna().sum()
+    assert (merged.get('data').min, merged.get('data').max) == (df['data'].min(), df['data'].max())
+    assert merged.get('uf').counts.sort_index().to_dict() == df['uf'].value_counts().sort_index().to_dict()
+    assert merged.get('uf').top(1) == [df['uf'].value_counts().idxmax()]
+    assert np.array_equal(merged.get('quantidade').registers, whole.get('quantidade').registers)
+
+
+def test_column_kinds():
+    stats = FrameStats.from_frame(_frame(10).assign(flag=True))
+    assert stats.of_kind('numeric') == ['valor', 'quantidade']
+    assert stats.of_kind('datetime') == ['data']
+    assert stats.of_kind('text') == ['uf', 'flag']
+
+
+def test_distinct_estimate_is_close_for_high_cardinality():
+    values = pd.Series(np.arange(200_000, dtype=np.int64))
+    stats = FrameStats.from_frame(pd.DataFrame({'id': values}))
+    assert not stats.get('id').distinct_is_exact
+    assert stats.get('id').distinct == pytest.approx(200_000, rel=0.05)
+
+
+def test_text_counts_switch_to_top_k_past_the_exact_limit(monkeypatch):
+    monkeypatch.setattr(stats_index, 'EXACT_DISTINCT_LIMIT', 50)
+    monkeypatch.setattr(stats_index, 'TOPK_CAPACITY', 10)
+    frequent = ['A'] * 500 + ['B'] * 300
+    rare = [f"raro{i}" for i in range(100)]
+    stats = FrameStats.from_frame(pd.DataFrame({'c': frequent + rare}))
+    column = stats.get('c')
+    assert not column.exact
+    assert len(column.counts) == 10
+    assert column.top(2) == ['A', 'B']
+    assert column.distinct == pytest.approx(102, rel=0.1)
+
+
+def test_serialization_roundtrip_through_json():
+    stats = FrameStats.from_frame(_frame(300))
+    restored = FrameStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+    assert restored.rows == stats.rows
+    for col, original in stats.columns.items():
+        copy = restored.get(col)
+        assert (copy.kind, copy.count, copy.nulls, copy.min, copy.max) == (
+            original.kind, original.count, original.nulls, original.min, original.max
+        )
+        assert copy.mean == pytest.approx(original.mean)
+        assert np.array_equal(copy.registers, original.registers)
+        assert copy.counts.to_dict() == original.counts.to_dict()
+
+
+def test_reconcile_rebuilds_columns_whose_type_changed():
+    stats = FrameStats.from_frame(pd.DataFrame({'data': ['01/02/2024', '03/02/2024']}))
+    assert stats.get('data').kind == 'text'
+    stats.reconcile(pd.DataFrame({'data': pd.to_datetime(['2024-02-01', '2024-02-03'])}))
+    assert stats.get('data').kind == 'datetime'
+    assert stats.get('data').max == pd.Timestamp('2024-02-03')
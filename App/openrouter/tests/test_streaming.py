@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from openrouter_client import OpenRouterAPIError, OpenRouterClient
+from response_cache import ResponseCache
+
+PAYLOAD = {"model": "m", "messages": [{"role": "user", "content": "oi"}]}
+ANSWER = "um dois três quatro cinco seis"
+
+
+def _client(url):
+    return OpenRouterClient("chave", base_url=url, rate_limit=None)
+
+
+def test_stream_chat_yields_one_event_per_chunk_as_it_arrives(mock_server):
+    _, url = mock_server(answer=ANSWER, chunk_delay=0.05)
+    started = time.monotonic()
+    events, arrivals = [], []
+    for event in _client(url).stream_chat(PAYLOAD):
+        events.append(event)
+        arrivals.append(time.monotonic() - started)
+    deltas = [event["choices"][0]["delta"].get("content", "") for event in events]
+    assert "".join(deltas) == ANSWER
+    assert events[-1]["usage"]["total_tokens"] > 0
+    assert arrivals[0] < arrivals[-1] - 0.2  # o primeiro trecho chega antes do fim da resposta
+
+
+def test_stream_chat_stops_when_cancelled(mock_server):
+    _, url = mock_server(answer=ANSWER, chunk_delay=0.05)
+    cancel = threading.Event()
+    received = []
+    for event in _client(url).stream_chat(PAYLOAD, cancel_event=cancel):
+        received.append(event)
+        cancel.set()
+    assert len(received) == 1
+
+
+def test_stream_chat_raises_api_errors(mock_server):
+    _, url = mock_server(fail_first=1, fail_status=400)
+    with pytest.raises(OpenRouterAPIError):
+        list(_client(url).stream_chat(PAYLOAD))
+
+
+def test_answer_stream_collects_text_usage_and_timings(make_agent):
+    agent = make_agent(answer=ANSWER, chunk_delay=0.01)
+    stream = agent.stream_answer("Qual o valor total?")
+    chunks = list(stream)
+    assert len(chunks) == len(ANSWER.split())
+    assert stream.text == ANSWER
+    assert stream.ok and not stream.cancelled
+    assert 0 < stream.first_token_latency <= stream.latency
+    assert stream.usage["total_tokens"] > 0
+    assert stream.prompt_tokens > 0
+
+
+def test_cancelled_stream_is_not_cached(make_agent):
+    agent = make_agent(answer=ANSWER, chunk_delay=0.02)
+    agent.response_cache = ResponseCache(db_path=":memory:", enabled=True)
+    cancel = threading.Event()
+    stream = agent.stream_answer("Qual o valor total?", cancel_event=cancel)
+    for _ in stream:
+        cancel.set()
+    assert stream.cancelled
+    assert stream.text != ANSWER
+
+    complete = agent.stream_answer("Qual o valor total?")
+    assert "".join(complete) == ANSWER and not complete.from_cache
+    again = agent.stream_answer("Qual o valor total?")
+    assert "".join(again) == ANSWER and again.from_cache
+
+
+def test_stream_reports_api_errors_as_text(make_agent):
+    agent = make_agent(fail_first=100, fail_status=401)
+    stream = agent.stream_answer("Qual o valor total?")
+    text = "".join(stream)
+    assert text.startswith("❌ Erro na API do OpenRouter: 401")
+    assert not stream.ok
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic_data import SyntheticSpec, generate_chunk, generate_frames, nf_number_width, write_dataset
+
+
+def test_nf_numbers_have_one_width_across_chunks():
+    # Primeiro e último bloco de um conjunto de 1,2 milhão de NFs: mesma largura, ordem textual = numérica
+    spec = SyntheticSpec(num_nfs=1_200_000)
+    rng = np.random.default_rng(0)
+    first, _ = generate_chunk(spec, 0, 10, rng)
+    last, _ = generate_chunk(spec, 1_199_990, 1_200_000, rng)
+    numbers = pd.concat([first['numero_nf'], last['numero_nf']])
+    assert first['numero_nf'].iloc[0] == 'NF0000001'
+    assert last['numero_nf'].iloc[-1] == 'NF1200000'
+    assert numbers.str.len().nunique() == 1
+    assert numbers.is_monotonic_increasing
+    assert nf_number_width(999_999) == 6
+
+
+def test_chunked_generation_is_deterministic_and_consistent():
+    spec = SyntheticSpec(num_nfs=230, item_distribution='poisson', mean_items=3, max_items=8, seed=7)
+    header, items = generate_frames(spec, chunk_nfs=100)
+    again_header, again_items = generate_frames(spec, chunk_nfs=100)
+    pd.testing.assert_frame_equal(header, again_header)
+    pd.testing.assert_frame_equal(items, again_items)
+
+    assert len(header) == 230 and header['numero_nf'].is_unique
+    assert set(items['numero_nf']) <= set(header['numero_nf'])
+    per_nf = items.groupby('numero_nf').size()
+    assert per_nf.between(1, 8).all()
+    assert (items.groupby('numero_nf')['item_numero'].max() == per_nf).all()
+    assert (items['valor_total_item'] - (items['quantidade'] * items['valor_unitario']).round(2)).abs().max() < 1e-9
+
+
+def test_end_date_bounds_emission_dates():
+    header, _ = generate_frames(SyntheticSpec(num_nfs=500, start_date='2024-01-01', end_date='2024-03-31'))
+    assert header['data_emissao'].min() == pd.Timestamp('2024-01-01')
+    assert header['data_emissao'].max() <= pd.Timestamp('2024-03-31')
+
+
+def test_supplier_skew_concentrates_notes():
+    header, _ = generate_frames(SyntheticSpec(num_nfs=2000, num_suppliers=50, supplier_skew=1.5))
+    shares = header['fornecedor'].value_counts(normalize=True)
+    assert len(header['fornecedor'].cat.categories) == 50
+    assert shares.iloc[0] > 0.3
+
+
+def test_unknown_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        generate_frames(SyntheticSpec(num_nfs=10, item_distribution='normal'))
+
+
+def test_write_dataset_csv_streams_chunks(tmp_path):
+    spec = SyntheticSpec(num_nfs=120)
+    paths = write_dataset(spec, str(tmp_path), 'csv', chunk_nfs=50)
+    header, items = generate_frames(spec, chunk_nfs=50)
+    written = pd.read_csv(paths[0])
+    assert written['numero_nf'].tolist() == header['numero_nf'].tolist()
+    assert len(pd.read_csv(paths[1])) == len(items)